@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Archival of ended games for PokerBot
+Moves raw transactions of long-ended games into transactions_archive and keeps
+one summarized row per player, game and transaction type in transactions
+"""
+
+import os
+import argparse
+import logging
+from bot import get_db_connection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Games ended longer ago than this are compacted
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+
+
+def find_archivable_games(cursor, horizon_days=ARCHIVE_AFTER_DAYS, limit=100):
+    """Return ids of ended, not yet archived games older than the horizon"""
+    cursor.execute("""
+        SELECT id FROM games
+        WHERE is_active = FALSE
+          AND archived_at IS NULL
+          AND COALESCE(ended_at, date) < CURRENT_TIMESTAMP - make_interval(days => %s)
+        ORDER BY id
+        LIMIT %s
+    """, (horizon_days, limit))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def archive_game(connection, game_id):
+    """Move one game's raw rows to the archive and replace them with per-type sums.
+
+    Runs in a single transaction so reports never see a half-archived game.
+    Returns (raw rows archived, summary rows written).
+    """
+    with connection.cursor() as c:
+        c.execute("SELECT date - INTERVAL '1 day' FROM games WHERE id = %s AND archived_at IS NULL FOR UPDATE",
+                  (game_id,))
+        row = c.fetchone()
+        if not row:
+            connection.rollback()
+            return 0, 0
+        game_start = row[0]
+
+        c.execute("""
+            WITH moved AS (
+                DELETE FROM transactions
+                WHERE game_id = %s AND created_at >= %s
+                RETURNING id, player_id, game_id, amount, type, created_at
+            ), archived AS (
+                INSERT INTO transactions_archive (id, player_id, game_id, amount, type, created_at)
+                SELECT id, player_id, game_id, amount, type, created_at FROM moved
+                RETURNING 1
+            ), summary AS (
+                INSERT INTO transactions (player_id, game_id, amount, type, created_at)
+                SELECT player_id, game_id, SUM(amount), type, MIN(created_at)
+                FROM moved
+                GROUP BY player_id, game_id, type
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM archived), (SELECT COUNT(*) FROM summary)
+        """, (game_id, game_start))
+        archived, summarized = c.fetchone()
+
+        c.execute("UPDATE games SET archived_at = CURRENT_TIMESTAMP WHERE id = %s", (game_id,))
+    connection.commit()
+    return archived, summarized
+
+
+def run_archival(horizon_days=ARCHIVE_AFTER_DAYS, limit=100, dry_run=False, vacuum=False):
+    """Archive up to `limit` eligible games, one short transaction per game"""
+    connection = get_db_connection()
+    try:
+        connection.autocommit = False
+        with connection.cursor() as c:
+            game_ids = find_archivable_games(c, horizon_days, limit)
+        connection.rollback()
+
+        if not game_ids:
+            logger.info(f"No games ended more than {horizon_days} days ago to archive")
+            return
+
+        if dry_run:
+            logger.info(f"Would archive {len(game_ids)} game(s): {game_ids}")
+            return
+
+        total_archived = 0
+        total_summarized = 0
+        for game_id in game_ids:
+            try:
+                archived, summarized = archive_game(connection, game_id)
+            except Exception as e:
+                connection.rollback()
+                logger.error(f"Archiving game #{game_id} failed: {e}")
+                continue
+            total_archived += archived
+            total_summarized += summarized
+            logger.info(f"Game #{game_id}: archived {archived} row(s), kept {summarized} summary row(s)")
+
+        logger.info(f"Archived {total_archived} row(s) from {len(game_ids)} game(s), "
+                    f"{total_archived - total_summarized} fewer hot row(s)")
+
+        if vacuum:
+            # VACUUM cannot run inside a transaction block
+            connection.autocommit = True
+            with connection.cursor() as c:
+                c.execute("VACUUM (ANALYZE) transactions")
+            logger.info("Vacuumed transactions")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive raw transactions of long-ended games")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="archive games ended more than this many days ago")
+    parser.add_argument("--limit", type=int, default=100, help="maximum number of games per run")
+    parser.add_argument("--dry-run", action="store_true", help="only list the games that would be archived")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM ANALYZE transactions afterwards")
+    args = parser.parse_args()
+
+    run_archival(args.days, args.limit, args.dry_run, args.vacuum)
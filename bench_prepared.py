@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Prepared statement benchmark for PokerBot
+Compares planning and round-trip time of the hot query set run as plain SQL
+and as prepared statements, per simulated /rebuy update
+"""
+
+import re
+import sys
+import time
+import logging
+import psycopg2
+import queries
+from bot import _get_connection_params
+
+logging.basicConfig(level=logging.WARNING)
+
+# Statements one /rebuy update runs, with harmless parameters
+REBUY_UPDATE = [
+    ("active_game", (0,)),
+    ("player_by_telegram_id", (0,)),
+    ("game_membership", (0, 0)),
+    ("game_is_active", (0,)),
+    ("insert_transaction", (0, 0, -10.0, 'rebuy')),
+    ("add_total_rebuys", (10.0, 0)),
+    ("setting_value", ('send_notifications',)),
+    ("game_player_telegram_ids", (0,)),
+]
+
+PLANNING_TIME = re.compile(r"Planning Time: ([\d.]+) ms")
+
+
+def planning_ms(cursor, statement, params):
+    """Planning time PostgreSQL reports for `statement` without executing it"""
+    cursor.execute(f"EXPLAIN (SUMMARY ON) {statement}", params)
+    for (line,) in cursor.fetchall():
+        match = PLANNING_TIME.search(line)
+        if match:
+            return float(match.group(1))
+    return 0.0
+
+
+def plain_statement(name):
+    return queries.QUERIES[name]
+
+
+def prepared_statement(name, params):
+    return f"EXECUTE {name}({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {name}"
+
+
+def run(iterations):
+    connection = psycopg2.connect(connection_factory=queries.PreparedConnection, **_get_connection_params())
+    connection.autocommit = True
+    c = connection.cursor()
+    for name, _ in REBUY_UPDATE:
+        queries._prepare(c, name)
+
+    # Warm both paths up so the prepared statements settle on their cached plans
+    for _ in range(10):
+        for name, params in REBUY_UPDATE:
+            planning_ms(c, plain_statement(name), params)
+            planning_ms(c, prepared_statement(name, params), params)
+
+    plain_planning = 0.0
+    prepared_planning = 0.0
+    for _ in range(iterations):
+        for name, params in REBUY_UPDATE:
+            plain_planning += planning_ms(c, plain_statement(name), params)
+            prepared_planning += planning_ms(c, prepared_statement(name, params), params)
+
+    # Round trips of the read-only part of the update
+    reads = [(name, params) for name, params in REBUY_UPDATE if not name.startswith(("insert_", "add_"))]
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for name, params in reads:
+            c.execute(plain_statement(name), params)
+            c.fetchall()
+    plain_wall = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for name, params in reads:
+            queries.execute(c, name, params)
+            c.fetchall()
+    prepared_wall = time.perf_counter() - started
+
+    connection.close()
+
+    per_update_plain = plain_planning / iterations
+    per_update_prepared = prepared_planning / iterations
+    print(f"Statements per update:         {len(REBUY_UPDATE)}")
+    print(f"Iterations:                    {iterations}")
+    print(f"Planning per update, plain:    {per_update_plain:.3f} ms")
+    print(f"Planning per update, prepared: {per_update_prepared:.3f} ms")
+    print(f"Planning saved per update:     {per_update_plain - per_update_prepared:.3f} ms")
+    print(f"Read round trips, plain:       {plain_wall / iterations * 1000:.3f} ms/update")
+    print(f"Read round trips, prepared:    {prepared_wall / iterations * 1000:.3f} ms/update")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
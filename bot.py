@@ -1,11 +1,34 @@
 # bot.py
 import telebot
 import os
+import time
 import random
+import atexit
 import psycopg2
-from datetime import datetime
+import threading
+import tempfile
+import queries
+import export
+import stats
+import settlement
+import charts
+import scoreboard
+import outbox
+import digest
+import telegram_http
+import prefilter
+import ingress
+import profiler
+from psycopg2 import pool as pg_pool
+from contextlib import contextmanager
+from datetime import datetime, date
 from urllib.parse import urlparse
 from dotenv import load_dotenv
+from jobs import ReportJobs, REPORT_WORKERS
+from ledger import GameLedger
+from journal import Journal, CircuitBreaker
+import picker
+import inline
 
 load_dotenv()
 import logging
@@ -16,8 +39,23 @@ logger = logging.getLogger(__name__)
 # Bot setup
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ADMINS = [300526718, ]  # 7282197423
-bot = telebot.TeleBot(TOKEN)
+BOT_THREADS = int(os.getenv("BOT_THREADS", "2"))
+# Update workers, report jobs, the outbox dispatcher and the scoreboard all call the Bot API
+BOT_HTTP_POOL_SIZE = int(os.getenv("BOT_HTTP_POOL_SIZE", str(BOT_THREADS + REPORT_WORKERS + 2)))
+bot_http = telegram_http.install(BOT_HTTP_POOL_SIZE)
+bot = telebot.TeleBot(TOKEN, num_threads=BOT_THREADS, use_class_middlewares=True)
 db_name = os.getenv("PGDATABASE", "railway")  # Fallback to 'railway' if PGDATABASE not set
+REPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("REPORT_STATEMENT_TIMEOUT_MS", "15000"))
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_WAIT_SECONDS = float(os.getenv("DB_POOL_WAIT_SECONDS", "10"))
+# Relative paths are taken from the bot's directory, not from wherever a process was started
+LEDGER_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   os.getenv("LEDGER_JOURNAL_PATH", "ledger.journal"))
+DB_BREAKER_THRESHOLD = int(os.getenv("DB_BREAKER_THRESHOLD", "3"))
+DB_BREAKER_RESET_SECONDS = float(os.getenv("DB_BREAKER_RESET_SECONDS", "10"))
+INLINE_STATEMENT_TIMEOUT_MS = int(os.getenv("INLINE_STATEMENT_TIMEOUT_MS", "1000"))
+report_jobs = ReportJobs(bot)
 
 
 def safe_handler(func):
@@ -60,18 +98,213 @@ def _get_connection_params(database="pokerbot_dev"):
         }
 
 
+class PooledConnection:
+    """Connection borrowed from the pool; close() hands it back instead of closing it."""
+
+    def __init__(self, db_pool, slots, conn):
+        object.__setattr__(self, '_pool', db_pool)
+        object.__setattr__(self, '_slots', slots)
+        object.__setattr__(self, '_conn', conn)
+
+    def __getattr__(self, name):
+        if name in ('_pool', '_slots', '_conn'):
+            raise AttributeError(name)
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._conn.__exit__(exc_type, exc_val, exc_tb)
+
+    def close(self):
+        conn = self._conn
+        if conn is None:
+            return
+        object.__setattr__(self, '_conn', None)
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                conn.rollback()
+                conn.autocommit = True
+            except Exception:
+                broken = True
+        self._pool.putconn(conn, close=broken)
+        self._slots.release()
+
+    def __del__(self):
+        # Handlers that bail out early without close() must not leak pool slots
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+_db_pool = None
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_db_pool_lock = threading.Lock()
+# Stops handlers from waiting on connect timeouts while PostgreSQL is down
+db_breaker = CircuitBreaker(DB_BREAKER_THRESHOLD, DB_BREAKER_RESET_SECONDS)
+# How long getting a pooled connection takes lately; a load signal for ingress control
+db_latency = ingress.LatencyGauge()
+
+
+def _get_db_pool():
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = pg_pool.ThreadedConnectionPool(
+                DB_POOL_MIN, DB_POOL_MAX,
+                connection_factory=queries.PreparedConnection,
+                **_get_connection_params()
+            )
+            logger.info(f"Database pool created ({DB_POOL_MIN}-{DB_POOL_MAX} connections)")
+        return _db_pool
+
+
 def get_db_connection(database="pokerbot_dev"):
-    """Get a database connection with autocommit enabled."""
+    """Get a database connection with autocommit enabled.
+
+    Connections to the bot database come from a shared pool, so the hot
+    statements prepared on them are reused across updates.
+    """
     try:
-        params = _get_connection_params(database)
-        conn = psycopg2.connect(**params)
-        conn.set_session(autocommit=True)
-        return conn
+        if database != "pokerbot_dev":
+            params = _get_connection_params(database)
+            conn = psycopg2.connect(**params)
+            conn.set_session(autocommit=True)
+            return conn
+
+        started = time.monotonic()
+        if not _db_pool_slots.acquire(timeout=DB_POOL_WAIT_SECONDS):
+            raise pg_pool.PoolError("timed out waiting for a free database connection")
+        if not db_breaker.allow():
+            _db_pool_slots.release()
+            raise psycopg2.OperationalError("database circuit is open, not trying to connect")
+        # allow() passed while the circuit is open: this caller is the half-open probe
+        probing = db_breaker.is_open
+        conn = None
+        try:
+            db_pool = _get_db_pool()
+            conn = db_pool.getconn()
+            if conn.closed:
+                db_pool.putconn(conn, close=True)
+                conn = db_pool.getconn()
+            conn.autocommit = True
+            if probing:
+                # A pooled checkout never talks to the server; only a statement proves it is back
+                with conn.cursor() as c:
+                    c.execute("SELECT 1")
+                db_breaker.record_success()
+        except Exception:
+            if conn is not None:
+                db_pool.putconn(conn, close=True)
+            _db_pool_slots.release()
+            db_breaker.record_failure()
+            raise
+        db_latency.observe(time.monotonic() - started)
+        return PooledConnection(db_pool, _db_pool_slots, conn)
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
         raise
 
 
+# Flood control and load shedding before any handler runs; the load signals are the
+# update backlog and how long getting a pooled database connection takes
+ingress_control = ingress.IngressControl(
+    bot, ADMINS, queue_depth=lambda: bot.worker_pool.tasks.qsize() if bot.threaded else 0, db_latency=db_latency)
+bot.setup_middleware(ingress_control)
+
+# Sampling profiler for /profile; hooks into dispatch only while a session runs
+update_profiler = profiler.Profiler(bot)
+
+
+def alert_admins(text):
+    """Message every admin, e.g. when a ledger write had to be parked"""
+    for admin_id in ADMINS:
+        try:
+            bot.send_message(admin_id, text)
+        except Exception as e:
+            logger.error(f"Failed to alert admin {admin_id}: {e}")
+
+
+# Live state of active games; writes are journaled locally and reach PostgreSQL
+# through the ledger's write-behind queue, so they survive a database outage.
+# The journal and the writer thread only start in init_db(), so CLIs importing bot touch neither
+ledger = GameLedger(get_db_connection, breaker=db_breaker, alert=alert_admins,
+                    notified=lambda: outbox_dispatcher.wake())
+atexit.register(ledger.flush)
+
+
+def get_game_window(c, game_id):
+    """Return the earliest created_at a transaction of the game can have.
+
+    transactions is range-partitioned by created_at, so bounding queries by the game
+    start lets PostgreSQL skip every partition older than the game.
+    """
+    queries.execute(c, 'game_window', (game_id,))
+    row = c.fetchone()
+    return row[0] if row else datetime.min
+
+
+@contextmanager
+def report_cursor(timeout_ms=None):
+    """Yield a read-only cursor whose statements are cancelled after `timeout_ms`."""
+    conn = get_db_connection()
+    try:
+        conn.autocommit = False
+        with conn.cursor() as c:
+            # SET LOCAL keeps the timeout scoped to this transaction only
+            c.execute("SET LOCAL statement_timeout = %s", (timeout_ms or REPORT_STATEMENT_TIMEOUT_MS,))
+            yield c
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def is_registered(telegram_id):
+    """Check whether a Telegram user has registered with /start."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    queries.execute(c, 'player_by_telegram_id', (telegram_id,))
+    registered = c.fetchone() is not None
+    conn.close()
+    return registered
+
+
+def is_game_member(c, game_id, player_id):
+    """Membership from the ledger for live games, from the database for ended ones."""
+    game = ledger.get_game(game_id)
+    if game is not None:
+        return player_id in game.players
+    queries.execute(c, 'game_membership', (player_id, game_id))
+    return c.fetchone() is not None
+
+
+# Serializes creating and ending the games of one chat until the transaction ends;
+# sent in the same round trip as the statement it guards
+GAME_LIFECYCLE_LOCK_ID = 7001
+LOCK_GAME_LIFECYCLE = "SELECT pg_advisory_xact_lock(%s, hashtext(%s::text));"
+
+
+def current_game(message):
+    """Live game a command refers to.
+
+    The game of the chat the command was sent in, else the game the sender is
+    seated at, else the only live game if exactly one is running.
+    """
+    game = ledger.active_game(message.chat.id) or ledger.game_of_player(message.from_user.id)
+    if game is None:
+        live = ledger.active_games()
+        if len(live) == 1:
+            game = live[0]
+    return game
+
+
 def init_db():
     """Initialize database and create required tables."""
     try:
@@ -162,6 +395,11 @@ def init_db():
                     VALUES (%s, %s) 
                     ON CONFLICT (setting_name) DO NOTHING
                 ''', ('send_notifications', True))  # Default to True for notifications
+                cursor.execute('''
+                    INSERT INTO settings (setting_name, setting_value) 
+                    VALUES (%s, %s) 
+                    ON CONFLICT (setting_name) DO NOTHING
+                ''', ('live_scoreboard', False))
 
                 # Add total_rebuys column if it doesn't exist
                 cursor.execute('''
@@ -179,6 +417,7 @@ def init_db():
                 ''')
 
                 logger.info("Database initialized successfully")
+        conn.close()
 
         # Run migrations to update schema
         try:
@@ -192,6 +431,9 @@ def init_db():
             logger.error(f"Error running migrations: {e}")
             # Don't raise here, as the basic tables are already created
 
+        ledger.start(Journal(LEDGER_JOURNAL_PATH))
+        ledger.load()
+
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
         raise
@@ -214,14 +456,22 @@ def init_db():
 def show_admin_commands(message):
     admin_commands = """
     Admin commands:
-    /remove_player — Remove a player from the current game
-    /adjust — Adjust buy-in, rebuy, cashout, or clear for a player
+    /remove_player [name] — Remove a player from the current game
+    /adjust [name] — Adjust buy-in, rebuy, cashout, or clear for a player
     /allow_new_game - Any player can create a new game
-    /rename_player - Change player name in DB
+    /rename_player [name] - Change player name in DB
     /notifications_switcher - Toggle notifications for all players
+    /scoreboard_switcher - Toggle the live scoreboard instead of per-action messages
 
     /overall_results — Show overall results across all games
     /avg_profit — Show average profit per game
+    /stats [name] — Show streaks, spread, drawdown, ROI and rivals
+    /chart [name] — Plot cumulative profit over games
+    /export [csv|parquet] [since] [until] - Export the ledger as files
+    /http_stats - Bot API latency and connection reuse per method
+    /ingress_stats - Rate limited and shed updates, current load
+    /ledger_retry [game_id] - Write parked ledger changes again
+    /profile [seconds | Nu | stop] - Sample handler stacks for a flame graph
 
     /DELETE_DB - Delete everything
     """
@@ -256,7 +506,7 @@ def new_game(message):
     c = conn.cursor()
 
     # Check if user is registered
-    c.execute("SELECT id, name FROM players WHERE telegram_id = %s", (user_id,))
+    queries.execute(c, 'player_by_telegram_id', (user_id,))
     player = c.fetchone()
     if not player:
         bot.reply_to(message, "❌ You are not registered. Use /start.")
@@ -265,7 +515,7 @@ def new_game(message):
     creator_name = player[1]
 
     # Check allow_new_game setting
-    c.execute("SELECT setting_value FROM settings WHERE setting_name = %s", ('allow_new_game',))
+    queries.execute(c, 'setting_value', ('allow_new_game',))
     allow_new_game = c.fetchone()
     allow_new_game = allow_new_game[0] if allow_new_game else False
 
@@ -275,11 +525,10 @@ def new_game(message):
         conn.close()
         return
 
-    # Check for active game
-    c.execute("SELECT id FROM games WHERE is_active = TRUE ORDER BY id DESC LIMIT 1")
-    active_game = c.fetchone()
+    # Check for an active game in this chat; other chats may run their own
+    active_game = ledger.active_game(message.chat.id)
     if active_game:
-        bot.reply_to(message, f"❌ Game #{active_game[0]} is already active. End it first with /end_game.")
+        bot.reply_to(message, f"❌ Game #{active_game.game_id} is already active. End it first with /end_game.")
         conn.close()
         return
 
@@ -294,26 +543,55 @@ def new_game(message):
 @safe_handler
 def end_game(message):
     user_id = message.from_user.id
-    conn = get_db_connection()
-    c = conn.cursor()
-    # Get active game ID and creator info
-    c.execute(
-        "SELECT g.id, g.creator_id, p.name FROM games g JOIN players p ON g.creator_id = p.telegram_id WHERE g.is_active = TRUE ORDER BY g.id DESC LIMIT 1")
-    game = c.fetchone()
+    game = current_game(message)
     if not game:
         bot.reply_to(message, "❌ No active game found.")
-        conn.close()
         return
-    game_id, creator_id, creator_name = game
+    game_id, creator_id = game.game_id, game.creator_id
+    conn = get_db_connection()
+    c = conn.cursor()
+    # Get creator info
+    queries.execute(c, 'player_by_telegram_id', (creator_id,))
+    creator = c.fetchone()
+    creator_name = creator[1] if creator else str(creator_id)
     if user_id != creator_id and user_id != 300526718:
         bot.reply_to(message, f"❌ Only the game creator ({creator_name}) can end the game.")
         conn.close()
         return
-    # End game
-    c.execute("UPDATE games SET is_active = FALSE WHERE is_active = TRUE")
+    # Results and settlement are read from the database, so it must have every change
+    if not ledger.saved(game_id):
+        if game_id in ledger.parked_games():
+            bot.reply_to(message, f"❌ Some changes of game #{game_id} could not be saved, the game stays open. "
+                                  f"The admins were alerted; try /end_game again once they are fixed.")
+        else:
+            bot.reply_to(message, f"⏳ Game #{game_id} is still saving its last changes, the game stays open. "
+                                  f"Try /end_game again in a moment.")
+        conn.close()
+        return
+    # End game; of two concurrent /end_game only one gets the row back
+    conn.autocommit = False
+    c.execute(LOCK_GAME_LIFECYCLE + """
+        UPDATE games SET is_active = FALSE, ended_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND is_active = TRUE
+        RETURNING id
+    """, (GAME_LIFECYCLE_LOCK_ID, game.chat_id, game_id))
+    ended = c.fetchone()
     conn.commit()
+    # Only now can the game leave memory; changes that raced the UPDATE are saved here
+    if not ledger.close_game(game_id):
+        logger.warning(f"Game #{game_id} ended with ledger changes not saved yet")
+    if not ended:
+        bot.reply_to(message, f"Game #{game_id} has already ended.")
+        conn.close()
+        return
     bot.reply_to(message, f"Game #{game_id} ended.")
-    notify_game_players(game_id, f"🏁 Game #{game_id} has ended by {creator_name}!", exclude_telegram_id=user_id)
+    live_scoreboard.close(game_id)
+    # Final results with who pays whom, to the chat and to every player
+    results = format_game_results(game_id) or ""
+    if results:
+        send_long(message.chat.id, results)
+    notify_game_players(game_id, f"🏁 Game #{game_id} has ended by {creator_name}!\n\n{results}".rstrip(),
+                        exclude_telegram_id=user_id)
     conn.close()
     logger.info(f"Game #{game_id} ended by {creator_name} (Telegram ID: {user_id})")
 
@@ -324,11 +602,24 @@ def process_game_password(message, creator_name):
         if not (password.isdigit() and len(password) == 4):
             raise ValueError("Password must be 4 digits. /new_game")
         conn = get_db_connection()
+        conn.autocommit = False
         c = conn.cursor()
-        c.execute("INSERT INTO games (date, is_active, password, creator_id) VALUES (%s, TRUE, %s, %s) RETURNING id",
-                  (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), password, message.from_user.id))
-        game_id = c.fetchone()[0]
+        # One active game per chat is enforced by uniq_games_active_chat, so two
+        # concurrent creators cannot both succeed. games.date uses the database
+        # clock, the same one that stamps transactions.created_at
+        c.execute(LOCK_GAME_LIFECYCLE + """
+            INSERT INTO games (is_active, password, creator_id, chat_id) VALUES (TRUE, %s, %s, %s)
+            ON CONFLICT (chat_id) WHERE is_active DO NOTHING
+            RETURNING id
+        """, (GAME_LIFECYCLE_LOCK_ID, message.chat.id, password, message.from_user.id, message.chat.id))
+        created = c.fetchone()
         conn.commit()
+        if not created:
+            bot.reply_to(message, "❌ Another game is already active in this chat. End it first with /end_game.")
+            conn.close()
+            return
+        game_id = created[0]
+        ledger.open_game(game_id, password, message.from_user.id, message.chat.id)
         bot.reply_to(message, f"Game #{game_id} created with password {password}!")
         notify_all_players_new_game(game_id, creator_name)
         conn.close()
@@ -348,44 +639,52 @@ def join_game(message):
     suits = random.choice(['♠️', '♣️', '♥️', '♦️'])
     c = conn.cursor()
     # Check if player is registered
-    c.execute("SELECT id FROM players WHERE telegram_id = %s", (user_id,))
+    queries.execute(c, 'player_by_telegram_id', (user_id,))
     player = c.fetchone()
     if not player:
         bot.reply_to(message, "❌ You are not registered. Use /start.")
         conn.close()
         return
-    player_id = player[0]
-    # Check active game
-    c.execute("SELECT id, password FROM games WHERE is_active = TRUE ORDER BY id DESC LIMIT 1")
-    game = c.fetchone()
+    player_id, player_name = player
+    # Check active game; "/join 12" picks a game when several are running
+    args = message.text.split()[1:]
+    if args and args[0].lstrip('#').isdigit():
+        game = ledger.get_game(int(args[0].lstrip('#')))
+    else:
+        game = current_game(message)
     if not game:
-        bot.reply_to(message, "❌ No active game. Create a /new_game")
+        live = ledger.active_games()
+        if live and not args:
+            game_list = ", ".join(f"#{g.game_id}" for g in live)
+            bot.reply_to(message, f"❌ Several games are running: {game_list}. Use /join <game number>")
+        else:
+            bot.reply_to(message, "❌ No active game. Create a /new_game")
         conn.close()
         return
-    game_id, password = game
+    game_id, password = game.game_id, game.password
     bot.reply_to(message, f"{name}, enter the 4-digit password for game #{game_id}:")
-    bot.register_next_step_handler(message, lambda m: process_join_password(m, game_id, password, player_id, name))
+    bot.register_next_step_handler(message, lambda m: process_join_password(m, game_id, password, player_id, name,
+                                                                            player_name))
     conn.close()
     logger.info(f"Player {name} (Telegram ID: {user_id}) initiated joining game #{game_id}")
 
 
-def process_join_password(message, game_id, correct_password, player_id, name):
+def process_join_password(message, game_id, correct_password, player_id, name, player_name=None):
     suits = random.choice(['♠️', '♣️', '♥️', '♦️'])
     try:
         password = message.text.strip()
         if password != correct_password:
             bot.reply_to(message, "❌ Incorrect password. Try to /join again")
             return
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT id FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        if c.fetchone():
+        game = ledger.get_game(game_id)
+        if game is None:
+            bot.reply_to(message, "❌ Game is no longer active. /join or create a /new_game")
+            return
+        if player_id in game.players:
             bot.reply_to(message, f"{suits}{name}, you are already in game #{game_id}.")
-            conn.close()
             return
         bot.reply_to(message, f"{suits}{name}, enter buy-in, USD (example 20):")
-        bot.register_next_step_handler(message, lambda m: process_buyin(m, name, game_id, player_id))
-        conn.close()
+        bot.register_next_step_handler(message, lambda m: process_buyin(m, name, game_id, player_id, player_name))
         logger.info(f"Player {name} (ID: {player_id}) passed password check for game #{game_id}")
     except Exception as e:
         print("Error joining game:", e)
@@ -393,7 +692,7 @@ def process_join_password(message, game_id, correct_password, player_id, name):
         logger.error(f"Error joining game #{game_id} for {name}: {e}")
 
 
-def process_buyin(message, name, game_id, player_id):
+def process_buyin(message, name, game_id, player_id, player_name=None):
     suits = random.choice(['♠️', '♣️', '♥️', '♦️'])
     try:
         amount_text = message.text.strip()
@@ -405,47 +704,28 @@ def process_buyin(message, name, game_id, player_id):
         user_id = message.from_user.id
         print(f"DEBUG: user_id = {user_id}, game_id = {game_id}, player_id = {player_id}")
 
-        conn = get_db_connection()
-        c = conn.cursor()
-
-        # Verify that the game is still active
-        c.execute("SELECT id FROM games WHERE id = %s AND is_active = TRUE", (game_id,))
-        game_check = c.fetchone()
-        print(f"DEBUG: game_check = {game_check}")
-        if not game_check:
+        # Verify that the game is still active; read once, it may end at any moment
+        game = ledger.get_game(game_id)
+        if game is None:
             bot.reply_to(message, "❌ Game is no longer active. /join or create a /new_game")
-            conn.close()
             return
 
-        # Check if already joined
-        c.execute("SELECT id FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        already_joined = c.fetchone()
+        if player_id in game.players:
+            event = f"💰 {name} added a buy-in of {amount:.1f}{suits} to game #{game_id}!"
+        else:
+            event = f"👤 {name} joined game #{game_id} with a buy-in of {amount:.1f}{suits}!"
+        # Joins the game on the first buy-in; persisted by the ledger writer together with the notifications
+        already_joined = not ledger.record(game_id, player_id, user_id, player_name or name, 'buyin', amount,
+                                           notify=game_event_notifications(game_id, event, exclude_telegram_id=user_id))
         print(f"DEBUG: already_joined = {already_joined}")
-        
-        if not already_joined:
-            # Add player to game and increment games_played only if not already joined
-            c.execute("INSERT INTO game_players (player_id, game_id) VALUES (%s, %s) ON CONFLICT (player_id, game_id) DO NOTHING", (player_id, game_id))
-            c.execute("UPDATE players SET games_played = games_played + 1 WHERE id = %s", (player_id,))
-
-        # Save the buy-in transaction (amount is negative)
-        c.execute("INSERT INTO transactions (player_id, game_id, amount, type) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING",
-                  (player_id, game_id, -amount, 'buyin'))
-
-        # Update total buy-in
-        c.execute("UPDATE players SET total_buyin = total_buyin + %s WHERE id = %s", (amount, player_id))
 
-        conn.commit()
-        
         if already_joined:
             bot.reply_to(message, f"✅ {name} added a buy-in of {amount:.1f}{suits} to game #{game_id}.")
-            notify_game_players(game_id, f"💰 {name} added a buy-in of {amount:.1f}{suits} to game #{game_id}!",
-                                exclude_telegram_id=user_id)
             logger.info(f"Player {name} (ID: {player_id}) added buy-in of {amount:.1f} to game #{game_id}")
         else:
             bot.reply_to(message, f"✅ {name} has joined game #{game_id} with a buy-in of {amount:.1f}{suits}.")
-            notify_game_players(game_id, f"👤 {name} joined game #{game_id} with a buy-in of {amount:.1f}{suits}!",
-                                exclude_telegram_id=user_id)
             logger.info(f"Player {name} (ID: {player_id}) joined game #{game_id} with buy-in {amount:.1f}")
+        show_game_event(game_id, event)
     except Exception as e:
         print(f"Error in buy-in process: {e}")
         print(f"Error type: {type(e)}")
@@ -453,9 +733,6 @@ def process_buyin(message, name, game_id, player_id):
         traceback.print_exc()
         bot.reply_to(message, "❌ Try to /join again. Enter number like 20")
         logger.error(f"Error processing buy-in for {name} in game #{game_id}: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 # Add rebuy
@@ -464,37 +741,26 @@ def process_buyin(message, name, game_id, player_id):
 def rebuy(message):
     user_id = message.from_user.id
     name = message.from_user.first_name
-    conn = get_db_connection()
-    c = conn.cursor()
 
     # Check active game
-    c.execute("SELECT id FROM games WHERE is_active = TRUE ORDER BY id DESC LIMIT 1")
-    game = c.fetchone()
+    game = ledger.game_of_player(user_id) or current_game(message)
     if not game:
         bot.reply_to(message, "❌ No active game found.")
-        conn.close()
         return
-    game_id = game[0]
-
-    # Check if player is registered
-    c.execute("SELECT id FROM players WHERE telegram_id = %s", (user_id,))
-    player = c.fetchone()
-    if not player:
-        bot.reply_to(message, "❌ You are not registered. Use /start.")
-        conn.close()
-        return
-    player_id = player[0]
+    game_id = game.game_id
 
     # Check if player joined the active game
-    c.execute("SELECT id FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-    if not c.fetchone():
-        bot.reply_to(message, "You should /join to the current game")
-        conn.close()
+    player = game.player_by_telegram_id(user_id)
+    if not player:
+        if not is_registered(user_id):
+            bot.reply_to(message, "❌ You are not registered. Use /start.")
+        else:
+            bot.reply_to(message, "You should /join to the current game")
         return
+    player_id = player.player_id
 
     bot.reply_to(message, "Enter the rebuy amount (example 50.5)")
     bot.register_next_step_handler(message, lambda m: process_rebuy(m, name, game_id, player_id))
-    conn.close()
     logger.info(f"Player {name} (Telegram ID: {user_id}) initiated rebuy for game #{game_id}")
 
 
@@ -506,35 +772,22 @@ def process_rebuy(message, name, game_id, player_id):
             raise ValueError("Amount must be from 1 to 5000 (example 20.5).")
         user_id = message.from_user.id
 
-        conn = get_db_connection()
-        c = conn.cursor()
-
         # Verify that the game is still active
-        c.execute("SELECT id FROM games WHERE id = %s AND is_active = TRUE", (game_id,))
-        if not c.fetchone():
+        if ledger.get_game(game_id) is None:
             bot.reply_to(message, "❌ Game is no longer active.")
-            conn.close()
             return
 
-        # Insert rebuy record
-        c.execute("INSERT INTO transactions (player_id, game_id, amount, type) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING",
-                  (player_id, game_id, -amount, 'rebuy'))
-
-        # Update total rebuys (not total_buyin)
-        c.execute("UPDATE players SET total_rebuys = total_rebuys + %s WHERE id = %s", (amount, player_id))
-
-        conn.commit()
+        # Record rebuy (counts towards total_rebuys, not total_buyin)
+        event = f"💸 {name} made a rebuy of {amount:.1f}{suits} in game #{game_id}!"
+        ledger.record(game_id, player_id, user_id, name, 'rebuy', amount,
+                      notify=game_event_notifications(game_id, event, exclude_telegram_id=user_id))
         bot.reply_to(message, f"✅ {name} made a rebuy of {amount:.1f}{suits} in game #{game_id}.")
-        notify_game_players(game_id, f"💸 {name} made a rebuy of {amount:.1f}{suits} in game #{game_id}!",
-                            exclude_telegram_id=user_id)
+        show_game_event(game_id, event)
         logger.info(f"Player {name} (ID: {player_id}) made rebuy of {amount:.1f} in game #{game_id}")
     except Exception as e:
         print("Error in rebuy:", e)
         bot.reply_to(message, "❌ Try to /rebuy again. Number up to 5000 (example 20.5)")
         logger.error(f"Error processing rebuy for {name} in game #{game_id}: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 # Add cashout
@@ -543,37 +796,26 @@ def process_rebuy(message, name, game_id, player_id):
 def cashout(message):
     user_id = message.from_user.id
     name = message.from_user.first_name
-    conn = get_db_connection()
-    c = conn.cursor()
 
     # Check active game
-    c.execute("SELECT id FROM games WHERE is_active = TRUE ORDER BY id DESC LIMIT 1")
-    game = c.fetchone()
+    game = ledger.game_of_player(user_id) or current_game(message)
     if not game:
         bot.reply_to(message, "❌ No active game session.")
-        conn.close()
         return
-    game_id = game[0]
-
-    # Check if player is registered
-    c.execute("SELECT id FROM players WHERE telegram_id = %s", (user_id,))
-    player = c.fetchone()
-    if not player:
-        bot.reply_to(message, "❌ You are not registered. Use /start.")
-        conn.close()
-        return
-    player_id = player[0]
+    game_id = game.game_id
 
     # Check if player joined the active game
-    c.execute("SELECT id FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-    if not c.fetchone():
-        bot.reply_to(message, "You should join to the current game")
-        conn.close()
+    player = game.player_by_telegram_id(user_id)
+    if not player:
+        if not is_registered(user_id):
+            bot.reply_to(message, "❌ You are not registered. Use /start.")
+        else:
+            bot.reply_to(message, "You should join to the current game")
         return
+    player_id = player.player_id
 
     bot.reply_to(message, "Enter cashout amount (example 11.4)")
     bot.register_next_step_handler(message, lambda m: process_cashout(m, name, game_id, player_id))
-    conn.close()
     logger.info(f"Player {name} (Telegram ID: {user_id}) initiated cashout for game #{game_id}")
 
 
@@ -585,35 +827,22 @@ def process_cashout(message, name, game_id, player_id):
             raise ValueError("Amount must be from 1 to 5000 (example 20.5).")
         user_id = message.from_user.id
 
-        conn = get_db_connection()
-        c = conn.cursor()
-
         # Verify that the game is still active
-        c.execute("SELECT id FROM games WHERE id = %s AND is_active = TRUE", (game_id,))
-        if not c.fetchone():
+        if ledger.get_game(game_id) is None:
             bot.reply_to(message, "❌ Game is no longer active.")
-            conn.close()
             return
 
         # Save cashout
-        c.execute("INSERT INTO transactions (player_id, game_id, amount, type) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING",
-                  (player_id, game_id, amount, 'cashout'))
-
-        # Update total cashout
-        c.execute("UPDATE players SET total_cashout = total_cashout + %s WHERE id = %s", (amount, player_id))
-
-        conn.commit()
+        event = f"💰 {name} cashed out {amount:.1f}{suits} in game #{game_id}!"
+        ledger.record(game_id, player_id, user_id, name, 'cashout', amount,
+                      notify=game_event_notifications(game_id, event, exclude_telegram_id=user_id))
         bot.reply_to(message, f"✅ {name} cashed out {amount:.1f}{suits} in game #{game_id}.")
-        notify_game_players(game_id, f"💰 {name} cashed out {amount:.1f}{suits} in game #{game_id}!",
-                            exclude_telegram_id=user_id)
+        show_game_event(game_id, event)
         logger.info(f"Player {name} (ID: {player_id}) cashed out {amount:.1f} in game #{game_id}")
     except Exception as e:
         print("Cashout error:", e)
         bot.reply_to(message, "❌ Try to /cashout again. Number from 1 to 5000 (example 20.5)")
         logger.error(f"Error processing cashout for {name} in game #{game_id}: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 @bot.message_handler(commands=['leave'])
@@ -621,32 +850,21 @@ def process_cashout(message, name, game_id, player_id):
 def reset(message):
     user_id = message.from_user.id
     name = message.from_user.first_name
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT id FROM games WHERE is_active = TRUE ORDER BY id DESC LIMIT 1")
-    game = c.fetchone()
+    game = ledger.game_of_player(user_id) or current_game(message)
     if not game:
         bot.reply_to(message, "❌ No active game found.")
-        conn.close()
         return
-    game_id = game[0]
-    c.execute("SELECT id FROM players WHERE telegram_id = %s", (user_id,))
-    player = c.fetchone()
+    game_id, password = game.game_id, game.password
+    player = game.player_by_telegram_id(user_id)
     if not player:
-        bot.reply_to(message, "❌ You are not registered. Use /start.")
-        conn.close()
-        return
-    player_id = player[0]
-    c.execute("SELECT id FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-    if not c.fetchone():
-        bot.reply_to(message, "❌ You are not in the current game.")
-        conn.close()
+        if not is_registered(user_id):
+            bot.reply_to(message, "❌ You are not registered. Use /start.")
+        else:
+            bot.reply_to(message, "❌ You are not in the current game.")
         return
-    c.execute("SELECT password FROM games WHERE id = %s", (game_id,))
-    password = c.fetchone()[0]
+    player_id = player.player_id
     bot.reply_to(message, f"{name}, enter game pass, your data will be deleted in game #{game_id}:")
     bot.register_next_step_handler(message, lambda m: process_reset_password(m, game_id, password, player_id, name))
-    conn.close()
     logger.info(f"Player {name} (Telegram ID: {user_id}) initiated leaving for game #{game_id}")
 
 
@@ -657,32 +875,17 @@ def process_reset_password(message, game_id, correct_password, player_id, name):
         if password != correct_password:
             bot.reply_to(message, "❌ Incorrect password. Try to /leave again.")
             return
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT amount, type FROM transactions WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        transactions = c.fetchall()
-        for amount, trans_type in transactions:
-            if trans_type == 'buyin':
-                c.execute("UPDATE players SET total_buyin = total_buyin - %s WHERE id = %s", (-amount, player_id))
-            elif trans_type == 'rebuy':
-                c.execute("UPDATE players SET total_rebuys = total_rebuys - %s WHERE id = %s", (-amount, player_id))
-            elif trans_type == 'cashout':
-                c.execute("UPDATE players SET total_cashout = total_cashout - %s WHERE id = %s",
-                          (amount, player_id))
-        c.execute("DELETE FROM transactions WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        c.execute("DELETE FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        c.execute("UPDATE players SET games_played = games_played - 1 WHERE id = %s", (player_id,))
-        conn.commit()
+        # Removes the player from the live game; persisted by the ledger writer
+        event = f"🔄 {name} left game #{game_id}{suits}!"
+        ledger.clear_player(game_id, player_id,
+                            notify=game_event_notifications(game_id, event, exclude_telegram_id=message.from_user.id))
         bot.reply_to(message, f"✅ {name} left game #{game_id}{suits}.")
-        notify_game_players(game_id, f"🔄 {name} left game #{game_id}{suits}!", exclude_telegram_id=message.from_user.id)
+        show_game_event(game_id, event)
         logger.info(f"Player {name} (ID: {player_id}) left from game #{game_id}")
     except Exception as e:
         print("Error in leaving process:", e)
         bot.reply_to(message, "❌ Try to /leave again.")
         logger.error(f"Error leaving game #{game_id} for {name}: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 # game results
@@ -690,17 +893,13 @@ def process_reset_password(message, game_id, correct_password, player_id, name):
 @safe_handler
 def game_results(message):
     user_id = message.from_user.id
-    conn = get_db_connection()
-    c = conn.cursor()
 
     # search active game
-    c.execute("SELECT id FROM games WHERE is_active = TRUE ORDER BY id DESC LIMIT 1")
-    row = c.fetchone()
-    conn.close()
+    game = current_game(message)
 
-    if row:
+    if game:
         # show results
-        active_game_id = row[0]
+        active_game_id = game.game_id
         send_game_results_to_user(active_game_id, message.chat.id)
     else:
         # if no current game - ender previous game ID
@@ -720,9 +919,11 @@ def process_game_results(message):
         logger.error(f"Error processing game results for game #{message.text}: {e}")
 
 
-def send_game_results_to_user(game_id, chat_id):
+def load_game_results(game_id):
+    """Per-player (name, buyins, rebuys, cashouts, total) of a game from the database."""
     conn = get_db_connection()
     c = conn.cursor()
+    game_start = get_game_window(c, game_id)
     c.execute("""
         SELECT p.name, 
                SUM(CASE WHEN t.type = 'buyin' THEN -t.amount ELSE 0 END) as buyins,
@@ -731,15 +932,58 @@ def send_game_results_to_user(game_id, chat_id):
                CAST(SUM(t.amount) AS NUMERIC(10,1)) as total
         FROM transactions t
         JOIN players p ON t.player_id = p.id
-        WHERE t.game_id = %s
+        WHERE t.game_id = %s AND t.created_at >= %s
         GROUP BY p.id
-    """, (game_id,))
+    """, (game_id, game_start))
     results = c.fetchall()
     conn.close()
+    return results
+
+
+def game_settlement(game_id):
+    """(transfers, imbalance, names) of an ended game.
+
+    The plan is cached in game_settlements together with the count and
+    highest id of the game's transactions, and recomputed once they change
+    (a parked change written later, an adjustment).
+    """
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT p.id, p.name, CAST(SUM(t.amount) AS NUMERIC(10,1)), COUNT(*), MAX(t.id)
+            FROM transactions t
+            JOIN players p ON t.player_id = p.id
+            WHERE t.game_id = %s AND t.created_at >= %s
+            GROUP BY p.id
+        """, (game_id, get_game_window(c, game_id)))
+        balances = c.fetchall()
+        watermark = f"{sum(row[3] for row in balances)}:{max((row[4] for row in balances), default=0)}"
+        # Two players may share a name; the plan itself is keyed by id
+        counts = {}
+        for _, name, *_ in balances:
+            counts[name] = counts.get(name, 0) + 1
+        names = {player_id: name if counts[name] == 1 else f"{name} (#{player_id})"
+                 for player_id, name, *_ in balances}
+        plan = settlement.load_plan(c, game_id, watermark)
+        if plan is None:
+            plan = settlement.settle([(player_id, total) for player_id, _, total, _, _ in balances])
+            settlement.save_plan(c, game_id, watermark, *plan)
+        return (*plan, names)
+    finally:
+        conn.close()
+
+
+def format_game_results(game_id):
+    """Results message of a game, with the settlement plan once it has ended; None if it has no data."""
+    # Live games are answered from memory, ended ones from the database
+    results = ledger.snapshot(game_id)
+    ended = results is None
+    if ended:
+        results = load_game_results(game_id)
 
     if not results:
-        bot.send_message(chat_id, f"⚠️ No data found for game #{game_id}.")
-        return
+        return None
 
     response = f"♠️ Game #{game_id} results:\n\n"
 
@@ -767,73 +1011,163 @@ def send_game_results_to_user(game_id, chat_id):
         f"  Difference = {diff:.1f} {'✅ OK — balanced' if diff == 0 else ''}"
     )
 
-    bot.send_message(chat_id, response)
+    if ended:
+        response += settlement.format_plan(*game_settlement(game_id))
+    return response
+
+
+def send_game_results_to_user(game_id, chat_id):
+    response = format_game_results(game_id)
+    if response is None:
+        bot.send_message(chat_id, f"⚠️ No data found for game #{game_id}.")
+        return
+    send_long(chat_id, response)
+
+
+# Paginated reports: each page is one keyset query over players ordered by (name, id)
+REPORT_PAGE_ROWS = int(os.getenv("REPORT_PAGE_ROWS", "30"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Keyset condition and sort order for each page direction; the anchor is a player id
+REPORT_KEYSET = {
+    'first': ("TRUE", "ASC"),
+    'next': ("(p.name, p.id) > (SELECT name, id FROM players WHERE id = %(anchor)s)", "ASC"),
+    'prev': ("(p.name, p.id) < (SELECT name, id FROM players WHERE id = %(anchor)s)", "DESC"),
+}
+
+
+def fetch_report_page(c, sql, direction='first', anchor_id=None, page_rows=REPORT_PAGE_ROWS):
+    """Stream one page of a report through a server-side cursor.
+
+    `sql` has {keyset} and {order} slots and selects the player id first.
+    Returns (rows in name order, has_prev, has_next).
+    """
+    keyset, order = REPORT_KEYSET[direction]
+    page = c.connection.cursor(name="report_page")
+    page.itersize = page_rows + 1
+    page.execute(sql.format(keyset=keyset, order=order), {'anchor': anchor_id, 'limit': page_rows + 1})
+    rows = page.fetchmany(page_rows + 1)
+    page.close()
+
+    more = len(rows) > page_rows
+    rows = rows[:page_rows]
+    if direction == 'prev':
+        rows.reverse()
+        return rows, more, True
+    return rows, direction == 'next', more
+
+
+def report_keyboard(report, rows, has_prev, has_next):
+    """◀️/▶️ buttons that fetch the neighbouring pages lazily"""
+    buttons = []
+    if has_prev and rows:
+        buttons.append(telebot.types.InlineKeyboardButton(text="◀️", callback_data=f"report_{report}_prev_{rows[0][0]}"))
+    if has_next and rows:
+        buttons.append(telebot.types.InlineKeyboardButton(text="▶️", callback_data=f"report_{report}_next_{rows[-1][0]}"))
+    if not buttons:
+        return None
+    keyboard = telebot.types.InlineKeyboardMarkup()
+    keyboard.row(*buttons)
+    return keyboard
+
+
+def fit_page(build_page, direction='first', anchor_id=None):
+    """Build a report page with as many rows as fit into one message.
+
+    `build_page(direction, anchor_id, page_rows)` returns (text, reply_markup);
+    a page that comes out too long is built again with proportionally fewer rows.
+    """
+    page_rows = REPORT_PAGE_ROWS
+    while True:
+        text, keyboard = build_page(direction, anchor_id, page_rows)
+        if len(text) <= TELEGRAM_MESSAGE_LIMIT or page_rows == 1:
+            return text, keyboard
+        page_rows = max(1, min(page_rows - 1, page_rows * TELEGRAM_MESSAGE_LIMIT // len(text)))
+        logger.info(f"Report page too long ({len(text)} characters), retrying with {page_rows} row(s)")
+
+
+def send_long(chat_id, text):
+    """Send `text`, continued in follow-up messages when it is longer than one message"""
+    for part in digest.split(text, TELEGRAM_MESSAGE_LIMIT):
+        bot.send_message(chat_id, part)
+
+
+def reply_long(message, text):
+    """Reply with `text`, continued in follow-up messages when it is longer than one message"""
+    parts = digest.split(text, TELEGRAM_MESSAGE_LIMIT)
+    bot.reply_to(message, parts[0])
+    for part in parts[1:]:
+        bot.send_message(message.chat.id, part)
 
 
 # Overall results
 @bot.message_handler(commands=['overall_results'])
 @safe_handler
 def overall_results(message):
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Get basic player stats with player IDs
-    c.execute("""
-                SELECT p.id, p.name, 
-                       p.games_played, 
-                       CAST(
-                           COALESCE(SUM(CASE WHEN t.type = 'buyin' THEN ABS(t.amount) ELSE 0 END), 0) AS NUMERIC(10,1)
-                       ) as total_buyins,
-                       CAST(
-                           COALESCE(SUM(CASE WHEN t.type = 'rebuy' THEN ABS(t.amount) ELSE 0 END), 0) AS NUMERIC(10,1)
-                       ) as total_rebuys,
-                       CAST(
-                           COALESCE(SUM(CASE WHEN t.type = 'cashout' THEN t.amount ELSE 0 END), 0) AS NUMERIC(10,1)
-                       ) as total_cashouts
-                FROM players p
-                LEFT JOIN transactions t ON t.player_id = p.id
-                GROUP BY p.id, p.name, p.games_played
-                ORDER BY p.name
+    report_jobs.submit(message, 'overall_results', lambda: fit_page(build_overall_results))
+    logger.info(f"User (Telegram ID: {message.from_user.id}) requested overall results")
+
+
+OVERALL_RESULTS_PAGE = """
+    SELECT p.id, p.name,
+           p.games_played,
+           CAST(
+               COALESCE(SUM(CASE WHEN t.type = 'buyin' THEN ABS(t.amount) ELSE 0 END), 0) AS NUMERIC(10,1)
+           ) as total_buyins,
+           CAST(
+               COALESCE(SUM(CASE WHEN t.type = 'rebuy' THEN ABS(t.amount) ELSE 0 END), 0) AS NUMERIC(10,1)
+           ) as total_rebuys,
+           CAST(
+               COALESCE(SUM(CASE WHEN t.type = 'cashout' THEN t.amount ELSE 0 END), 0) AS NUMERIC(10,1)
+           ) as total_cashouts
+    FROM players p
+    LEFT JOIN transactions t ON t.player_id = p.id
+    WHERE {keyset}
+    GROUP BY p.id, p.name, p.games_played
+    ORDER BY p.name {order}, p.id {order}
+    LIMIT %(limit)s
+"""
+
+
+def build_overall_results(direction='first', anchor_id=None, page_rows=REPORT_PAGE_ROWS):
+    """Compute one page of the overall results table across all games."""
+    with report_cursor() as c:
+        players, has_prev, has_next = fetch_report_page(c, OVERALL_RESULTS_PAGE, direction, anchor_id, page_rows)
+        if not players:
+            return "No player data found."
+
+        # Get win rates for the players on this page
+        c.execute("""
+            SELECT player_id, 
+                   COUNT(DISTINCT game_id) as total_games,
+                   COUNT(DISTINCT CASE WHEN game_profit > 0 THEN game_id END) as winning_games
+            FROM (
+                SELECT player_id, game_id,
+                       SUM(CASE WHEN type = 'cashout' THEN amount ELSE 0 END) - 
+                       SUM(CASE WHEN type IN ('buyin', 'rebuy') THEN ABS(amount) ELSE 0 END) as game_profit
+                FROM transactions 
+                WHERE player_id = ANY(%s)
+                GROUP BY player_id, game_id
+            ) game_stats
+            GROUP BY player_id
+        """, ([row[0] for row in players],))
+        win_rates = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+
+        # Bank statistics close the report on its last page
+        bank_stats = None
+        if not has_next:
+            c.execute("""
+                SELECT 
+                    MAX(total_bank) as max_bank,
+                    AVG(total_bank) as avg_bank
+                FROM (
+                    SELECT game_id,
+                           SUM(CASE WHEN type IN ('buyin', 'rebuy') THEN ABS(amount) ELSE 0 END) as total_bank
+                    FROM transactions 
+                    GROUP BY game_id
+                ) game_banks
             """)
-    players = c.fetchall()
-    
-    # Get win rates for all players
-    c.execute("""
-        SELECT player_id, 
-               COUNT(DISTINCT game_id) as total_games,
-               COUNT(DISTINCT CASE WHEN game_profit > 0 THEN game_id END) as winning_games
-        FROM (
-            SELECT player_id, game_id,
-                   SUM(CASE WHEN type = 'cashout' THEN amount ELSE 0 END) - 
-                   SUM(CASE WHEN type IN ('buyin', 'rebuy') THEN ABS(amount) ELSE 0 END) as game_profit
-            FROM transactions 
-            GROUP BY player_id, game_id
-        ) game_stats
-        GROUP BY player_id
-    """)
-    win_rates = {row[0]: (row[1], row[2]) for row in c.fetchall()}
-    
-    # Get bank statistics for all games
-    c.execute("""
-        SELECT 
-            MAX(total_bank) as max_bank,
-            AVG(total_bank) as avg_bank
-        FROM (
-            SELECT game_id,
-                   SUM(CASE WHEN type IN ('buyin', 'rebuy') THEN ABS(amount) ELSE 0 END) as total_bank
-            FROM transactions 
-            GROUP BY game_id
-        ) game_banks
-    """)
-    bank_stats = c.fetchone()
-    max_bank = bank_stats[0] if bank_stats[0] else 0
-    avg_bank = bank_stats[1] if bank_stats[1] else 0
-    
-    conn.close()
-
-    if not players:
-        bot.reply_to(message, "No player data found.")
-        return
+            bank_stats = c.fetchone()
 
     # Create table header
     response = "📊 Overall Results:\n"
@@ -863,66 +1197,246 @@ def overall_results(message):
         response += f"{name:<15} | {games_played:<8} | {profit_str:<10} | {win_rate:<12} | {avg_str:<10}\n"
 
     # Add bank statistics
-    response += f"\n💰 Bank Statistics:\n"
-    response += f"  Max Bank: {max_bank:.1f}\n"
-    response += f"  Avg Bank: {avg_bank:.1f}"
+    if bank_stats is not None:
+        max_bank = bank_stats[0] if bank_stats[0] else 0
+        avg_bank = bank_stats[1] if bank_stats[1] else 0
+        response += f"\n💰 Bank Statistics:\n"
+        response += f"  Max Bank: {max_bank:.1f}\n"
+        response += f"  Avg Bank: {avg_bank:.1f}"
 
-    bot.send_message(message.chat.id, response)
+    return response, report_keyboard('overall', players, has_prev, has_next)
 
 
 # average profit per game
 @bot.message_handler(commands=['avg_profit'])
 @safe_handler
 def avg_profit(message):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT p.name, CAST(AVG(s.total) AS NUMERIC(10,1))
-        FROM (
-            SELECT player_id, game_id, SUM(amount) as total
-            FROM transactions
-            GROUP BY player_id, game_id
-        ) s
-        JOIN players p ON s.player_id = p.id
-        GROUP BY p.id
-    """)
-    results = c.fetchall()
-    conn.close()
-    response = "Average profit per game:\n"
-    for name, avg in results:
-        response += f"{name}: {'+' if avg > 0 else ''}{avg:.1f}\n"
-    bot.reply_to(message, response)
+    report_jobs.submit(message, 'avg_profit', lambda: fit_page(build_avg_profit))
     logger.info(f"User (Telegram ID: {message.from_user.id}) requested average profit")
 
 
+AVG_PROFIT_PAGE = """
+    SELECT p.id, p.name, CAST(AVG(s.total) AS NUMERIC(10,1))
+    FROM (
+        SELECT player_id, game_id, SUM(amount) as total
+        FROM transactions
+        GROUP BY player_id, game_id
+    ) s
+    JOIN players p ON s.player_id = p.id
+    WHERE {keyset}
+    GROUP BY p.id
+    ORDER BY p.name {order}, p.id {order}
+    LIMIT %(limit)s
+"""
+
+
+def build_avg_profit(direction='first', anchor_id=None, page_rows=REPORT_PAGE_ROWS):
+    """Compute one page of the average profit per game for every player."""
+    with report_cursor() as c:
+        results, has_prev, has_next = fetch_report_page(c, AVG_PROFIT_PAGE, direction, anchor_id, page_rows)
+    response = "Average profit per game:\n"
+    for _, name, avg in results:
+        response += f"{name[:30]}: {'+' if avg > 0 else ''}{avg:.1f}\n"
+    return response, report_keyboard('avg', results, has_prev, has_next)
+
+
+# Player statistics, recomputed only after another game has ended
+stats_cache = stats.StatsCache()
+
+
+@bot.message_handler(commands=['stats'])
+@safe_handler
+def player_stats(message):
+    """/stats for everyone, /stats <name> for one player's detailed card"""
+    parts = message.text.split(maxsplit=1)
+    search = parts[1].strip() if len(parts) > 1 else ""
+    report_jobs.submit(message, f"stats_{search.lower()}", lambda: build_stats(search))
+    logger.info(f"User (Telegram ID: {message.from_user.id}) requested stats {search}")
+
+
+def build_stats(search=""):
+    """Summary table of every player, or the card of the first player whose name starts with `search`."""
+    with report_cursor() as c:
+        performance = stats_cache.get(c)
+    if search:
+        matches = [i for i, name in enumerate(performance.names) if name.lower().startswith(search.lower())]
+        if not matches:
+            return f"❌ No player named {search}."
+        return player_stats_card(performance, matches[0])
+
+    played = [i for i in range(len(performance.player_ids)) if performance.games[i] > 0]
+    if not played:
+        return "No finished games yet."
+    played.sort(key=lambda i: -performance.total[i])
+    response = "📈 Player Stats:\n"
+    response += f"{'Name':<12} | {'G':<4} | {'Total':<8} | {'σ':<6} | {'MaxDD':<7} | {'ROI':<6}\n"
+    response += "-" * 56 + "\n"
+    for i in played:
+        total = f"{'+' if performance.total[i] > 0 else ''}{performance.total[i]:.1f}"
+        response += (f"{performance.names[i][:12]:<12} | {performance.games[i]:<4} | {total:<8} | "
+                     f"{performance.std[i]:<6.1f} | {performance.max_drawdown[i]:<7.1f} | {performance.roi[i]:<5.0f}%\n")
+    response += "\n/stats <name> for streaks, percentiles and rivals"
+    return response
+
+
+def player_stats_card(performance, i):
+    """Detailed statistics of the player at index `i`."""
+    name = performance.names[i]
+    if not performance.games[i]:
+        return f"{name} has not finished a game yet."
+    p10, median, p90 = performance.percentiles[i]
+    streak = performance.current_streak[i]
+    current = f"{streak} win(s)" if streak > 0 else f"{-streak} loss(es)"
+    response = (f"📈 {name}\n"
+                f"Games: {performance.games[i]}\n"
+                f"Total: {performance.total[i]:+.1f}\n"
+                f"Average: {performance.mean[i]:+.1f} ± {performance.std[i]:.1f}\n"
+                f"Win rate: {performance.win_rate[i]:.0f}%\n"
+                f"ROI: {performance.roi[i]:.0f}%\n"
+                f"Results p10 / median / p90: {p10:+.1f} / {median:+.1f} / {p90:+.1f}\n"
+                f"Max drawdown: {performance.max_drawdown[i]:.1f}\n"
+                f"Longest streaks: {performance.longest_win[i]} wins, {performance.longest_loss[i]} losses\n"
+                f"Current streak: {current}\n")
+    rivals = performance.rivals(performance.player_ids[i])
+    if rivals:
+        response += "\nHead to head (games, ahead, difference):\n"
+        for rival, shared, ahead, difference in rivals:
+            response += f"  vs {rival}: {shared}, {ahead}, {difference:+.1f}\n"
+    return response
+
+
+# Cumulative profit charts, rendered in a process pool and cached per watermark
+chart_cache = charts.ChartCache()
+atexit.register(chart_cache.shutdown)
+
+
+@bot.message_handler(commands=['chart'])
+@safe_handler
+def profit_chart(message):
+    """/chart for the most active players, /chart <name> for one player's cumulative profit"""
+    parts = message.text.split(maxsplit=1)
+    search = parts[1].strip() if len(parts) > 1 else ""
+    chat_id = message.chat.id
+    report_jobs.submit(message, f"chart_{chat_id}_{search.lower()}", lambda: send_chart(chat_id, search))
+    logger.info(f"User (Telegram ID: {message.from_user.id}) requested chart {search}")
+
+
+def send_chart(chat_id, search=""):
+    """Send the chart as a photo: by file_id when already uploaded, else rendered (or read) from the disk cache."""
+    with report_cursor() as c:
+        performance = stats_cache.get(c)
+    if search:
+        matches = [i for i, name in enumerate(performance.names) if name.lower().startswith(search.lower())]
+        if not matches:
+            return f"❌ No player named {search}."
+        if not performance.games[matches[0]]:
+            return f"{performance.names[matches[0]]} has not finished a game yet."
+        players = matches[:1]
+        key = f"player{performance.player_ids[players[0]]}"
+        title = f"{performance.names[players[0]]}: cumulative profit"
+    else:
+        players = sorted((i for i in range(len(performance.player_ids)) if performance.games[i] > 0),
+                         key=lambda i: -performance.games[i])[:charts.CHART_MAX_PLAYERS]
+        if not players:
+            return "No finished games yet."
+        key = "all"
+        title = "Cumulative profit"
+
+    watermark = performance.watermark
+    file_id = chart_cache.file_id(key, watermark)
+    if file_id:
+        try:
+            bot.send_photo(chat_id, file_id, caption=title)
+            return f"📈 {title}"
+        except telebot.apihelper.ApiTelegramException as e:
+            logger.warning(f"Cached chart {key} rejected by Telegram, uploading again: {e}")
+            chart_cache.forget(key, watermark)
+
+    series = [(performance.names[i], *performance.cumulative(i)) for i in players]
+    path = chart_cache.render(key, watermark, title, series)
+    with open(path, 'rb') as f:
+        sent = bot.send_photo(chat_id, f, caption=title)
+    chart_cache.remember(key, watermark, sent.photo[-1].file_id)
+    return f"📈 {title}"
+
+
+REPORT_PAGES = {
+    'overall': build_overall_results,
+    'avg': build_avg_profit,
+}
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('report_'))
+@safe_handler
+def handle_report_page_callback(call):
+    _, report, direction, anchor_id = call.data.split('_')
+    bot.answer_callback_query(call.id)
+    build_page = REPORT_PAGES[report]
+    anchor_id = int(anchor_id)
+    report_jobs.submit_edit(call.message, f"{report}_{direction}_{anchor_id}",
+                            lambda: fit_page(build_page, direction, anchor_id))
+    logger.info(f"User (Telegram ID: {call.from_user.id}) requested {direction} page of {report} report")
+
+
 # ADMINS
+def registered_players_page(scope, search, direction, anchor_id, limit):
+    """Picker page source over every registered player"""
+    conn = get_db_connection()
+    try:
+        return picker.search_players(conn.cursor(), search, direction, anchor_id, limit)
+    finally:
+        conn.close()
+
+
+def game_players_page(game_id, search, direction, anchor_id, limit):
+    """Picker page source over the players of a live game"""
+    game = ledger.get_game(game_id)
+    players = [(player.player_id, player.name) for player in game.players.values()] if game else []
+    return picker.page_players(players, search, direction, anchor_id, limit)
+
+
+player_picker = picker.PlayerPicker()
+player_picker.register('rm', "Select a player to remove from game #{scope}:",
+                       lambda game_id, player_id: f"remove_{game_id}_{player_id}", game_players_page)
+player_picker.register('ad', "Select a player to adjust in game #{scope}:",
+                       lambda game_id, player_id: f"adjust_{game_id}_{player_id}", game_players_page)
+player_picker.register('rn', "Select a player to rename:",
+                       lambda _, player_id: f"rename_{player_id}", registered_players_page)
+
+
+def picker_search(message):
+    """Search term after the command, e.g. /rename_player ann"""
+    parts = message.text.split(maxsplit=1)
+    return picker.normalize_search(parts[1]) if len(parts) > 1 else ""
+
+
+@bot.callback_query_handler(func=lambda call: player_picker.handles(call.data))
+@safe_handler
+def handle_picker_page_callback(call):
+    if call.from_user.id not in ADMINS:
+        bot.answer_callback_query(call.id, "❌ Access denied! Admins only.")
+        return
+    text, keyboard = player_picker.render_callback(call.data)
+    bot.answer_callback_query(call.id)
+    bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=keyboard)
+
+
 @bot.message_handler(commands=['remove_player'])
 @safe_handler
 def remove_player(message):
     if message.from_user.id not in ADMINS:
         bot.reply_to(message, "❌ Access denied! Admins only.")
         return
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT id FROM games WHERE is_active = TRUE ORDER BY id DESC LIMIT 1")
-    game = c.fetchone()
+    game = current_game(message)
     if not game:
         bot.reply_to(message, "❌ No active game found.")
-        conn.close()
         return
-    game_id = game[0]
-    c.execute("SELECT p.id, p.name FROM players p JOIN game_players gp ON p.id = gp.player_id WHERE gp.game_id = %s",
-              (game_id,))
-    players = c.fetchall()
-    if not players:
+    game_id = game.game_id
+    if not game.players:
         bot.reply_to(message, "❌ No players in the current game.")
-        conn.close()
         return
-    keyboard = telebot.types.InlineKeyboardMarkup()
-    for player_id, name in players:
-        keyboard.add(telebot.types.InlineKeyboardButton(text=name, callback_data=f"remove_{game_id}_{player_id}"))
-    bot.reply_to(message, f"Select a player to remove from game #{game_id}:", reply_markup=keyboard)
-    conn.close()
+    text, keyboard = player_picker.render('rm', game_id, picker_search(message))
+    bot.reply_to(message, text, reply_markup=keyboard)
     logger.info(f"Admin (Telegram ID: {message.from_user.id}) initiated player removal for game #{game_id}")
 
 
@@ -943,29 +1457,16 @@ def handle_remove_player_callback(call):
             conn.close()
             return
         name = player[0]
-        c.execute("SELECT id FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        if not c.fetchone():
+        if not is_game_member(c, game_id, player_id):
             bot.answer_callback_query(call.id, f"{name} is not in game #{game_id}.")
             conn.close()
             return
-        c.execute("SELECT amount, type FROM transactions WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        transactions = c.fetchall()
-        for amount, trans_type in transactions:
-            if trans_type == 'buyin':
-                c.execute("UPDATE players SET total_buyin = total_buyin - %s WHERE id = %s", (-amount, player_id))
-            elif trans_type == 'rebuy':
-                c.execute("UPDATE players SET total_rebuys = total_rebuys - %s WHERE id = %s", (-amount, player_id))
-            elif trans_type == 'cashout':
-                c.execute("UPDATE players SET total_cashout = total_cashout - %s WHERE id = %s",
-                          (amount, player_id))
-        c.execute("DELETE FROM transactions WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        c.execute("DELETE FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        c.execute("UPDATE players SET games_played = games_played - 1 WHERE id = %s", (player_id,))
-        conn.commit()
+        event = f"🚪 {name} removed from game #{game_id}{suits}!"
+        ledger.clear_player(game_id, player_id, notify=game_event_notifications(game_id, event))
         bot.answer_callback_query(call.id, f"{name} removed from game #{game_id}{suits}.")
         bot.edit_message_text(f"✅ {name} removed from game #{game_id}{suits}.", call.message.chat.id,
                               call.message.message_id)
-        notify_game_players(game_id, f"🚪 {name} removed from game #{game_id}{suits}!", exclude_telegram_id=None)
+        show_game_event(game_id, event)
         logger.info(f"Admin removed player {name} (ID: {player_id}) from game #{game_id}")
     except Exception as e:
         print("Error in remove_player callback:", e)
@@ -983,27 +1484,16 @@ def adjust(message):
     if message.from_user.id not in ADMINS:
         bot.reply_to(message, "❌ Access denied! Admins only.")
         return
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT id FROM games WHERE is_active = TRUE ORDER BY id DESC LIMIT 1")
-    game = c.fetchone()
+    game = current_game(message)
     if not game:
         bot.reply_to(message, "❌ No active game found.")
-        conn.close()
         return
-    game_id = game[0]
-    c.execute("SELECT p.id, p.name FROM players p JOIN game_players gp ON p.id = gp.player_id WHERE gp.game_id = %s",
-              (game_id,))
-    players = c.fetchall()
-    if not players:
+    game_id = game.game_id
+    if not game.players:
         bot.reply_to(message, "❌ No players in the current game.")
-        conn.close()
         return
-    keyboard = telebot.types.InlineKeyboardMarkup()
-    for player_id, name in players:
-        keyboard.add(telebot.types.InlineKeyboardButton(text=name, callback_data=f"adjust_{game_id}_{player_id}"))
-    bot.reply_to(message, f"Select a player to adjust in game #{game_id}:", reply_markup=keyboard)
-    conn.close()
+    text, keyboard = player_picker.render('ad', game_id, picker_search(message))
+    bot.reply_to(message, text, reply_markup=keyboard)
     logger.info(f"Admin (Telegram ID: {message.from_user.id}) initiated adjustment for game #{game_id}")
 
 
@@ -1060,31 +1550,17 @@ def handle_adjust_action_callback(call):
             conn.close()
             return
         name = player[0]
-        c.execute("SELECT id FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-        if not c.fetchone():
+        if not is_game_member(c, game_id, player_id):
             bot.answer_callback_query(call.id, f"{name} is not in game #{game_id}.")
             conn.close()
             return
         if action == 'clear':
-            c.execute("SELECT amount, type FROM transactions WHERE player_id = %s AND game_id = %s",
-                      (player_id, game_id))
-            transactions = c.fetchall()
-            for amount, trans_type in transactions:
-                if trans_type == 'buyin':
-                    c.execute("UPDATE players SET total_buyin = total_buyin - %s WHERE id = %s", (-amount, player_id))
-                elif trans_type == 'rebuy':
-                    c.execute("UPDATE players SET total_rebuys = total_rebuys - %s WHERE id = %s", (-amount, player_id))
-                elif trans_type == 'cashout':
-                    c.execute("UPDATE players SET total_cashout = total_cashout - %s WHERE id = %s",
-                              (amount, player_id))
-            c.execute("DELETE FROM transactions WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-            c.execute("DELETE FROM game_players WHERE player_id = %s AND game_id = %s", (player_id, game_id))
-            c.execute("UPDATE players SET games_played = games_played - 1 WHERE id = %s", (player_id,))
-            conn.commit()
+            event = f"🔄 {name} left game #{game_id}{suits}!"
+            ledger.clear_player(game_id, player_id, notify=game_event_notifications(game_id, event))
             bot.answer_callback_query(call.id, f"{name}'s transactions cleared in game #{game_id}{suits}.")
             bot.edit_message_text(f"✅ {name}'s transactions and participation in game #{game_id} cleared{suits}.",
                                   call.message.chat.id, call.message.message_id)
-            notify_game_players(game_id, f"🔄 {name} left game #{game_id}{suits}!", exclude_telegram_id=None)
+            show_game_event(game_id, event)
             logger.info(f"Admin cleared transactions for player {name} (ID: {player_id}) in game #{game_id}")
         else:
             action_type = 'rebuy' if action == 'rebuy' else 'cashout'
@@ -1112,38 +1588,25 @@ def process_adjust_amount(message, game_id, player_id, action_type, name):
         amount = round(float(message.text.strip()), 1)
         if not (amount > 0 and amount <= 5000):
             raise ValueError("Amount must be from 1 to 5000 (example 20.5).")
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT id FROM games WHERE id = %s AND is_active = TRUE", (game_id,))
-        if not c.fetchone():
+        game = ledger.get_game(game_id)
+        if game is None:
             bot.reply_to(message, "❌ No active game found.")
-            conn.close()
             return
-        c.execute("SELECT id FROM players WHERE id = %s", (player_id,))
-        if not c.fetchone():
+        player = game.players.get(player_id)
+        if player is None:
             bot.reply_to(message, "❌ Invalid player ID.")
-            conn.close()
             return
-        amount_value = -amount if action_type == 'rebuy' else amount
-        c.execute("INSERT INTO transactions (player_id, game_id, amount, type) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING",
-                  (player_id, game_id, amount_value, action_type))
-        if action_type == 'rebuy':
-            c.execute("UPDATE players SET total_rebuys = total_rebuys + %s WHERE id = %s", (amount, player_id))
-        else:
-            c.execute("UPDATE players SET total_cashout = total_cashout + %s WHERE id = %s", (amount, player_id))
-        conn.commit()
-        bot.reply_to(message, f"✅ {name} {action_type} of {amount:.1f}{suits} in game #{game_id}.")
         notification_text = f"💸 {name} rebuy of {amount:.1f}{suits} in game #{game_id}!" if action_type == 'rebuy' else f"💰 {name} cashed out {amount:.1f}{suits} in game #{game_id}!"
-        notify_game_players(game_id, notification_text, exclude_telegram_id=None)
+        ledger.record(game_id, player_id, player.telegram_id, player.name, action_type, amount,
+                      notify=game_event_notifications(game_id, notification_text))
+        bot.reply_to(message, f"✅ {name} {action_type} of {amount:.1f}{suits} in game #{game_id}.")
+        show_game_event(game_id, notification_text)
         logger.info(
             f"Admin processed {action_type} of {amount:.1f} for player {name} (ID: {player_id}) in game #{game_id}")
     except Exception as e:
         print(f"Error in {action_type} amount processing:", e)
         bot.reply_to(message, f"❌ Try again. Number from 1 to 5000 (example 20.5)")
         logger.error(f"Error processing {action_type} amount for player {name} in game #{game_id}: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 @bot.message_handler(commands=['allow_new_game'])
@@ -1154,7 +1617,7 @@ def allow_new_game(message):
         return
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT setting_value FROM settings WHERE setting_name = %s", ('allow_new_game',))
+    queries.execute(c, 'setting_value', ('allow_new_game',))
     current_setting = c.fetchone()
     current_setting = current_setting[0] if current_setting else False
     new_setting = not current_setting
@@ -1174,19 +1637,8 @@ def rename_player(message):
     if message.from_user.id not in ADMINS:
         bot.reply_to(message, "❌ Access denied! Admins only.")
         return
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT id, name FROM players")
-    players = c.fetchall()
-    if not players:
-        bot.reply_to(message, "❌ No players found.")
-        conn.close()
-        return
-    keyboard = telebot.types.InlineKeyboardMarkup()
-    for player_id, name in players:
-        keyboard.add(telebot.types.InlineKeyboardButton(text=name, callback_data=f"rename_{player_id}"))
-    bot.reply_to(message, "Select a player to rename:", reply_markup=keyboard)
-    conn.close()
+    text, keyboard = player_picker.render('rn', search=picker_search(message))
+    bot.reply_to(message, text, reply_markup=keyboard)
     logger.info(f"Admin (Telegram ID: {message.from_user.id}) initiated player renaming")
 
 
@@ -1236,6 +1688,7 @@ def process_rename(message, player_id, old_name):
             return
         c.execute("UPDATE players SET name = %s WHERE id = %s", (new_name, player_id))
         conn.commit()
+        ledger.rename_player(player_id, new_name)
         bot.reply_to(message, f"✅ Player {old_name} renamed to {new_name}{suits}.")
         logger.info(f"Admin renamed player {old_name} (ID: {player_id}) to {new_name}")
     except Exception as e:
@@ -1247,6 +1700,81 @@ def process_rename(message, player_id, old_name):
             conn.close()
 
 
+@bot.message_handler(commands=['export'])
+@safe_handler
+def export_ledger(message):
+    """Send players, games and transactions as files: /export [csv|parquet] [since] [until]"""
+    if message.from_user.id not in ADMINS:
+        bot.reply_to(message, "❌ Access denied! Admins only.")
+        return
+    args = message.text.split()[1:]
+    fmt = args[0] if args and args[0] in export.EXPORT_FORMATS else 'csv'
+    dates = [date.fromisoformat(arg) for arg in args if arg not in export.EXPORT_FORMATS][:2]
+    export_filter = export.ExportFilter(*dates)
+    chat_id = message.chat.id
+    key = f"export_{chat_id}_{fmt}_{'_'.join(map(str, dates))}"
+    report_jobs.submit(message, key, lambda: send_export(chat_id, fmt, export_filter))
+    logger.info(f"Admin (Telegram ID: {message.from_user.id}) requested a {fmt} export {dates}")
+
+
+def send_export(chat_id, fmt, export_filter):
+    """Export the ledger into a temporary directory and send every file as a document."""
+    with tempfile.TemporaryDirectory(prefix="pokerbot-export-") as directory:
+        conn = get_db_connection()
+        try:
+            paths = export.run_export(conn, directory, fmt, export_filter)
+        finally:
+            conn.close()
+        for path in paths:
+            with open(path, 'rb') as f:
+                bot.send_document(chat_id, f, visible_file_name=os.path.basename(path))
+    return f"✅ Exported {len(paths)} file(s)."
+
+
+# Inline mode: "@bot name" looks up players, "@bot #12" a game
+inline_cache = inline.TTLCache()
+
+
+def inline_cards(query):
+    """Result cards for a normalized inline query, from the cache when possible"""
+    cards = inline_cache.get(query)
+    if cards is not None:
+        return cards
+    # Stay inside Telegram's inline latency budget even when the database is slow
+    with report_cursor(INLINE_STATEMENT_TIMEOUT_MS) as c:
+        game_id = inline.parse_game_id(query)
+        if game_id is not None:
+            game = ledger.get_game(game_id)
+            card = inline.game_card(c, game_id, live_bank=game.bank if game else None)
+            cards = [card] if card else []
+        else:
+            cards = inline.player_cards(c, query)
+    inline_cache.put(query, cards)
+    return cards
+
+
+@bot.inline_handler(func=lambda query: True)
+def handle_inline_query(inline_query):
+    query = inline.normalize_query(inline_query.query)
+    if not query:
+        bot.answer_inline_query(inline_query.id, [], cache_time=inline.INLINE_CACHE_SECONDS)
+        return
+    try:
+        cards = inline_cards(query)
+    except Exception as e:
+        logger.error(f"Error answering inline query '{query}': {e}")
+        # Let Telegram ask again instead of caching the failure
+        bot.answer_inline_query(inline_query.id, [], cache_time=0)
+        return
+    results = [
+        telebot.types.InlineQueryResultArticle(
+            id=result_id, title=title, description=description,
+            input_message_content=telebot.types.InputTextMessageContent(text))
+        for result_id, title, description, text in cards
+    ]
+    bot.answer_inline_query(inline_query.id, results, cache_time=inline.INLINE_CACHE_SECONDS)
+
+
 # Notify all registered players about a new game
 def notify_all_players_new_game(game_id, creator_name):
     """Send notification to all registered players about new game creation."""
@@ -1273,35 +1801,113 @@ def notify_all_players_new_game(game_id, creator_name):
 
 
 # Notify all game participants about an action
-def notify_game_players(game_id, message_text, exclude_telegram_id=None):
-    """Send notification to all players in the specified game, excluding the specified telegram_id if provided."""
+# Notifications are stored in notification_outbox and delivered by this dispatcher
+outbox_dispatcher = outbox.OutboxDispatcher(get_db_connection, bot.send_message, max_length=TELEGRAM_MESSAGE_LIMIT)
+
+
+def game_notifications(game_id, message_text, exclude_telegram_id=None):
+    """Outbox rows (chat_id, text) for every player in the game, or [] when notifications are disabled."""
     if not are_notifications_enabled():
         logger.info(f"Notifications disabled, skipping notification for game #{game_id}: {message_text}")
-        return
+        return []
+    # Live games know their participants; ended ones are looked up
+    recipients = ledger.player_telegram_ids(game_id)
+    if recipients is None:
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            queries.execute(c, 'game_player_telegram_ids', (game_id,))
+            recipients = [row[0] for row in c.fetchall()]
+        finally:
+            conn.close()
+    return [(telegram_id, message_text) for telegram_id in recipients
+            if not (exclude_telegram_id and telegram_id == exclude_telegram_id)]
+
+
+def notify_game_players(game_id, message_text, exclude_telegram_id=None):
+    """Queue a notification to all players in the specified game, excluding the specified telegram_id if provided."""
     try:
+        messages = game_notifications(game_id, message_text, exclude_telegram_id)
+        if not messages:
+            return
         conn = get_db_connection()
-        c = conn.cursor()
-        c.execute("""
-            SELECT p.telegram_id 
-            FROM players p 
-            JOIN game_players gp ON p.id = gp.player_id 
-            WHERE gp.game_id = %s
-        """, (game_id,))
-        players = c.fetchall()
-        for player in players:
-            telegram_id = player[0]
-            if exclude_telegram_id and telegram_id == exclude_telegram_id:
-                continue
-            try:
-                bot.send_message(telegram_id, message_text)
-            except Exception as e:
-                logger.error(f"Failed to notify player {telegram_id} for game #{game_id}: {e}")
-        logger.info(f"Notified game #{game_id} players: {message_text}")
+        try:
+            outbox.enqueue(conn.cursor(), game_id, messages)
+            conn.commit()
+        finally:
+            conn.close()
+        outbox_dispatcher.wake()
+        logger.info(f"Queued notification for game #{game_id} players: {message_text}")
     except Exception as e:
         logger.error(f"Error notifying game #{game_id} players: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+
+def game_event_notifications(game_id, message_text, exclude_telegram_id=None):
+    """Outbox rows announcing a game action, handed to the ledger with the change itself.
+
+    None are needed while the live scoreboard shows the actions instead.
+    """
+    try:
+        if is_live_scoreboard_enabled():
+            return []
+        return game_notifications(game_id, message_text, exclude_telegram_id)
+    except Exception as e:
+        logger.error(f"Error preparing notifications for game #{game_id}: {e}")
+        return []
+
+
+def show_game_event(game_id, message_text):
+    """Put an applied game action on the live scoreboard when it is enabled."""
+    if is_live_scoreboard_enabled():
+        live_scoreboard.touch(game_id, message_text)
+
+
+def render_scoreboard(game_id, events):
+    """Scoreboard text: the game results followed by as many of the latest actions as fit."""
+    text = format_game_results(game_id)
+    if text is None:
+        return None
+    events = list(events)
+    while events:
+        board = text + "\n\n🕒 Latest:\n" + "\n".join(events)
+        if len(board) <= TELEGRAM_MESSAGE_LIMIT:
+            return board
+        events.pop(0)
+    if len(text) > TELEGRAM_MESSAGE_LIMIT:
+        # One message edited in place cannot be split; say where the rest is
+        note = "\n… cut to fit, /game_results shows it all"
+        cut = text.rfind("\n", 0, TELEGRAM_MESSAGE_LIMIT - len(note))
+        text = text[:cut if cut > 0 else TELEGRAM_MESSAGE_LIMIT - len(note)] + note
+    return text
+
+
+def scoreboard_chats(game_id):
+    """The group the game was created in, plus every participant when notifications are on."""
+    game = ledger.get_game(game_id)
+    if game is None:
+        return []
+    chats = [game.chat_id] if game.chat_id and game.chat_id < 0 else []
+    if are_notifications_enabled():
+        chats += ledger.player_telegram_ids(game_id) or []
+    return chats
+
+
+# One message per chat and game, edited at most once per debounce window
+live_scoreboard = scoreboard.Scoreboard(bot, render_scoreboard, scoreboard_chats)
+
+
+def is_live_scoreboard_enabled():
+    """Check the live_scoreboard setting in the database."""
+    try:
+        conn = get_db_connection()
+        c = conn.cursor()
+        queries.execute(c, 'setting_value', ('live_scoreboard',))
+        result = c.fetchone()
+        conn.close()
+        return result[0] if result else False
+    except Exception as e:
+        logger.error(f"Error checking live scoreboard setting: {e}")
+        return False
 
 
 def are_notifications_enabled():
@@ -1309,7 +1915,7 @@ def are_notifications_enabled():
     try:
         conn = get_db_connection()
         c = conn.cursor()
-        c.execute("SELECT setting_value FROM settings WHERE setting_name = %s", ('send_notifications',))
+        queries.execute(c, 'setting_value', ('send_notifications',))
         result = c.fetchone()
         conn.close()
         return result[0] if result else True  # Default to True if setting not found
@@ -1327,7 +1933,7 @@ def notifications_switcher(message):
         return
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT setting_value FROM settings WHERE setting_name = %s", ('send_notifications',))
+    queries.execute(c, 'setting_value', ('send_notifications',))
     current_setting = c.fetchone()
     current_setting = current_setting[0] if current_setting else True
     new_setting = not current_setting
@@ -1339,6 +1945,127 @@ def notifications_switcher(message):
     logger.info(f"Admin (Telegram ID: {message.from_user.id}) set notifications to {status}")
 
 
+@bot.message_handler(commands=['scoreboard_switcher'])
+@safe_handler
+def scoreboard_switcher(message):
+    """Toggle the live_scoreboard setting: one edited message per chat instead of per-action notifications."""
+    if message.from_user.id not in ADMINS:
+        bot.reply_to(message, "❌ Access denied! Admins only.")
+        return
+    conn = get_db_connection()
+    c = conn.cursor()
+    queries.execute(c, 'setting_value', ('live_scoreboard',))
+    current_setting = c.fetchone()
+    current_setting = current_setting[0] if current_setting else False
+    new_setting = not current_setting
+    c.execute("UPDATE settings SET setting_value = %s WHERE setting_name = %s", (new_setting, 'live_scoreboard'))
+    conn.commit()
+    status = "enabled" if new_setting else "disabled"
+    bot.reply_to(message, f"✅ Live scoreboard {status}.")
+    conn.close()
+    logger.info(f"Admin (Telegram ID: {message.from_user.id}) set live scoreboard to {status}")
+
+
+@bot.message_handler(commands=['http_stats'])
+@safe_handler
+def http_stats(message):
+    """Latency, errors and keep-alive reuse of Bot API calls since startup."""
+    if message.from_user.id not in ADMINS:
+        bot.reply_to(message, "❌ Access denied! Admins only.")
+        return
+    rows = bot_http.stats.snapshot()
+    if not rows:
+        bot.reply_to(message, "No Bot API calls yet.")
+        return
+    response = f"🌐 Bot API calls ({bot_http.pool_size} keep-alive connections):\n"
+    response += f"{'Method':<20} | {'Calls':<6} | {'Err':<4} | {'Reuse':<6} | {'Avg ms':<7} | {'Max ms':<7}\n"
+    response += "-" * 64 + "\n"
+    for method, calls, errors, reuse, average, longest in rows:
+        response += f"{method[:20]:<20} | {calls:<6} | {errors:<4} | {reuse:<5.0f}% | {average:<7.0f} | {longest:<7.0f}\n"
+    reply_long(message, response)
+
+
+@bot.message_handler(commands=['ingress_stats'])
+@safe_handler
+def ingress_stats(message):
+    """Counters of allowed, rate limited and shed updates per class, with the current load."""
+    if message.from_user.id not in ADMINS:
+        bot.reply_to(message, "❌ Access denied! Admins only.")
+        return
+    counters, queue_depth, latency = ingress_control.snapshot()
+    response = (f"🚦 Ingress (queue {queue_depth}, DB connection {latency * 1000:.0f} ms, "
+                f"load {ingress_control.load():.2f}):\n")
+    for (kind, outcome), count in counters:
+        response += f"{kind:<10} {outcome:<8} {count}\n"
+    bot.reply_to(message, response)
+
+
+@bot.message_handler(commands=['ledger_retry'])
+@safe_handler
+def ledger_retry(message):
+    """Queue another attempt at the ledger changes parked in ledger_dead_letters."""
+    if message.from_user.id not in ADMINS:
+        bot.reply_to(message, "❌ Access denied! Admins only.")
+        return
+    parked = ledger.parked_games()
+    if not parked:
+        bot.reply_to(message, "✅ No parked ledger changes.")
+        return
+    args = message.text.split()[1:]
+    game_ids = [int(args[0].lstrip('#'))] if args and args[0].lstrip('#').isdigit() else sorted(parked)
+    retried = [game_id for game_id in game_ids if ledger.retry_parked(game_id)]
+    if not retried:
+        bot.reply_to(message, f"❌ Nothing parked for that game. Parked: " +
+                     ", ".join(f"#{game_id} ({count})" for game_id, count in sorted(parked.items())))
+        return
+    bot.reply_to(message, f"🔁 Retrying parked changes of game(s) {', '.join(f'#{game_id}' for game_id in retried)}; "
+                          f"the result is sent to admins.")
+    logger.info(f"Admin (Telegram ID: {message.from_user.id}) retried parked ledger changes of {retried}")
+
+
+@bot.message_handler(commands=['profile'])
+@safe_handler
+def profile(message):
+    """Profile update processing for N seconds ("/profile 60") or N updates ("/profile 200u")."""
+    if message.from_user.id not in ADMINS:
+        bot.reply_to(message, "❌ Access denied! Admins only.")
+        return
+    args = message.text.split()[1:]
+    if args and args[0] == 'stop':
+        if not update_profiler.stop():
+            bot.reply_to(message, "ℹ️ No profiling session is running.")
+        return
+    seconds, updates = profiler.PROFILE_DEFAULT_SECONDS, None
+    try:
+        if args and args[0].endswith('u'):
+            seconds, updates = profiler.PROFILE_MAX_SECONDS, int(args[0][:-1])
+        elif args:
+            seconds = int(args[0].rstrip('s'))
+    except ValueError:
+        bot.reply_to(message, "Usage: /profile [seconds | Nu | stop]")
+        return
+    chat_id = message.chat.id
+    session = update_profiler.start(lambda session: send_profile(chat_id, session), seconds, updates)
+    if session is None:
+        bot.reply_to(message, "⏳ A profiling session is already running, /profile stop ends it.")
+        return
+    limit = f"{updates} update(s) or {session.seconds}s" if updates else f"{session.seconds}s"
+    bot.reply_to(message, f"🔬 Profiling update processing for {limit}...")
+    logger.info(f"Admin (Telegram ID: {message.from_user.id}) started profiling for {limit}")
+
+
+def send_profile(chat_id, session):
+    """Send a finished profiling session as a collapsed stack file with a per-handler summary."""
+    caption = (f"🔬 {session.samples} sample(s), {session.processed} update(s), {session.elapsed:.0f}s\n" +
+               "\n".join(f"{handler}: {count / session.samples * 100:.0f}%"
+                         for handler, count in session.by_handler()[:profiler.PROFILE_TOP_HANDLERS]))
+    if not session.samples:
+        bot.send_message(chat_id, caption)
+        return
+    name = f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+    bot.send_document(chat_id, session.collapsed().encode(), visible_file_name=name, caption=caption)
+
+
 # Handler for admin command to delete the database
 @bot.message_handler(commands=['DELETE_DB'])
 @safe_handler
@@ -1360,6 +2087,8 @@ def process_delete_db_confirmation(message):
             bot.reply_to(message, "❌ Database deletion cancelled.")
             logger.info(f"Admin (Telegram ID: {message.from_user.id}) cancelled database deletion")
             return
+        # Pending writes would target the tables that are about to disappear
+        ledger.reset()
         conn = get_db_connection()
         c = conn.cursor()
         # Drop all tables
@@ -1385,7 +2114,12 @@ def process_delete_db_confirmation(message):
 
 # Start bot
 if __name__ == '__main__':
+    from migrations import schedule_partition_maintenance
+
     init_db()
+    schedule_partition_maintenance()
+    outbox_dispatcher.start()
+    live_scoreboard.start()
     if not os.getenv("RAILWAY_ENVIRONMENT"):
         bot.remove_webhook()
-        bot.polling()
\ No newline at end of file
+        bot.polling(allowed_updates=prefilter.ALLOWED_UPDATES)
\ No newline at end of file
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Profit charts for PokerBot
+Renders cumulative profit PNGs in a separate process pool and caches them on
+disk, keyed by player and ledger watermark, together with their Telegram file_id
+"""
+
+import os
+import glob
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Relative paths are taken from the bot's directory, not from wherever a process was started
+CHART_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv("CHART_CACHE_DIR", "charts"))
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "1"))
+CHART_TIMEOUT_SECONDS = int(os.getenv("CHART_TIMEOUT_SECONDS", "60"))
+CHART_MAX_PLAYERS = 10
+
+
+def render_chart(path, title, series):
+    """Draw [(label, games, balances)] lines into a PNG at `path`; runs in a worker process"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 4.5), dpi=100)
+    for label, games, balances in series:
+        ax.plot(games, balances, label=label, linewidth=1.5, marker="o" if len(games) < 30 else None, markersize=3)
+    ax.axhline(0, color="grey", linewidth=0.8)
+    ax.set_title(title)
+    ax.set_xlabel("Game")
+    ax.set_ylabel("Cumulative profit")
+    ax.grid(alpha=0.3)
+    if len(series) > 1:
+        ax.legend(fontsize="small", loc="upper left")
+    fig.tight_layout()
+    # Written aside and renamed, so a half-written file is never served
+    partial = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(partial, format="png")
+    plt.close(fig)
+    os.replace(partial, path)
+    return path
+
+
+class ChartCache:
+    """Rendered charts on disk plus the file_id Telegram assigned to each of them"""
+
+    def __init__(self, directory=CHART_CACHE_DIR, workers=CHART_WORKERS):
+        self.directory = directory
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def _executor(self):
+        with self.lock:
+            if self.pool is None:
+                try:
+                    import matplotlib  # noqa: F401
+                except ImportError:
+                    raise RuntimeError("Charts need matplotlib: pip install matplotlib")
+                os.makedirs(self.directory, exist_ok=True)
+                # spawn, not fork: the bot process runs threads (ledger writer, outbox, HTTP
+                # pool) whose locks a forked child could inherit held. Workers import this
+                # module and the entry script again: main.py and run_local.py do nothing at
+                # import time; bot.py builds its objects (the TeleBot with its idle handler
+                # threads among them) but starts no background worker and opens no connection
+                self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
+
+    def path(self, key, watermark):
+        count, last_game = watermark
+        return os.path.join(self.directory, f"{key}_{count}_{last_game}.png")
+
+    def file_id(self, key, watermark):
+        """Telegram file_id of an already uploaded chart, or None"""
+        try:
+            with open(self.path(key, watermark) + ".id", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def remember(self, key, watermark, file_id):
+        with open(self.path(key, watermark) + ".id", "w", encoding="utf-8") as f:
+            f.write(file_id)
+
+    def forget(self, key, watermark):
+        """Drop a file_id Telegram no longer accepts; the PNG is uploaded again"""
+        try:
+            os.remove(self.path(key, watermark) + ".id")
+        except OSError:
+            pass
+
+    def render(self, key, watermark, title, series, timeout=CHART_TIMEOUT_SECONDS):
+        """Path of the chart for (key, watermark), rendering it in the pool if needed"""
+        path = self.path(key, watermark)
+        if os.path.exists(path):
+            return path
+        future = self._executor().submit(render_chart, path, title, series)
+        future.result(timeout=timeout)
+        logger.info(f"Rendered chart {path}")
+        self._prune(key, path)
+        return path
+
+    def _prune(self, key, current):
+        """Remove charts of `key` rendered for older watermarks"""
+        for stale in glob.glob(os.path.join(glob.escape(self.directory), f"{glob.escape(key)}_*.png*")):
+            if not stale.startswith(current):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
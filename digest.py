@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Notification digests for PokerBot
+Notifications for one recipient that are due together are sent as one
+message; pack() groups them and split() cuts a single oversized text so
+every message fits into Telegram's limit
+"""
+
+import os
+
+NOTIFY_DIGEST_SECONDS = float(os.getenv("NOTIFY_DIGEST_SECONDS", "2"))
+NOTIFY_DIGEST_MAX_EVENTS = int(os.getenv("NOTIFY_DIGEST_MAX_EVENTS", "20"))
+DIGEST_SEPARATOR = "\n\n"
+
+
+def pack(texts, max_length=4096):
+    """Group consecutive texts into digests of at most `max_length` characters; returns lists of indexes.
+
+    A single text longer than the limit gets a digest of its own; split() cuts it
+    into messages when it is sent.
+    """
+    digests = []
+    length = 0
+    for i, text in enumerate(texts):
+        if digests and length + len(DIGEST_SEPARATOR) + len(text) <= max_length:
+            digests[-1].append(i)
+            length += len(DIGEST_SEPARATOR) + len(text)
+        else:
+            digests.append([i])
+            length = len(text)
+    return digests
+
+
+def join(texts):
+    return DIGEST_SEPARATOR.join(texts)
+
+
+def split(text, max_length=4096):
+    """Cut `text` into messages of at most `max_length` characters, at line breaks where possible"""
+    parts = []
+    while len(text) > max_length:
+        cut = text.rfind("\n", 0, max_length + 1)
+        if cut <= 0:
+            cut = max_length
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text or not parts:
+        parts.append(text)
+    return parts
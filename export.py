@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Ledger export for PokerBot
+Streams players, games and transactions to CSV (COPY ... TO STDOUT) or
+Parquet (server-side cursor, one row group per batch) with constant memory
+"""
+
+import os
+import argparse
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+EXPORT_TABLES = ("players", "games", "transactions")
+EXPORT_FORMATS = ("csv", "parquet")
+
+# Columns of each exported table; transactions are filtered on created_at so
+# only the partitions in the requested range are read
+EXPORT_COLUMNS = {
+    "players": ["id", "telegram_id", "name", "games_played", "total_buyin", "total_rebuys", "total_cashout"],
+    "games": ["id", "date", "is_active", "creator_id", "chat_id", "ended_at"],
+    "transactions": ["id", "player_id", "game_id", "amount", "type", "created_at"],
+}
+DATE_COLUMN = {"games": "date", "transactions": "created_at"}
+GAME_COLUMN = {"games": "id", "transactions": "game_id"}
+
+
+class ExportFilter:
+    """Optional date range (inclusive, by day) and game id range of an export"""
+
+    def __init__(self, since=None, until=None, first_game=None, last_game=None):
+        self.since = since
+        self.until = until
+        self.first_game = first_game
+        self.last_game = last_game
+
+    def where(self, cursor, table):
+        """WHERE clause for `table` with literals bound through `cursor`"""
+        conditions = []
+        date_column = DATE_COLUMN.get(table)
+        if date_column and self.since:
+            conditions.append(cursor.mogrify(f"{date_column} >= %s", (self.since,)).decode())
+        if date_column and self.until:
+            conditions.append(cursor.mogrify(f"{date_column} < %s::date + 1", (self.until,)).decode())
+        game_column = GAME_COLUMN.get(table)
+        if game_column and self.first_game is not None:
+            conditions.append(cursor.mogrify(f"{game_column} >= %s", (self.first_game,)).decode())
+        if game_column and self.last_game is not None:
+            conditions.append(cursor.mogrify(f"{game_column} <= %s", (self.last_game,)).decode())
+        return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def export_query(cursor, table, export_filter):
+    return f"SELECT {', '.join(EXPORT_COLUMNS[table])} FROM {table}{export_filter.where(cursor, table)}"
+
+
+def _parquet_schema(table):
+    import pyarrow as pa
+    amount = pa.decimal128(10, 1)
+    return {
+        "players": pa.schema([("id", pa.int32()), ("telegram_id", pa.int64()), ("name", pa.string()),
+                              ("games_played", pa.int32()), ("total_buyin", amount),
+                              ("total_rebuys", amount), ("total_cashout", amount)]),
+        "games": pa.schema([("id", pa.int32()), ("date", pa.timestamp("us")), ("is_active", pa.bool_()),
+                            ("creator_id", pa.int64()), ("chat_id", pa.int64()), ("ended_at", pa.timestamp("us"))]),
+        "transactions": pa.schema([("id", pa.int32()), ("player_id", pa.int32()), ("game_id", pa.int32()),
+                                   ("amount", amount), ("type", pa.string()), ("created_at", pa.timestamp("us"))]),
+    }[table]
+
+
+def export_csv(connection, table, path, export_filter):
+    """Stream one table to CSV with COPY; returns bytes written"""
+    with connection.cursor() as c, open(path, "w", encoding="utf-8", newline="") as f:
+        c.copy_expert(f"COPY ({export_query(c, table, export_filter)}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+        return f.tell()
+
+
+def export_parquet(connection, table, path, export_filter, batch_rows=EXPORT_BATCH_ROWS):
+    """Stream one table to Parquet through a named cursor; returns rows written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(table)
+    rows_written = 0
+    with connection.cursor() as c:
+        query = export_query(c, table, export_filter)
+    cursor = connection.cursor(name=f"export_{table}")
+    cursor.itersize = batch_rows
+    try:
+        cursor.execute(query)
+        with pq.ParquetWriter(path, schema) as writer:
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                columns = list(zip(*rows))
+                writer.write_batch(pa.RecordBatch.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+                rows_written += len(rows)
+    finally:
+        cursor.close()
+    return rows_written
+
+
+def run_export(connection, directory, fmt="csv", export_filter=None, tables=EXPORT_TABLES):
+    """Export `tables` into `directory` from one consistent snapshot; returns the file paths"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt}, expected one of {', '.join(EXPORT_FORMATS)}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    export_filter = export_filter or ExportFilter()
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    connection.autocommit = False
+    try:
+        with connection.cursor() as c:
+            # Every table comes from the same snapshot, so the files agree with each other
+            c.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        for table in tables:
+            path = os.path.join(directory, f"{table}.{fmt}")
+            if fmt == "csv":
+                size = export_csv(connection, table, path, export_filter)
+                logger.info(f"Exported {table} to {path} ({size} bytes)")
+            else:
+                rows = export_parquet(connection, table, path, export_filter)
+                logger.info(f"Exported {rows} {table} row(s) to {path}")
+            paths.append(path)
+    finally:
+        connection.rollback()
+    return paths
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export players, games and transactions")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--output", default="export", help="directory to write the files to")
+    parser.add_argument("--since", type=date.fromisoformat, help="first day to export, YYYY-MM-DD")
+    parser.add_argument("--until", type=date.fromisoformat, help="last day to export, YYYY-MM-DD")
+    parser.add_argument("--first-game", type=int, help="lowest game id to export")
+    parser.add_argument("--last-game", type=int, help="highest game id to export")
+    parser.add_argument("--tables", nargs="+", choices=EXPORT_TABLES, default=list(EXPORT_TABLES))
+    args = parser.parse_args()
+
+    from bot import get_db_connection
+
+    connection = get_db_connection()
+    try:
+        files = run_export(connection, args.output, args.format,
+                           ExportFilter(args.since, args.until, args.first_game, args.last_game), args.tables)
+    finally:
+        connection.close()
+    print("\n".join(files))
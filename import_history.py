@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Bulk import of historical games for PokerBot
+Validates a CSV of past games, COPYs it into a staging table and merges it
+into players, games, game_players and transactions with set-based statements
+"""
+
+import io
+import csv
+import sys
+import argparse
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from bot import get_db_connection, ADMINS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ("game_ref", "game_date", "player_name", "type", "amount")
+OPTIONAL_COLUMNS = ("telegram_id", "created_at")
+TRANSACTION_TYPES = ("buyin", "rebuy", "cashout")
+MAX_REPORTED_ERRORS = 20
+# Largest value of the NUMERIC(10,1) amount column
+MAX_AMOUNT = Decimal("999999999.9")
+MAX_TELEGRAM_ID = 2 ** 63 - 1
+
+STAGING_TABLE = """
+    CREATE TEMP TABLE import_rows (
+        line_number SERIAL,
+        game_ref TEXT NOT NULL,
+        game_date TIMESTAMP NOT NULL,
+        player_name TEXT NOT NULL,
+        telegram_id BIGINT,
+        type TEXT NOT NULL,
+        amount NUMERIC(10,1) NOT NULL,
+        created_at TIMESTAMP,
+        player_id INTEGER,
+        game_id INTEGER
+    ) ON COMMIT DROP
+"""
+
+
+def clean_rows(reader):
+    """Rows of a DictReader with known columns only and surrounding whitespace stripped"""
+    for row in reader:
+        yield {column: (row.get(column) or "").strip() for column in reader.fieldnames
+               if column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS}
+
+
+def validate_csv(path):
+    """Check every row of the file; returns (header, row count, errors)"""
+    errors = []
+    rows = 0
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        header = reader.fieldnames or []
+        missing = [column for column in REQUIRED_COLUMNS if column not in header]
+        unknown = [column for column in header if column not in REQUIRED_COLUMNS + OPTIONAL_COLUMNS]
+        if missing:
+            errors.append(f"missing column(s): {', '.join(missing)}")
+        if unknown:
+            errors.append(f"unknown column(s): {', '.join(unknown)}")
+        if errors:
+            return header, 0, errors
+
+        for row in clean_rows(reader):
+            rows += 1
+            line = reader.line_num
+            problems = []
+            if not row["game_ref"]:
+                problems.append("empty game_ref")
+            if not row["player_name"]:
+                problems.append("empty player_name")
+            if row["type"] not in TRANSACTION_TYPES:
+                problems.append(f"type must be one of {', '.join(TRANSACTION_TYPES)}")
+            try:
+                amount = Decimal(row["amount"])
+                if not amount.is_finite():
+                    problems.append(f"bad amount {row['amount']!r}")
+                elif not 0 < amount <= MAX_AMOUNT:
+                    problems.append(f"amount must be positive and at most {MAX_AMOUNT}")
+            except InvalidOperation:
+                problems.append(f"bad amount {row['amount']!r}")
+            for column in ("game_date", "created_at"):
+                value = row.get(column)
+                if value:
+                    try:
+                        datetime.fromisoformat(value)
+                    except ValueError:
+                        problems.append(f"bad {column} {value!r}")
+                elif column == "game_date":
+                    problems.append("empty game_date")
+            telegram_id = row.get("telegram_id")
+            if telegram_id and not (telegram_id.lstrip("-").isdigit() and abs(int(telegram_id)) <= MAX_TELEGRAM_ID):
+                problems.append(f"bad telegram_id {telegram_id!r}")
+            if problems:
+                errors.append(f"line {line}: {'; '.join(problems)}")
+                if len(errors) >= MAX_REPORTED_ERRORS:
+                    errors.append("too many errors, stopped checking")
+                    break
+    return header, rows, errors
+
+
+def load_staging(cursor, path, header):
+    """COPY the file into the import_rows staging table, exactly as validate_csv saw it"""
+    cursor.execute(STAGING_TABLE)
+    buffer = io.StringIO()
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        # Stripped here too: what was validated is what gets loaded; empty fields load as NULL
+        writer = csv.DictWriter(buffer, fieldnames=header)
+        writer.writerows(clean_rows(reader))
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY import_rows ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def resolve_players(cursor):
+    """Create players with a new telegram_id, then map every row to a player id.
+
+    Rows without telegram_id are matched by name; returns names that matched no
+    player or more than one.
+    """
+    cursor.execute("""
+        INSERT INTO players (telegram_id, name)
+        SELECT DISTINCT ON (telegram_id) telegram_id, player_name
+        FROM import_rows
+        WHERE telegram_id IS NOT NULL
+        ORDER BY telegram_id, line_number
+        ON CONFLICT (telegram_id) DO NOTHING
+    """)
+    logger.info(f"Created {cursor.rowcount} new player(s)")
+
+    cursor.execute("""
+        UPDATE import_rows r SET player_id = p.id
+        FROM players p
+        WHERE r.telegram_id IS NOT NULL AND p.telegram_id = r.telegram_id
+    """)
+    cursor.execute("""
+        UPDATE import_rows r SET player_id = m.id
+        FROM (
+            SELECT lower(name) AS name, MIN(id) AS id
+            FROM players
+            GROUP BY lower(name)
+            HAVING COUNT(*) = 1
+        ) m
+        WHERE r.telegram_id IS NULL AND m.name = lower(r.player_name)
+    """)
+    cursor.execute("SELECT DISTINCT player_name FROM import_rows WHERE player_id IS NULL ORDER BY 1")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def merge_games(cursor, creator_id):
+    """Create games for refs not imported before; returns (new games, refs skipped)"""
+    cursor.execute("""
+        CREATE TEMP TABLE import_games ON COMMIT DROP AS
+        SELECT game_ref,
+               nextval(pg_get_serial_sequence('games', 'id'))::int AS game_id,
+               -- Per-game queries only look at transactions from games.date - 1 day on,
+               -- so a row stamped before its game_date moves the game's date back
+               MIN(LEAST(game_date, COALESCE(created_at, game_date))) AS date,
+               MAX(COALESCE(created_at, game_date)) AS ended_at
+        FROM import_rows
+        WHERE game_ref NOT IN (SELECT source_ref FROM imported_games)
+        GROUP BY game_ref
+    """)
+    new_games = cursor.rowcount
+    cursor.execute("SELECT COUNT(DISTINCT game_ref) FROM import_rows WHERE game_ref IN (SELECT source_ref FROM imported_games)")
+    skipped = cursor.fetchone()[0]
+
+    cursor.execute("""
+        INSERT INTO games (id, date, is_active, creator_id, chat_id, ended_at)
+        SELECT game_id, date, FALSE, %s, %s, ended_at FROM import_games
+    """, (creator_id, creator_id))
+    cursor.execute("INSERT INTO imported_games (source_ref, game_id) SELECT game_ref, game_id FROM import_games")
+    cursor.execute("UPDATE import_rows r SET game_id = g.game_id FROM import_games g WHERE g.game_ref = r.game_ref")
+    return new_games, skipped
+
+
+def merge_rows(cursor):
+    """Insert memberships and transactions of the new games; returns transactions inserted"""
+    cursor.execute("""
+        SELECT MIN(COALESCE(created_at, game_date))::date, MAX(COALESCE(created_at, game_date))::date
+        FROM import_rows WHERE game_id IS NOT NULL
+    """)
+    first_day, last_day = cursor.fetchone()
+    if first_day is None:
+        return 0
+    # Historical months get their own partitions instead of piling into the default one
+    cursor.execute("SELECT create_transactions_partitions(%s, %s)", (first_day, last_day))
+
+    cursor.execute("""
+        INSERT INTO game_players (player_id, game_id, joined_at)
+        SELECT player_id, game_id, MIN(COALESCE(created_at, game_date))
+        FROM import_rows
+        WHERE game_id IS NOT NULL
+        GROUP BY player_id, game_id
+        ON CONFLICT (player_id, game_id) DO NOTHING
+    """)
+    # Money put into the game is stored as a negative amount
+    cursor.execute("""
+        INSERT INTO transactions (player_id, game_id, amount, type, created_at)
+        SELECT player_id, game_id,
+               CASE WHEN type IN ('buyin', 'rebuy') THEN -amount ELSE amount END,
+               type, COALESCE(created_at, game_date)
+        FROM import_rows
+        WHERE game_id IS NOT NULL
+        ORDER BY line_number
+    """)
+    return cursor.rowcount
+
+
+def recompute_totals(cursor):
+    """Recompute the denormalized counters of every imported player, once"""
+    cursor.execute("""
+        WITH affected AS (
+            SELECT DISTINCT player_id FROM import_rows WHERE game_id IS NOT NULL
+        ), ledger AS (
+            SELECT t.player_id,
+                   SUM(CASE WHEN t.type = 'buyin' THEN -t.amount ELSE 0 END) AS total_buyin,
+                   SUM(CASE WHEN t.type = 'cashout' THEN t.amount ELSE 0 END) AS total_cashout,
+                   SUM(CASE WHEN t.type = 'rebuy' THEN -t.amount ELSE 0 END) AS total_rebuys
+            FROM transactions t
+            WHERE t.player_id IN (SELECT player_id FROM affected)
+            GROUP BY t.player_id
+        ), played AS (
+            SELECT gp.player_id, COUNT(*) AS games_played, MAX(g.date) AS last_game_date
+            FROM game_players gp
+            JOIN games g ON g.id = gp.game_id
+            WHERE gp.player_id IN (SELECT player_id FROM affected)
+            GROUP BY gp.player_id
+        )
+        UPDATE players p
+        SET total_buyin = COALESCE(l.total_buyin, 0),
+            total_cashout = COALESCE(l.total_cashout, 0),
+            total_rebuys = COALESCE(l.total_rebuys, 0),
+            games_played = pl.games_played,
+            last_game_date = pl.last_game_date
+        FROM played pl
+        LEFT JOIN ledger l ON l.player_id = pl.player_id
+        WHERE p.id = pl.player_id
+    """)
+    return cursor.rowcount
+
+
+def run_import(path, creator_id, dry_run=False):
+    """Validate and import `path` in one transaction; returns True on success"""
+    header, rows, errors = validate_csv(path)
+    if errors:
+        for error in errors:
+            logger.error(error)
+        return False
+    logger.info(f"{path}: {rows} valid row(s)")
+
+    connection = get_db_connection()
+    try:
+        connection.autocommit = False
+        with connection.cursor() as c:
+            load_staging(c, path, header)
+            unresolved = resolve_players(c)
+            if unresolved:
+                logger.error(f"No unique registered player for: {', '.join(unresolved)}. "
+                             f"Add a telegram_id column for them or register them first.")
+                connection.rollback()
+                return False
+            new_games, skipped = merge_games(c, creator_id)
+            if skipped:
+                logger.info(f"Skipping {skipped} game(s) imported before")
+            transactions = merge_rows(c)
+            players = recompute_totals(c)
+
+        if dry_run:
+            connection.rollback()
+            logger.info(f"Dry run: would import {new_games} game(s) and {transactions} transaction(s) "
+                        f"for {players} player(s)")
+        else:
+            connection.commit()
+            logger.info(f"Imported {new_games} game(s) and {transactions} transaction(s), "
+                        f"recomputed totals of {players} player(s)")
+        return True
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import historical games from a CSV with columns "
+                    f"{', '.join(REQUIRED_COLUMNS)} and optionally {', '.join(OPTIONAL_COLUMNS)}")
+    parser.add_argument("path", help="CSV file, one transaction per line")
+    parser.add_argument("--creator", type=int, default=ADMINS[0], help="telegram id recorded as the games' creator")
+    parser.add_argument("--dry-run", action="store_true", help="validate and merge, then roll back")
+    args = parser.parse_args()
+
+    sys.exit(0 if run_import(args.path, args.creator, args.dry_run) else 1)
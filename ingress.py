@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Ingress control for PokerBot
+Per-user and per-command token buckets plus load shedding, applied as a
+telebot class middleware before any handler runs
+"""
+
+import os
+import time
+import logging
+import threading
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
+
+logger = logging.getLogger(__name__)
+
+INGRESS_USER_RATE = float(os.getenv("INGRESS_USER_RATE", "1"))
+INGRESS_USER_BURST = float(os.getenv("INGRESS_USER_BURST", "5"))
+INGRESS_EXPENSIVE_RATE = float(os.getenv("INGRESS_EXPENSIVE_RATE", "0.1"))
+INGRESS_EXPENSIVE_BURST = float(os.getenv("INGRESS_EXPENSIVE_BURST", "2"))
+INGRESS_QUEUE_HIGH = int(os.getenv("INGRESS_QUEUE_HIGH", "50"))
+INGRESS_DB_LATENCY_MS = float(os.getenv("INGRESS_DB_LATENCY_MS", "500"))
+INGRESS_WARN_SECONDS = 10
+INGRESS_MAX_BUCKETS = 10000
+
+# Commands that move money through the ledger: never shed, only rate limited per user
+LEDGER_COMMANDS = {'start', 'join', 'rebuy', 'cashout', 'leave', 'new_game', 'end_game'}
+LEDGER_CALLBACKS = ('remove_', 'rebuy_', 'cashout_', 'clear_')
+# Commands and callbacks that run reports over all games: shed first, limited per command
+EXPENSIVE_COMMANDS = {'overall_results', 'avg_profit', 'stats', 'chart', 'export'}
+EXPENSIVE_CALLBACKS = ('report_',)
+
+LEDGER, NORMAL, EXPENSIVE = 'ledger', 'normal', 'expensive'
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+
+class RateLimiter:
+    """Token buckets keyed by anything hashable; idle buckets are dropped once there are too many"""
+
+    def __init__(self, rate, capacity, max_buckets=INGRESS_MAX_BUCKETS):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_buckets = max_buckets
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_buckets:
+                    self._prune(now)
+                bucket = self.buckets[key] = TokenBucket(self.capacity)
+            bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            if bucket.tokens < 1:
+                return False
+            bucket.tokens -= 1
+            return True
+
+    def _prune(self, now):
+        # A bucket that has refilled completely carries no state worth keeping
+        full_after = self.capacity / self.rate if self.rate else float('inf')
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if now - bucket.updated < full_after}
+
+
+class LatencyGauge:
+    """Exponentially weighted moving average of observed durations, in seconds"""
+
+    def __init__(self, weight=0.2):
+        self.weight = weight
+        self.value = 0.0
+
+    def observe(self, seconds):
+        # A lost update under a race only skews an average
+        self.value += self.weight * (seconds - self.value)
+
+
+def classify(update_type, update):
+    """(class, command) of an update"""
+    if update_type == 'callback_query':
+        data = update.data or ''
+        if data.startswith(EXPENSIVE_CALLBACKS):
+            return EXPENSIVE, data.split('_', 1)[0]
+        if data.startswith(LEDGER_CALLBACKS):
+            return LEDGER, data.split('_', 1)[0]
+        return NORMAL, 'callback'
+    if update_type == 'inline_query':
+        return NORMAL, 'inline'
+    text = update.text or ''
+    if not text.startswith('/'):
+        return NORMAL, None
+    command = text.split(maxsplit=1)[0][1:].split('@')[0]
+    if command in LEDGER_COMMANDS:
+        return LEDGER, command
+    if command in EXPENSIVE_COMMANDS:
+        return EXPENSIVE, command
+    return NORMAL, command
+
+
+class IngressControl(BaseMiddleware):
+    """Rejects updates before dispatch when their sender or the bot is over its limits.
+
+    Every user has one bucket for all commands and one more per expensive
+    command. Under load (update queue depth or database connection latency
+    over the threshold) expensive commands are shed first; at twice the
+    threshold everything but ledger actions is. Admins skip the rate limits.
+    """
+
+    def __init__(self, bot, admins, queue_depth, db_latency):
+        super().__init__()
+        self.update_sensitive = True
+        self.update_types = ['message', 'callback_query', 'inline_query']
+        self.bot = bot
+        self.admins = set(admins)
+        self.queue_depth = queue_depth
+        self.db_latency = db_latency
+        self.users = RateLimiter(INGRESS_USER_RATE, INGRESS_USER_BURST)
+        self.expensive = RateLimiter(INGRESS_EXPENSIVE_RATE, INGRESS_EXPENSIVE_BURST)
+        self.lock = threading.Lock()
+        self.counters = {}  # (class, outcome) -> count
+        self.warned = {}  # user id -> monotonic time of the last rejection notice
+
+    def load(self):
+        """Current load as a multiple of the shedding thresholds"""
+        return max(self.queue_depth() / INGRESS_QUEUE_HIGH, self.db_latency.value * 1000 / INGRESS_DB_LATENCY_MS)
+
+    def verdict(self, update_type, update):
+        """(class, outcome) of an update; outcome is None to let it through, else 'limited' or 'shed'"""
+        kind, command = classify(update_type, update)
+        if command is None:
+            # Replies to next-step prompts and chatter; no handler does work for these
+            return kind, None
+        user_id = update.from_user.id if update.from_user else None
+        load = self.load()
+        if kind == EXPENSIVE and load >= 1 or kind == NORMAL and load >= 2:
+            return kind, 'shed'
+        if user_id in self.admins or update_type == 'inline_query':
+            # Inline queries arrive per keystroke and are answered from a cache
+            return kind, None
+        if not self.users.allow(user_id):
+            return kind, 'limited'
+        if kind == EXPENSIVE and not self.expensive.allow((user_id, command)):
+            return kind, 'limited'
+        return kind, None
+
+    def pre_process_message(self, message, data):
+        return self._check('message', message)
+
+    def pre_process_callback_query(self, call, data):
+        return self._check('callback_query', call)
+
+    def pre_process_inline_query(self, query, data):
+        return self._check('inline_query', query)
+
+    def post_process_message(self, message, data, exception):
+        pass
+
+    def post_process_callback_query(self, call, data, exception):
+        pass
+
+    def post_process_inline_query(self, query, data, exception):
+        pass
+
+    def _check(self, update_type, update):
+        kind, outcome = self.verdict(update_type, update)
+        with self.lock:
+            key = (kind, outcome or 'allowed')
+            self.counters[key] = self.counters.get(key, 0) + 1
+        if outcome is None:
+            return None
+        logger.info(f"Ingress {outcome} {kind} {update_type} from {update.from_user.id if update.from_user else None}")
+        self._notify(update_type, update, outcome)
+        return CancelUpdate()
+
+    def _notify(self, update_type, update, outcome):
+        """Tell the user why nothing happened, at most once per INGRESS_WARN_SECONDS"""
+        text = "⏳ Too many requests, slow down a bit." if outcome == 'limited' else \
+            "⏳ The bot is busy right now, try this again in a minute."
+        try:
+            if update_type == 'callback_query':
+                # Answering is required anyway, so it costs nothing extra
+                self.bot.answer_callback_query(update.id, text)
+                return
+            if update_type == 'inline_query':
+                return
+            user_id = update.from_user.id if update.from_user else None
+            now = time.monotonic()
+            with self.lock:
+                if now - self.warned.get(user_id, -INGRESS_WARN_SECONDS) < INGRESS_WARN_SECONDS:
+                    return
+                self.warned[user_id] = now
+                if len(self.warned) > INGRESS_MAX_BUCKETS:
+                    self.warned = {user: at for user, at in self.warned.items() if now - at < INGRESS_WARN_SECONDS}
+            self.bot.reply_to(update, text)
+        except Exception as e:
+            logger.error(f"Failed to send ingress notice: {e}")
+
+    def snapshot(self):
+        """((class, outcome), count) pairs plus the current queue depth and database latency"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+        return counters, self.queue_depth(), self.db_latency.value
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Inline-mode lookups for PokerBot
+Player and game cards for "@bot name" / "@bot #12" queries, answered from a
+prefix index and a small in-memory cache of recent results
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+INLINE_CACHE_SECONDS = int(os.getenv("INLINE_CACHE_SECONDS", "30"))
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "256"))
+INLINE_RESULTS = 10
+
+# Served by idx_players_lower_name; the counters are the denormalized totals
+PLAYER_CARDS_SQL = """
+    SELECT p.id, p.name, p.games_played,
+           p.total_cashout - p.total_buyin - p.total_rebuys AS profit,
+           last_game.id, last_game.date
+    FROM players p
+    LEFT JOIN LATERAL (
+        SELECT g.id, g.date
+        FROM game_players gp
+        JOIN games g ON g.id = gp.game_id
+        WHERE gp.player_id = p.id
+        ORDER BY g.id DESC
+        LIMIT 1
+    ) last_game ON TRUE
+    WHERE lower(p.name) LIKE %s
+    ORDER BY p.games_played DESC, p.id
+    LIMIT %s
+"""
+
+GAME_CARD_SQL = """
+    SELECT g.id, g.date, g.is_active,
+           (SELECT COUNT(*) FROM game_players gp WHERE gp.game_id = g.id),
+           (SELECT COALESCE(SUM(ABS(t.amount)), 0) FROM transactions t
+            WHERE t.game_id = g.id AND t.type IN ('buyin', 'rebuy')
+              AND t.created_at >= g.date - INTERVAL '1 day')
+    FROM games g
+    WHERE g.id = %s
+"""
+
+
+class TTLCache:
+    """Least-recently-used cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl=INLINE_CACHE_SECONDS, max_size=INLINE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+def normalize_query(text):
+    return " ".join((text or "").split()).lower()
+
+
+def parse_game_id(query):
+    """12 or #12 -> 12, anything else -> None"""
+    query = query.lstrip("#")
+    return int(query) if query.isdigit() else None
+
+
+def player_cards(cursor, query, limit=INLINE_RESULTS):
+    """(title, description, message text) for players whose name starts with `query`"""
+    pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    cursor.execute(PLAYER_CARDS_SQL, (pattern, limit))
+    cards = []
+    for player_id, name, games_played, profit, last_game_id, last_game_date in cursor.fetchall():
+        profit_str = f"{'+' if profit > 0 else ''}{profit:.1f}"
+        last_game = f"#{last_game_id} ({last_game_date:%d.%m.%Y})" if last_game_id else "none"
+        description = f"Profit {profit_str} · {games_played} games · last game {last_game}"
+        text = (f"🃏 {name}\n"
+                f"Profit: {profit_str}\n"
+                f"Games played: {games_played}\n"
+                f"Last game: {last_game}")
+        cards.append((f"player-{player_id}", name, description, text))
+    return cards
+
+
+def game_card(cursor, game_id, live_bank=None):
+    """Card of one game, or None; `live_bank` overrides the bank of a live game"""
+    cursor.execute(GAME_CARD_SQL, (game_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    game_id, date, is_active, players, bank = row
+    if live_bank is not None:
+        bank = live_bank
+    status = "active" if is_active else "ended"
+    description = f"{date:%d.%m.%Y} · {status} · {players} players · bank {bank:.1f}"
+    text = (f"🎲 Game #{game_id} ({status})\n"
+            f"Date: {date:%d.%m.%Y %H:%M}\n"
+            f"Players: {players}\n"
+            f"Bank: {bank:.1f}")
+    return f"game-{game_id}", f"Game #{game_id}", description, text
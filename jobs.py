@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Background report jobs for PokerBot
+Runs heavy reports off the update workers and edits a placeholder reply in place
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extensions import QueryCanceledError
+import digest
+
+logger = logging.getLogger(__name__)
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+
+
+class ReportJobs:
+    """Run reports in a small thread pool, computing each report key at most once at a time."""
+
+    def __init__(self, bot, max_workers=REPORT_WORKERS, max_length=4096):
+        self.bot = bot
+        self.max_length = max_length
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        self.lock = threading.Lock()
+        self.waiters = {}  # report key -> (chat_id, message_id) of messages waiting for the result
+
+    def submit(self, message, key, compute):
+        """Reply with a placeholder and edit it once `compute()` for `key` has finished.
+
+        Requests for a key that is already being computed attach to the running job
+        instead of starting a new one. `compute` returns the text, or a
+        (text, reply_markup) pair. Text longer than one message continues in
+        follow-up messages.
+        """
+        placeholder = self.bot.reply_to(message, "⏳ Computing…")
+        self._schedule(key, compute, placeholder)
+
+    def submit_edit(self, message, key, compute):
+        """Like submit(), but replaces the contents of an existing bot message"""
+        self._schedule(key, compute, message)
+
+    def _schedule(self, key, compute, message):
+        target = (message.chat.id, message.message_id)
+        with self.lock:
+            if key in self.waiters:
+                self.waiters[key].append(target)
+                logger.info(f"Report {key} already running, attached request from chat {message.chat.id}")
+                return
+            self.waiters[key] = [target]
+        self.executor.submit(self._run, key, compute)
+        logger.info(f"Report {key} scheduled for chat {message.chat.id}")
+
+    def _run(self, key, compute):
+        markup = None
+        try:
+            text = compute()
+            if isinstance(text, tuple):
+                text, markup = text
+        except QueryCanceledError as e:
+            logger.error(f"Report {key} cancelled by statement timeout: {e}")
+            text = "⌛ The report took too long and was cancelled. Try again later."
+        except Exception as e:
+            logger.error(f"Error computing report {key}: {e}")
+            text = f"❌ Error: {str(e)}"
+
+        with self.lock:
+            waiters = self.waiters.pop(key, [])
+
+        parts = digest.split(text, self.max_length)
+        for chat_id, message_id in waiters:
+            try:
+                self.bot.edit_message_text(parts[0], chat_id, message_id, reply_markup=markup)
+                for part in parts[1:]:
+                    self.bot.send_message(chat_id, part)
+            except Exception as e:
+                logger.error(f"Failed to deliver report {key} to chat {chat_id}: {e}")
+        logger.info(f"Report {key} delivered to {len(waiters)} chat(s)")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Local write-ahead journal and database circuit breaker for PokerBot
+Ledger changes are appended and fsync'd here before a player is answered, so
+buy-ins, rebuys and cashouts survive a PostgreSQL outage or a bot restart
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """Append-only JSONL file of ledger changes numbered by a monotonic seq.
+
+    An entry is durable once append() returns. The file is emptied whenever
+    every entry has reached the database, so it only ever holds the backlog.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.last_seq = 0
+        for entry in self.entries():
+            self.last_seq = max(self.last_seq, entry['seq'])
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def entries(self, after_seq=0):
+        """Entries with seq > after_seq in append order"""
+        if not os.path.exists(self.path):
+            return []
+        result = []
+        with open(self.path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Only the last line can be torn, by a crash in the middle of a write
+                    logger.warning(f"Skipping unreadable journal line {line_number} in {self.path}")
+                    continue
+                if entry['seq'] > after_seq:
+                    result.append(entry)
+        return result
+
+    def advance(self, seq):
+        """Never hand out a seq at or below one the database has already applied"""
+        with self.lock:
+            self.last_seq = max(self.last_seq, seq)
+
+    def append(self, op):
+        """Durably append `op`; returns its seq"""
+        with self.lock:
+            seq = self.last_seq + 1
+            self.file.write(json.dumps(dict(op, seq=seq), default=str) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.last_seq = seq
+            return seq
+
+    def truncate(self):
+        """Drop all entries; only call once every entry is in the database"""
+        with self.lock:
+            self.file.truncate(0)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+
+class CircuitBreaker:
+    """Fail fast while the database is down instead of waiting on every call.
+
+    After `failure_threshold` consecutive failures the circuit opens; every
+    `reset_timeout` seconds one caller is let through to probe the database,
+    and its success closes the circuit again.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info("Database is reachable again, closing the circuit")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Database failed {self.failures} times in a row, opening the circuit")
+                self.opened_at = time.monotonic()
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+In-memory ledger for active games
+Answers live-game reads from memory and persists every change through an
+ordered write-behind queue; rebuilt from the database and the local journal
+on startup
+
+The ledger is authoritative for active games only while a single bot process
+serves updates (webhook or polling), which is how PokerBot is deployed.
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import deque
+from decimal import Decimal
+import psycopg2
+import queries
+import outbox
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying forever: the database is unreachable, not the write wrong
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# maintenance_checkpoints row holding the last journal seq written to the database
+JOURNAL_CHECKPOINT = "ledger_journal"
+
+# How long a handler waits for one game's queued changes before giving up for now
+SAVE_WAIT_SECONDS = 3
+
+JOURNAL_CHECKPOINT_SQL = """
+    INSERT INTO maintenance_checkpoints (job_name, last_id, updated_at)
+    VALUES (%s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (job_name) DO UPDATE
+    SET last_id = GREATEST(maintenance_checkpoints.last_id, EXCLUDED.last_id),
+        updated_at = EXCLUDED.updated_at
+"""
+
+
+def to_amount(value):
+    """Normalize an amount to the NUMERIC(10,1) the database stores"""
+    return Decimal(str(value)).quantize(Decimal("0.1"))
+
+
+class PlayerState:
+    """Running sums of one player in one game; buy-ins and rebuys are positive"""
+
+    def __init__(self, player_id, telegram_id, name, buyin=0, rebuys=0, cashout=0):
+        self.player_id = player_id
+        self.telegram_id = telegram_id
+        self.name = name
+        self.buyin = to_amount(buyin)
+        self.rebuys = to_amount(rebuys)
+        self.cashout = to_amount(cashout)
+
+    @property
+    def total(self):
+        return self.cashout - self.buyin - self.rebuys
+
+
+class GameState:
+    """Players and running bank of an active game"""
+
+    def __init__(self, game_id, password, creator_id, chat_id=None):
+        self.game_id = game_id
+        self.password = password
+        self.creator_id = creator_id
+        self.chat_id = chat_id
+        self.players = {}  # player_id -> PlayerState
+
+    def player_by_telegram_id(self, telegram_id):
+        for player in self.players.values():
+            if player.telegram_id == telegram_id:
+                return player
+        return None
+
+    @property
+    def bank(self):
+        return sum((p.buyin + p.rebuys for p in self.players.values()), Decimal("0.0"))
+
+
+def clear_player_game(c, game_id, player_id):
+    """Delete a player's transactions and membership in a game and roll back their totals"""
+    queries.execute(c, 'game_window', (game_id,))
+    row = c.fetchone()
+    if not row:
+        return
+    c.execute("""
+        WITH removed AS (
+            DELETE FROM transactions
+            WHERE player_id = %s AND game_id = %s AND created_at >= %s
+            RETURNING amount, type
+        ), left_game AS (
+            DELETE FROM game_players WHERE player_id = %s AND game_id = %s
+            RETURNING id
+        )
+        UPDATE players SET
+            total_buyin = total_buyin - COALESCE((SELECT SUM(-amount) FROM removed WHERE type = 'buyin'), 0),
+            total_rebuys = total_rebuys - COALESCE((SELECT SUM(-amount) FROM removed WHERE type = 'rebuy'), 0),
+            total_cashout = total_cashout - COALESCE((SELECT SUM(amount) FROM removed WHERE type = 'cashout'), 0),
+            games_played = games_played - (SELECT COUNT(*) FROM left_game)
+        WHERE id = %s
+    """, (player_id, game_id, row[0], player_id, game_id, player_id))
+
+
+class GameLedger:
+    """Authoritative state of active games with an ordered write-behind path.
+
+    Every change is applied to memory and appended to a FIFO queue under one
+    lock, so the single writer thread persists changes in exactly the order
+    players saw them acknowledged. Each change is written in its own database
+    transaction and retried until it succeeds.
+
+    With a journal, a change is fsync'd to local disk before it is applied, and
+    its seq is committed together with the change, so a restart replays exactly
+    the changes the database has not seen yet.
+
+    A change that keeps failing for a reason other than an unreachable
+    database is never dropped: it goes to ledger_dead_letters, the game is
+    parked (its later changes follow it there, in order) and `alert` is
+    called. retry_parked() writes a parked game's changes again.
+
+    `notified` is called after a change carrying notifications commits, so
+    the outbox can look for them right away.
+    """
+
+    def __init__(self, connect, journal=None, breaker=None, alert=None, notified=None, retry_delay=1.0,
+                 max_attempts=5):
+        self.connect = connect
+        self.journal = journal
+        self.breaker = breaker
+        self.alert = alert
+        self.notified = notified
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.games = {}  # game_id -> GameState
+        self.parked = {}  # game_id -> number of its changes waiting in ledger_dead_letters
+        self.lock = threading.RLock()
+        self.pending = deque()
+        self.changed = threading.Condition(self.lock)
+        self.writer = None
+
+    def start(self, journal=None):
+        """Attach the journal and start the writer; only the processes serving updates do, not the maintenance CLIs"""
+        with self.lock:
+            if self.writer is not None:
+                return
+            if journal is not None:
+                self.journal = journal
+            self.writer = threading.Thread(target=self._write_loop, name="ledger-writer", daemon=True)
+            self.writer.start()
+
+    # Reads
+
+    def get_game(self, game_id):
+        with self.lock:
+            return self.games.get(game_id)
+
+    def active_game(self, chat_id):
+        """The most recently created active game of a chat, or None"""
+        with self.lock:
+            games = [game for game in self.games.values() if game.chat_id == chat_id]
+            return max(games, key=lambda game: game.game_id) if games else None
+
+    def active_games(self):
+        with self.lock:
+            return sorted(self.games.values(), key=lambda game: game.game_id)
+
+    def game_of_player(self, telegram_id):
+        """The most recent active game the user is seated at, or None"""
+        with self.lock:
+            games = [game for game in self.games.values() if game.player_by_telegram_id(telegram_id)]
+            return max(games, key=lambda game: game.game_id) if games else None
+
+    def snapshot(self, game_id):
+        """(name, buyin, rebuys, cashout, total) rows of a game, or None if it is not live"""
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is None:
+                return None
+            return [(p.name, p.buyin, p.rebuys, p.cashout, p.total) for p in game.players.values()]
+
+    def parked_games(self):
+        """{game_id: changes waiting in ledger_dead_letters}"""
+        with self.lock:
+            return dict(self.parked)
+
+    def player_telegram_ids(self, game_id):
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is None:
+                return None
+            return [p.telegram_id for p in game.players.values()]
+
+    # Changes
+
+    def load(self):
+        """Rebuild the state of every active game from the database, then replay the journal"""
+        self.flush()
+        conn = self.connect()
+        try:
+            c = conn.cursor()
+            c.execute("SELECT last_id FROM maintenance_checkpoints WHERE job_name = %s", (JOURNAL_CHECKPOINT,))
+            row = c.fetchone()
+            applied_seq = row[0] if row else 0
+            c.execute("SELECT id, password, creator_id, chat_id FROM games WHERE is_active = TRUE")
+            games = {row[0]: GameState(*row) for row in c.fetchall()}
+            if games:
+                c.execute("""
+                    SELECT gp.game_id, p.id, p.telegram_id, p.name
+                    FROM game_players gp
+                    JOIN players p ON p.id = gp.player_id
+                    WHERE gp.game_id = ANY(%s)
+                """, (list(games),))
+                for game_id, player_id, telegram_id, name in c.fetchall():
+                    games[game_id].players[player_id] = PlayerState(player_id, telegram_id, name)
+
+                c.execute("""
+                    SELECT t.game_id, t.player_id,
+                           SUM(CASE WHEN t.type = 'buyin' THEN -t.amount ELSE 0 END),
+                           SUM(CASE WHEN t.type = 'rebuy' THEN -t.amount ELSE 0 END),
+                           SUM(CASE WHEN t.type = 'cashout' THEN t.amount ELSE 0 END)
+                    FROM transactions t
+                    WHERE t.game_id = ANY(%s)
+                      AND t.created_at >= (SELECT MIN(date) - INTERVAL '1 day' FROM games WHERE id = ANY(%s))
+                    GROUP BY t.game_id, t.player_id
+                """, (list(games), list(games)))
+                for game_id, player_id, buyin, rebuys, cashout in c.fetchall():
+                    player = games[game_id].players.get(player_id)
+                    if player:
+                        player.buyin, player.rebuys, player.cashout = to_amount(buyin), to_amount(rebuys), to_amount(cashout)
+            c.execute("SELECT op FROM ledger_dead_letters WHERE resolved_at IS NULL ORDER BY id")
+            dead = [row[0] for row in c.fetchall()]
+        finally:
+            conn.close()
+
+        with self.lock:
+            self.games = games
+            # Parked changes were acknowledged to players, so they count in memory
+            self.parked = {}
+            for op in dead:
+                self._apply_in_memory(op)
+                self.parked[op['game_id']] = self.parked.get(op['game_id'], 0) + 1
+            replayed = 0
+            if self.journal is not None:
+                self.journal.advance(applied_seq)
+                for op in self.journal.entries(applied_seq):
+                    self._apply_in_memory(op)
+                    self._enqueue(op)
+                    replayed += 1
+        logger.info(f"Ledger loaded {len(games)} active game(s) from the database")
+        if self.parked:
+            logger.warning(f"Games with changes parked in ledger_dead_letters: {self.parked}")
+        if replayed:
+            logger.info(f"Replaying {replayed} journaled change(s) the database has not seen yet")
+
+    def open_game(self, game_id, password, creator_id, chat_id):
+        with self.lock:
+            self.games[game_id] = GameState(game_id, password, creator_id, chat_id)
+
+    def saved(self, game_id, timeout=SAVE_WAIT_SECONDS):
+        """True once every change of the game is in the database: nothing queued, nothing parked.
+
+        Waits up to `timeout` seconds for the game's own queued changes only,
+        not for the rest of the queue.
+        """
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while any(op['game_id'] == game_id for op in self.pending):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+            return game_id not in self.parked
+
+    def close_game(self, game_id, timeout=SAVE_WAIT_SECONDS):
+        """Stop tracking a game that ended in the database; returns saved() for changes accepted until now"""
+        with self.lock:
+            self.games.pop(game_id, None)
+        return self.saved(game_id, timeout)
+
+    def record(self, game_id, player_id, telegram_id, name, kind, amount, notify=None):
+        """Apply a buyin, rebuy or cashout; returns True if it was the player's first buy-in.
+
+        `notify` is a list of (chat_id, text) written to the notification
+        outbox in the same transaction as the change.
+        """
+        with self.lock:
+            game = self.games[game_id]
+            joined = player_id not in game.players
+            op = {'op': 'transaction', 'game_id': game_id, 'player_id': player_id,
+                  'telegram_id': telegram_id, 'name': name, 'type': kind, 'amount': to_amount(amount)}
+            if notify:
+                op['notify'] = [list(message) for message in notify]
+            self._submit(op)
+        return joined
+
+    def clear_player(self, game_id, player_id, notify=None):
+        """Remove a player and all their transactions from a game"""
+        with self.lock:
+            op = {'op': 'clear', 'game_id': game_id, 'player_id': player_id}
+            if notify:
+                op['notify'] = [list(message) for message in notify]
+            self._submit(op)
+
+    def rename_player(self, player_id, name):
+        with self.lock:
+            for game in self.games.values():
+                if player_id in game.players:
+                    game.players[player_id].name = name
+
+    def retry_parked(self, game_id):
+        """Queue another attempt at the parked changes of a game, behind its changes already queued"""
+        with self.lock:
+            if game_id not in self.parked:
+                return False
+            self._enqueue({'op': 'retry', 'game_id': game_id})
+            return True
+
+    def reset(self):
+        """Forget all state, e.g. after the database was wiped"""
+        with self.lock:
+            self.games = {}
+            self.parked = {}
+            self.pending.clear()
+            if self.journal is not None:
+                self.journal.truncate()
+            self.changed.notify_all()
+
+    def flush(self, timeout=30):
+        """Wait until every queued change is persisted; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while self.pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Ledger flush timed out with {len(self.pending)} pending write(s)")
+                    return False
+                self.changed.wait(remaining)
+        return True
+
+    # Write-behind
+
+    def _submit(self, op):
+        """Journal, apply and queue a change; the caller holds the lock"""
+        if self.journal is not None:
+            op['seq'] = self.journal.append(op)
+        self._apply_in_memory(op)
+        self._enqueue(op)
+
+    def _apply_in_memory(self, op):
+        game = self.games.get(op['game_id'])
+        if game is None:
+            # The game ended before a journaled change was replayed; it still goes to the database
+            return
+        player_id = op['player_id']
+        if op['op'] == 'clear':
+            game.players.pop(player_id, None)
+            return
+
+        player = game.players.get(player_id)
+        if player is None:
+            player = game.players[player_id] = PlayerState(player_id, op['telegram_id'], op['name'])
+        amount = to_amount(op['amount'])
+        if op['type'] == 'buyin':
+            player.buyin += amount
+        elif op['type'] == 'rebuy':
+            player.rebuys += amount
+        else:
+            player.cashout += amount
+
+    def _enqueue(self, op):
+        self.pending.append(op)
+        self.changed.notify_all()
+
+    def _write_loop(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.changed.wait()
+                op = self.pending[0]
+                parked = op['game_id'] in self.parked
+
+            if op['op'] == 'retry':
+                self._retry(op['game_id'])
+            elif parked:
+                # Writing it now would put the game's changes out of order
+                self._dead_letter(op, "an earlier change of this game is parked")
+            else:
+                error = self._persist(op, self._apply, self.max_attempts)
+                if error is not None:
+                    self._dead_letter(op, error)
+                elif op.get('notify') and self.notified is not None:
+                    self.notified()
+
+            with self.lock:
+                # reset() may have dropped the queue while we were writing
+                if self.pending and self.pending[0] is op:
+                    self.pending.popleft()
+                    if not self.pending and self.journal is not None:
+                        # Everything journaled is in the database now
+                        self.journal.truncate()
+                self.changed.notify_all()
+
+    def _persist(self, op, write, max_attempts=None):
+        """Run write(cursor, op) in its own transaction until it commits; returns None.
+
+        An unreachable database is waited out forever; after `max_attempts`
+        other failures the last error is returned instead.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            conn = None
+            try:
+                conn = self.connect()
+                conn.autocommit = False
+                with conn.cursor() as c:
+                    write(c, op)
+                conn.commit()
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return None
+            except TRANSIENT_ERRORS as e:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                logger.error(f"Ledger write {op} failed, database unavailable (attempt {attempt}): {e}")
+            except Exception as e:
+                logger.error(f"Ledger write {op} failed (attempt {attempt}): {e}")
+                if max_attempts is not None and attempt >= max_attempts:
+                    return str(e)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(min(self.retry_delay * 2 ** (attempt - 1), 30))
+
+    def _dead_letter(self, op, error):
+        """Park a change in ledger_dead_letters; retried until the row is written"""
+        def write(c, op):
+            c.execute("INSERT INTO ledger_dead_letters (game_id, op, error) VALUES (%s, %s, %s)",
+                      (op['game_id'], json.dumps(op, default=str), error))
+            if 'seq' in op:
+                # Out of the journal's hands now: a restart must not replay it
+                c.execute(JOURNAL_CHECKPOINT_SQL, (JOURNAL_CHECKPOINT, op['seq']))
+
+        self._persist(op, write)
+        with self.lock:
+            first = op['game_id'] not in self.parked
+            self.parked[op['game_id']] = self.parked.get(op['game_id'], 0) + 1
+        logger.error(f"Parked ledger write {op} in ledger_dead_letters: {error}")
+        if first:
+            self._alert(f"⚠️ A change to game #{op['game_id']} could not be saved and is parked with all "
+                        f"later changes of the game: {error}")
+
+    def _retry(self, game_id):
+        """Write a game's parked changes in order, each with its resolution; unpark it if all succeed"""
+        conn = None
+        try:
+            conn = self.connect()
+            conn.autocommit = False
+            with conn.cursor() as c:
+                c.execute("""
+                    SELECT id, op FROM ledger_dead_letters
+                    WHERE game_id = %s AND resolved_at IS NULL
+                    ORDER BY id
+                """, (game_id,))
+                rows = c.fetchall()
+                conn.commit()
+                for dead_id, op in rows:
+                    try:
+                        self._apply(c, op)
+                        c.execute("UPDATE ledger_dead_letters SET resolved_at = CURRENT_TIMESTAMP WHERE id = %s",
+                                  (dead_id,))
+                        conn.commit()
+                    except Exception as e:
+                        conn.rollback()
+                        c.execute("UPDATE ledger_dead_letters SET error = %s, attempts = attempts + 1 WHERE id = %s",
+                                  (str(e), dead_id))
+                        conn.commit()
+                        with self.lock:
+                            self.parked[game_id] = len(rows) - rows.index((dead_id, op))
+                        self._alert(f"⚠️ Retrying the parked changes of game #{game_id} failed: {e}")
+                        return
+        except Exception as e:
+            logger.error(f"Retrying the parked changes of game #{game_id} failed: {e}")
+            self._alert(f"⚠️ Retrying the parked changes of game #{game_id} failed: {e}")
+            return
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        with self.lock:
+            self.parked.pop(game_id, None)
+        logger.info(f"Wrote {len(rows)} parked change(s) of game #{game_id}")
+        self._alert(f"✅ {len(rows)} parked change(s) of game #{game_id} are saved now.")
+
+    def _alert(self, text):
+        if self.alert is None:
+            return
+        try:
+            self.alert(text)
+        except Exception as e:
+            logger.error(f"Failed to send ledger alert: {e}")
+
+    def _apply(self, c, op):
+        game_id, player_id = op['game_id'], op['player_id']
+        if 'seq' in op:
+            # Committed with the change itself, so a replay never applies it twice
+            c.execute(JOURNAL_CHECKPOINT_SQL, (JOURNAL_CHECKPOINT, op['seq']))
+        # Notifications commit (or roll back) together with the change they announce
+        outbox.enqueue(c, game_id, op.get('notify'))
+
+        if op['op'] == 'clear':
+            clear_player_game(c, game_id, player_id)
+            return
+
+        kind, amount = op['type'], to_amount(op['amount'])
+        if kind == 'buyin':
+            # RETURNING yields a row only when the player actually joined now
+            queries.execute(c, 'add_game_player', (player_id, game_id))
+            if c.fetchone():
+                queries.execute(c, 'add_games_played', (1, player_id))
+        # Money put into the game is stored as a negative amount
+        stored = -amount if kind in ('buyin', 'rebuy') else amount
+        queries.execute(c, 'insert_transaction', (player_id, game_id, stored, kind))
+        queries.execute(c, queries.TOTALS_QUERY[kind], (amount, player_id))
@@ -3,7 +3,6 @@ from flask import Flask, request
 import os
 import telebot
 import logging
-from bot import bot, init_db
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,43 +10,70 @@ logger = logging.getLogger(__name__)
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 WEBHOOK_SECRET_PATH = os.getenv("WEBHOOK_SECRET_PATH", "supersecret")
 
-app = Flask(__name__)
 
-try:
-    init_db()
-    logger.info("Database initialization completed")
-except Exception as e:
-    logger.error(f"Failed to initialize database: {e}")
-    raise
+def create_app():
+    """Initialize the database and background workers and build the webhook app.
+
+    Nothing runs at import time: chart worker processes are spawned and
+    import this module again as __mp_main__, and must not start a second bot.
+    """
+    from bot import bot, init_db, outbox_dispatcher, live_scoreboard
+    from migrations import schedule_partition_maintenance
+    from prefilter import UpdateFilter, loads
+
+    app = Flask(__name__)
+    update_filter = UpdateFilter(bot)
 
-@app.route(f"/{WEBHOOK_SECRET_PATH}", methods=['POST'])
-def webhook():
     try:
-        json_str = request.get_data().decode("utf-8")
-        logger.info(f"Received webhook data: {json_str}")
+        init_db()
+        schedule_partition_maintenance()
+        outbox_dispatcher.start()
+        live_scoreboard.start()
+        logger.info("Database initialization completed")
+    except Exception as e:
+        logger.error(f"Failed to initialize database: {e}")
+        raise
 
-        update = telebot.types.Update.de_json(json_str)
-        logger.info(f"Parsed update: {update}")
+    @app.route(f"/{WEBHOOK_SECRET_PATH}", methods=['POST'])
+    def webhook():
+        try:
+            payload = request.get_data()
+            logger.debug(f"Received webhook data: {payload}")
 
-        bot.process_new_updates([update])
-        logger.info("Update processed successfully")
+            # Cheap checks on the raw dict before telebot builds any objects
+            update_json = loads(payload)
+            reason = update_filter.reject(update_json)
+            if reason:
+                logger.debug(f"Dropped update {update_json.get('update_id')}: {reason}")
+                return '', 200
 
-        return '', 200
-    except Exception as e:
-        logger.error(f"Error processing webhook: {e}")
-        return str(e), 500
+            update = telebot.types.Update.de_json(update_json)
+            logger.debug(f"Parsed update: {update}")
 
+            bot.process_new_updates([update])
+            logger.info("Update processed successfully")
 
-@app.route("/", methods=['GET'])
-def index():
-    return "Poker Bot is alive!", 200
+            return '', 200
+        except Exception as e:
+            logger.error(f"Error processing webhook: {e}")
+            return str(e), 500
 
-@app.route("/health", methods=['GET'])
-def health():
-    return {"status": "ok", "webhook_path": WEBHOOK_SECRET_PATH}, 200
+    @app.route("/", methods=['GET'])
+    def index():
+        return "Poker Bot is alive!", 200
+
+    @app.route("/health", methods=['GET'])
+    def health():
+        return {"status": "ok", "webhook_path": WEBHOOK_SECRET_PATH, "dropped_updates": update_filter.dropped}, 200
+
+    return app
 
 
 if __name__ == '__main__':
+    from bot import bot
+    from prefilter import ALLOWED_UPDATES
+
+    app = create_app()
     port = int(os.getenv("PORT", 5000))
     logger.info(f"Starting bot on port {port}")
     logger.info(f"Webhook path: /{WEBHOOK_SECRET_PATH}")
@@ -55,16 +81,9 @@ if __name__ == '__main__':
     try:
         bot.remove_webhook()
         webhook_url = f'{os.getenv("WEBHOOK_URL")}/{WEBHOOK_SECRET_PATH}'
-        bot.set_webhook(url=webhook_url)
+        bot.set_webhook(url=webhook_url, allowed_updates=ALLOWED_UPDATES)
         logger.info(f"Webhook set to: {webhook_url}")
     except Exception as e:
         logger.error(f"Error setting webhook: {e}")
 
     app.run(host='0.0.0.0', port=port)
-
-
-
-
-
-
-
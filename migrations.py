@@ -4,17 +4,69 @@ Database migrations for PokerBot
 Handles safe database schema updates
 """
 
+import os
+import re
 import psycopg2
 import logging
+import threading
+from psycopg2 import sql
 from datetime import datetime
 from bot import get_db_connection, _get_connection_params
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# How many months of future transactions partitions to keep created
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Names given to monthly partitions by TRANSACTIONS_PARTITION_FUNCTION
+MONTHLY_PARTITION_NAME = re.compile(r"transactions_y\d{4}m(0[1-9]|1[0-2])")
+
+TRANSACTIONS_PARTITION_FUNCTION = '''
+    CREATE OR REPLACE FUNCTION create_transactions_partitions(from_date DATE, to_date DATE)
+    RETURNS INTEGER AS $$
+    DECLARE
+        month_start DATE := date_trunc('month', from_date)::date;
+        month_end DATE;
+        partition_name TEXT;
+        created INTEGER := 0;
+    BEGIN
+        WHILE month_start <= to_date LOOP
+            partition_name := 'transactions_' || to_char(month_start, '"y"YYYY"m"MM');
+            month_end := (month_start + INTERVAL '1 month')::date;
+            IF to_regclass(partition_name) IS NULL THEN
+                IF EXISTS (SELECT 1 FROM transactions_default
+                           WHERE created_at >= month_start AND created_at < month_end) THEN
+                    -- The default partition already holds rows of this month: PostgreSQL
+                    -- refuses a new partition over them, so they move into it first
+                    EXECUTE format('CREATE TABLE %I (LIKE transactions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                                   partition_name);
+                    EXECUTE format(
+                        'WITH moved AS (DELETE FROM transactions_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                        'INSERT INTO %I SELECT * FROM moved',
+                        month_start, month_end, partition_name
+                    );
+                    EXECUTE format('ALTER TABLE transactions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                   partition_name, month_start, month_end);
+                ELSE
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+                        partition_name, month_start, month_end
+                    );
+                END IF;
+                created := created + 1;
+            END IF;
+            month_start := month_end;
+        END LOOP;
+        RETURN created;
+    END;
+    $$ LANGUAGE plpgsql
+'''
+
 class DatabaseMigrator:
     def __init__(self):
         self.connection = get_db_connection()
+        # Each migration must commit or roll back as a whole
+        self.connection.autocommit = False
         self.cursor = self.connection.cursor()
         
     def __enter__(self):
@@ -133,6 +185,230 @@ def run_all_migrations():
             "Create game_history table for detailed game tracking"
         )
 
+        # Migration 5: Range-partition transactions by month of created_at
+        migrator.run_migration(
+            "partition_transactions_by_month",
+            [
+                "ALTER TABLE transactions RENAME TO transactions_heap",
+                '''
+                CREATE TABLE transactions (
+                    id INTEGER NOT NULL DEFAULT nextval('transactions_id_seq'),
+                    player_id INTEGER NOT NULL,
+                    game_id INTEGER NOT NULL,
+                    amount NUMERIC(10,1) NOT NULL,
+                    type TEXT NOT NULL,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY(player_id) REFERENCES players(id) ON DELETE CASCADE,
+                    FOREIGN KEY(game_id) REFERENCES games(id) ON DELETE CASCADE,
+                    CONSTRAINT check_type_valid CHECK (type IN ('buyin', 'rebuy', 'cashout'))
+                ) PARTITION BY RANGE (created_at)
+                ''',
+                # Safety net for rows outside every monthly partition
+                "CREATE TABLE transactions_default PARTITION OF transactions DEFAULT",
+                TRANSACTIONS_PARTITION_FUNCTION,
+                f'''
+                SELECT create_transactions_partitions(
+                    COALESCE((SELECT MIN(created_at) FROM transactions_heap), CURRENT_TIMESTAMP)::date,
+                    (CURRENT_DATE + INTERVAL '{PARTITION_MONTHS_AHEAD} months')::date
+                )
+                ''',
+                '''
+                INSERT INTO transactions (id, player_id, game_id, amount, type, created_at)
+                SELECT id, player_id, game_id, amount, type, COALESCE(created_at, CURRENT_TIMESTAMP)
+                FROM transactions_heap
+                ''',
+                "ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id",
+                "DROP TABLE transactions_heap",
+                "ALTER TABLE transactions ADD PRIMARY KEY (id, created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_transactions_game_id ON transactions(game_id)",
+                "CREATE INDEX IF NOT EXISTS idx_transactions_player_id ON transactions(player_id)"
+            ],
+            "Convert transactions to monthly range partitions on created_at"
+        )
+
+        # Migration 6: Cold storage for raw transactions of archived games
+        migrator.run_migration(
+            "create_transactions_archive",
+            [
+                "ALTER TABLE games ADD COLUMN IF NOT EXISTS ended_at TIMESTAMP",
+                "ALTER TABLE games ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP",
+                '''
+                CREATE TABLE IF NOT EXISTS transactions_archive (
+                    id INTEGER PRIMARY KEY,
+                    player_id INTEGER NOT NULL,
+                    game_id INTEGER NOT NULL,
+                    amount NUMERIC(10,1) NOT NULL,
+                    type TEXT NOT NULL,
+                    created_at TIMESTAMP NOT NULL,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                ''',
+                "CREATE INDEX IF NOT EXISTS idx_transactions_archive_game_id ON transactions_archive(game_id)"
+            ],
+            "Add games.ended_at/archived_at and transactions_archive table"
+        )
+
+        # Migration 7: Checkpoints for resumable maintenance jobs
+        migrator.run_migration(
+            "create_maintenance_checkpoints",
+            [
+                '''
+                CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+                    job_name VARCHAR(100) PRIMARY KEY,
+                    last_id INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                '''
+            ],
+            "Create maintenance_checkpoints table for resumable jobs"
+        )
+
+        # Migration 8: Games belong to the chat they were created in
+        migrator.run_migration(
+            "scope_games_by_chat",
+            [
+                "ALTER TABLE games ADD COLUMN IF NOT EXISTS chat_id BIGINT",
+                # Games created before were started from the creator's private chat
+                "UPDATE games SET chat_id = creator_id WHERE chat_id IS NULL",
+                "CREATE INDEX IF NOT EXISTS idx_games_chat_active ON games(chat_id, is_active)"
+            ],
+            "Add games.chat_id with a (chat_id, is_active) index for per-chat games"
+        )
+
+        # Migration 9: At most one active game per chat, enforced by the database
+        migrator.run_migration(
+            "unique_active_game_per_chat",
+            [
+                # Keep the newest active game of each chat if earlier races left several
+                """
+                UPDATE games SET is_active = FALSE, ended_at = COALESCE(ended_at, CURRENT_TIMESTAMP)
+                WHERE is_active = TRUE
+                  AND id NOT IN (SELECT MAX(id) FROM games WHERE is_active = TRUE GROUP BY chat_id)
+                """,
+                "CREATE UNIQUE INDEX IF NOT EXISTS uniq_games_active_chat ON games(chat_id) WHERE is_active"
+            ],
+            "Add a partial unique index allowing one active game per chat"
+        )
+
+        # Migration 10: Indexes behind the player picker search
+        migrator.run_migration(
+            "add_player_name_search_indexes",
+            [
+                "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+                "CREATE INDEX IF NOT EXISTS idx_players_lower_name ON players (lower(name) text_pattern_ops)",
+                "CREATE INDEX IF NOT EXISTS idx_players_name_trgm ON players USING gin (name gin_trgm_ops)",
+                "CREATE INDEX IF NOT EXISTS idx_players_name_id ON players (name, id)"
+            ],
+            "Add prefix, trigram and (name, id) keyset indexes on player names"
+        )
+
+        # Migration 11: Remember which historical games were bulk imported
+        migrator.run_migration(
+            "create_imported_games",
+            [
+                '''
+                CREATE TABLE IF NOT EXISTS imported_games (
+                    source_ref TEXT PRIMARY KEY,
+                    game_id INTEGER NOT NULL REFERENCES games(id) ON DELETE CASCADE,
+                    imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                '''
+            ],
+            "Create imported_games table mapping import refs to games"
+        )
+
+        # Migration 12: Cached settlement plans of ended games
+        migrator.run_migration(
+            "create_game_settlements",
+            [
+                '''
+                CREATE TABLE IF NOT EXISTS game_settlements (
+                    game_id INTEGER PRIMARY KEY REFERENCES games(id) ON DELETE CASCADE,
+                    transfers JSONB NOT NULL,
+                    imbalance NUMERIC(10,1) NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                '''
+            ],
+            "Create game_settlements table caching who-pays-whom plans"
+        )
+
+        # Migration 13: Transactional outbox for player notifications
+        migrator.run_migration(
+            "create_notification_outbox",
+            [
+                '''
+                CREATE TABLE IF NOT EXISTS notification_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    chat_id BIGINT NOT NULL,
+                    game_id INTEGER,
+                    text TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sent', 'failed')),
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    last_error TEXT,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    sent_at TIMESTAMP
+                )
+                ''',
+                "CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending ON notification_outbox (next_attempt_at, chat_id) WHERE status = 'pending'",
+                "CREATE INDEX IF NOT EXISTS idx_notification_outbox_sent ON notification_outbox (sent_at) WHERE status = 'sent'"
+            ],
+            "Create notification_outbox table drained by the notification dispatcher"
+        )
+
+        # Migration 14: Partition creation moves rows out of the default partition first
+        migrator.run_migration(
+            "partitions_adopt_default_rows",
+            [
+                TRANSACTIONS_PARTITION_FUNCTION
+            ],
+            "Let create_transactions_partitions cover months that already have rows in transactions_default"
+        )
+
+        # Migration 15: Ledger writes that kept failing, parked instead of dropped
+        migrator.run_migration(
+            "create_ledger_dead_letters",
+            [
+                '''
+                CREATE TABLE IF NOT EXISTS ledger_dead_letters (
+                    id SERIAL PRIMARY KEY,
+                    game_id INTEGER NOT NULL,
+                    op JSONB NOT NULL,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    resolved_at TIMESTAMP
+                )
+                ''',
+                "CREATE INDEX IF NOT EXISTS idx_ledger_dead_letters_unresolved ON ledger_dead_letters (game_id, id) WHERE resolved_at IS NULL"
+            ],
+            "Create ledger_dead_letters table for ledger writes that could not be applied"
+        )
+
+        # Migration 16: Settlement plans are keyed by player id and invalidated by new transactions
+        migrator.run_migration(
+            "settlements_by_player_id",
+            [
+                # Plans cached before are keyed by name; without a watermark they are recomputed on the next read
+                "ALTER TABLE game_settlements ADD COLUMN IF NOT EXISTS watermark TEXT"
+            ],
+            "Add game_settlements.watermark and recompute plans keyed by player name"
+        )
+
+        # Migration 17: Outbox rows are leased while they are sent, outside any transaction
+        migrator.run_migration(
+            "lease_notification_outbox",
+            [
+                "ALTER TABLE notification_outbox ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP",
+                "ALTER TABLE notification_outbox DROP CONSTRAINT IF EXISTS notification_outbox_status_check",
+                "ALTER TABLE notification_outbox ADD CONSTRAINT notification_outbox_status_check "
+                "CHECK (status IN ('pending', 'sending', 'sent', 'failed'))",
+                "CREATE INDEX IF NOT EXISTS idx_notification_outbox_leased ON notification_outbox (lease_until) WHERE status = 'sending'"
+            ],
+            "Add notification_outbox.lease_until and the 'sending' status"
+        )
+
 def rollback_migration(migration_name):
     """Rollback a specific migration (use with caution!)"""
     with DatabaseMigrator() as migrator:
@@ -161,6 +437,75 @@ def rollback_migration(migration_name):
             ],
             "create_game_history_table": [
                 "DROP TABLE IF EXISTS game_history CASCADE"
+            ],
+            "partition_transactions_by_month": [
+                '''
+                CREATE TABLE transactions_heap (
+                    id INTEGER PRIMARY KEY DEFAULT nextval('transactions_id_seq'),
+                    player_id INTEGER NOT NULL,
+                    game_id INTEGER NOT NULL,
+                    amount NUMERIC(10,1) NOT NULL,
+                    type TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY(player_id) REFERENCES players(id) ON DELETE CASCADE,
+                    FOREIGN KEY(game_id) REFERENCES games(id) ON DELETE CASCADE,
+                    CONSTRAINT check_type_valid CHECK (type IN ('buyin', 'rebuy', 'cashout'))
+                )
+                ''',
+                "INSERT INTO transactions_heap SELECT id, player_id, game_id, amount, type, created_at FROM transactions",
+                "ALTER SEQUENCE transactions_id_seq OWNED BY transactions_heap.id",
+                "DROP TABLE transactions CASCADE",
+                "DROP FUNCTION IF EXISTS create_transactions_partitions(DATE, DATE)",
+                "ALTER TABLE transactions_heap RENAME TO transactions",
+                "ALTER INDEX transactions_heap_pkey RENAME TO transactions_pkey",
+                "CREATE INDEX IF NOT EXISTS idx_transactions_game_id ON transactions(game_id)",
+                "CREATE INDEX IF NOT EXISTS idx_transactions_player_id ON transactions(player_id)"
+            ],
+            "create_transactions_archive": [
+                "DROP TABLE IF EXISTS transactions_archive",
+                "ALTER TABLE games DROP COLUMN IF EXISTS archived_at",
+                "ALTER TABLE games DROP COLUMN IF EXISTS ended_at"
+            ],
+            "create_maintenance_checkpoints": [
+                "DROP TABLE IF EXISTS maintenance_checkpoints"
+            ],
+            "scope_games_by_chat": [
+                "DROP INDEX IF EXISTS idx_games_chat_active",
+                "ALTER TABLE games DROP COLUMN IF EXISTS chat_id"
+            ],
+            "unique_active_game_per_chat": [
+                "DROP INDEX IF EXISTS uniq_games_active_chat"
+            ],
+            "add_player_name_search_indexes": [
+                "DROP INDEX IF EXISTS idx_players_name_id",
+                "DROP INDEX IF EXISTS idx_players_name_trgm",
+                "DROP INDEX IF EXISTS idx_players_lower_name"
+            ],
+            "create_imported_games": [
+                "DROP TABLE IF EXISTS imported_games"
+            ],
+            "create_game_settlements": [
+                "DROP TABLE IF EXISTS game_settlements"
+            ],
+            "create_notification_outbox": [
+                "DROP TABLE IF EXISTS notification_outbox"
+            ],
+            # The new function is a drop-in replacement for the old one
+            "partitions_adopt_default_rows": [],
+            "create_ledger_dead_letters": [
+                "DROP TABLE IF EXISTS ledger_dead_letters"
+            ],
+            "lease_notification_outbox": [
+                "DROP INDEX IF EXISTS idx_notification_outbox_leased",
+                "UPDATE notification_outbox SET status = 'pending' WHERE status = 'sending'",
+                "ALTER TABLE notification_outbox DROP CONSTRAINT IF EXISTS notification_outbox_status_check",
+                "ALTER TABLE notification_outbox ADD CONSTRAINT notification_outbox_status_check "
+                "CHECK (status IN ('pending', 'sent', 'failed'))",
+                "ALTER TABLE notification_outbox DROP COLUMN IF EXISTS lease_until"
+            ],
+            "settlements_by_player_id": [
+                "DELETE FROM game_settlements",
+                "ALTER TABLE game_settlements DROP COLUMN IF EXISTS watermark"
             ]
         }
         
@@ -188,6 +533,49 @@ def rollback_migration(migration_name):
         else:
             logger.error(f"No rollback SQL defined for migration {migration_name}")
 
+def ensure_transaction_partitions(months_ahead=PARTITION_MONTHS_AHEAD):
+    """Create missing monthly transactions partitions up to `months_ahead` months from now"""
+    with DatabaseMigrator() as migrator:
+        migrator.cursor.execute("SELECT to_regproc('create_transactions_partitions')")
+        if migrator.cursor.fetchone()[0] is None:
+            logger.info("transactions is not partitioned yet, skipping partition maintenance")
+            return 0
+        migrator.cursor.execute(
+            "SELECT create_transactions_partitions(CURRENT_DATE, (CURRENT_DATE + make_interval(months => %s))::date)",
+            (months_ahead,)
+        )
+        created = migrator.cursor.fetchone()[0]
+        migrator.connection.commit()
+        logger.info(f"Partition maintenance created {created} transactions partition(s)")
+        return created
+
+
+def detach_transaction_partition(partition_name):
+    """Detach an old monthly partition so it can be archived or dropped without touching live data"""
+    # Only the monthly partitions ensure_transaction_partitions creates, never the default one
+    if not MONTHLY_PARTITION_NAME.fullmatch(partition_name):
+        raise ValueError(f"Not a monthly transactions partition: {partition_name!r} (expected transactions_y2024m01)")
+    with DatabaseMigrator() as migrator:
+        migrator.cursor.execute(sql.SQL("ALTER TABLE transactions DETACH PARTITION {}").format(
+            sql.Identifier(partition_name)))
+        migrator.connection.commit()
+        logger.info(f"Detached partition {partition_name} from transactions")
+
+
+def schedule_partition_maintenance(interval_hours=24):
+    """Keep future partitions created while the bot is running"""
+    def run():
+        try:
+            ensure_transaction_partitions()
+        except Exception as e:
+            logger.error(f"Partition maintenance failed: {e}")
+        timer = threading.Timer(interval_hours * 3600, run)
+        timer.daemon = True
+        timer.start()
+
+    run()
+
+
 def show_migration_status():
     """Show which migrations have been applied"""
     with DatabaseMigrator() as migrator:
@@ -222,10 +610,16 @@ if __name__ == "__main__":
             rollback_migration(sys.argv[2])
         elif command == "status":
             show_migration_status()
+        elif command == "partitions":
+            ensure_transaction_partitions()
+        elif command == "detach" and len(sys.argv) > 2:
+            detach_transaction_partition(sys.argv[2])
         else:
             print("Usage:")
             print("  python migrations.py migrate    # Run all pending migrations")
             print("  python migrations.py rollback <migration_name>  # Rollback specific migration")
             print("  python migrations.py status     # Show migration status")
+            print("  python migrations.py partitions # Create upcoming transactions partitions")
+            print("  python migrations.py detach <partition_name>  # Detach an old transactions partition")
     else:
         run_all_migrations() 
\ No newline at end of file
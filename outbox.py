@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Notification outbox for PokerBot
+Notifications are written to notification_outbox in the same transaction as
+the change they announce and delivered by a background dispatcher that
+leases them, batches them per recipient and retries with backoff
+"""
+
+import os
+import time
+import logging
+import threading
+from telebot.apihelper import ApiTelegramException
+import digest
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_BATCH_CHATS = int(os.getenv("OUTBOX_BATCH_CHATS", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_KEEP_DAYS = int(os.getenv("OUTBOX_KEEP_DAYS", "7"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_BACKOFF_SECONDS = 5
+OUTBOX_MAX_BACKOFF_SECONDS = 600
+OUTBOX_CLEANUP_SECONDS = 3600
+
+ENQUEUE_SQL = """
+    INSERT INTO notification_outbox (chat_id, game_id, text)
+    SELECT chat_id, %s, text FROM unnest(%s::bigint[], %s::text[]) AS n(chat_id, text)
+"""
+
+# Rows ready to send: pending and due, or leased by a dispatcher that never reported back
+CLAIMABLE = """(
+    status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+    OR status = 'sending' AND lease_until < CURRENT_TIMESTAMP
+)"""
+
+# Chats whose oldest due notification has waited a whole digest window, or
+# that already have a full digest; their rows are leased and the lease committed
+# before anything is sent
+CLAIM_SQL = f"""
+    WITH due AS (
+        SELECT chat_id
+        FROM notification_outbox
+        WHERE {CLAIMABLE}
+        GROUP BY chat_id
+        HAVING MIN(created_at) <= CURRENT_TIMESTAMP - make_interval(secs => %s) OR COUNT(*) >= %s
+        ORDER BY MIN(created_at)
+        LIMIT %s
+    ), claimed AS (
+        SELECT id
+        FROM notification_outbox
+        WHERE {CLAIMABLE} AND chat_id IN (SELECT chat_id FROM due)
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE notification_outbox o
+    SET status = 'sending', lease_until = CURRENT_TIMESTAMP + make_interval(secs => %s)
+    FROM claimed
+    WHERE o.id = claimed.id
+    RETURNING o.id, o.chat_id, o.text, o.attempts
+"""
+
+
+def enqueue(cursor, game_id, messages):
+    """Add [(chat_id, text)] to the outbox inside the caller's transaction"""
+    if not messages:
+        return 0
+    cursor.execute(ENQUEUE_SQL, (game_id, [chat_id for chat_id, _ in messages], [text for _, text in messages]))
+    return len(messages)
+
+
+def is_permanent(error):
+    """Errors retrying cannot fix: the user blocked the bot, the chat is gone, the text is rejected"""
+    return isinstance(error, ApiTelegramException) and error.error_code in (400, 403)
+
+
+def retry_after(error, attempts):
+    """Seconds until the next attempt: Telegram's retry_after for 429, else exponential backoff"""
+    if isinstance(error, ApiTelegramException) and error.error_code == 429:
+        parameters = (error.result_json or {}).get("parameters") or {}
+        if parameters.get("retry_after"):
+            return parameters["retry_after"]
+    return min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF_SECONDS)
+
+
+class OutboxDispatcher:
+    """Background thread delivering pending outbox rows.
+
+    Each batch leases due rows (status 'sending' until lease_until) in a
+    short transaction, sends every recipient's notifications as digests with
+    no transaction or connection held, then records each recipient's outcome
+    in a second short transaction. A crash between a send and its record
+    leaves the lease to expire and the digest is sent again: delivery is
+    at-least-once.
+    """
+
+    def __init__(self, connect, send, window=digest.NOTIFY_DIGEST_SECONDS,
+                 max_events=digest.NOTIFY_DIGEST_MAX_EVENTS, max_length=4096,
+                 poll=OUTBOX_POLL_SECONDS, batch_chats=OUTBOX_BATCH_CHATS, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 lease=OUTBOX_LEASE_SECONDS):
+        self.connect = connect
+        self.send = send
+        self.window = window
+        self.max_events = max_events
+        self.max_length = max_length
+        self.poll = poll
+        self.batch_chats = batch_chats
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.wakeup = threading.Event()
+        self.next_cleanup = time.monotonic() + OUTBOX_CLEANUP_SECONDS
+        self.worker = None
+
+    def start(self):
+        """Start delivering; only the processes serving updates do, not the maintenance CLIs"""
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._dispatch_loop, name="outbox", daemon=True)
+            self.worker.start()
+
+    def wake(self):
+        """Look for due notifications now instead of at the next poll"""
+        self.wakeup.set()
+
+    def _dispatch_loop(self):
+        while True:
+            self.wakeup.wait(self.poll)
+            self.wakeup.clear()
+            try:
+                # Keep going while batches come back full
+                while self.dispatch() >= self.batch_chats:
+                    pass
+                if time.monotonic() >= self.next_cleanup:
+                    self.cleanup()
+                    self.next_cleanup = time.monotonic() + OUTBOX_CLEANUP_SECONDS
+            except Exception as e:
+                logger.error(f"Outbox dispatch failed: {e}")
+
+    def dispatch(self):
+        """Deliver one batch of due notifications; returns the number of recipients handled"""
+        conn = self.connect()
+        try:
+            conn.autocommit = False
+            with conn.cursor() as c:
+                c.execute(CLAIM_SQL, (self.window, self.max_events, self.batch_chats, self.lease))
+                rows = c.fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        recipients = {}
+        for row_id, chat_id, text, attempts in sorted(rows, key=lambda row: (row[1], row[0])):
+            recipients.setdefault(chat_id, []).append((row_id, text, attempts))
+        for chat_id, pending in recipients.items():
+            outcomes = self._deliver(chat_id, pending)
+            try:
+                self._record(outcomes)
+            except Exception as e:
+                # The lease runs out and these are sent again
+                logger.error(f"Could not record delivery to {chat_id}: {e}")
+        return len(recipients)
+
+    def _deliver(self, chat_id, pending):
+        """Send a recipient's leased notifications; returns [(ids, error, attempts)], error None when sent"""
+        texts = [text for _, text, _ in pending]
+        outcomes = []
+        for indexes in digest.pack(texts, self.max_length):
+            ids = [pending[i][0] for i in indexes]
+            attempts = max(pending[i][2] for i in indexes) + 1
+            try:
+                # Only a single oversized notification takes more than one message;
+                # a retry sends all of its parts again
+                for part in digest.split(digest.join([texts[i] for i in indexes]), self.max_length):
+                    self.send(chat_id, part)
+            except Exception as e:
+                outcomes.append((ids, e, attempts))
+                continue
+            outcomes.append((ids, None, attempts))
+        if len(pending) > 1:
+            logger.info(f"Processed {len(pending)} notification(s) to {chat_id}")
+        return outcomes
+
+    def _record(self, outcomes):
+        """Store the outcome of every digest of one recipient in one short transaction"""
+        conn = self.connect()
+        try:
+            conn.autocommit = False
+            with conn.cursor() as c:
+                for ids, error, attempts in outcomes:
+                    if error is None:
+                        c.execute("""
+                            UPDATE notification_outbox
+                            SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL, lease_until = NULL
+                            WHERE id = ANY(%s)
+                        """, (ids,))
+                    elif is_permanent(error) or attempts >= self.max_attempts:
+                        logger.error(f"Giving up on {len(ids)} notification(s) after {attempts} attempt(s): {error}")
+                        c.execute("""
+                            UPDATE notification_outbox
+                            SET status = 'failed', attempts = attempts + 1, last_error = %s, lease_until = NULL
+                            WHERE id = ANY(%s)
+                        """, (str(error), ids))
+                    else:
+                        delay = retry_after(error, attempts)
+                        logger.warning(f"{len(ids)} notification(s) failed (attempt {attempts}), "
+                                       f"retrying in {delay}s: {error}")
+                        c.execute("""
+                            UPDATE notification_outbox
+                            SET status = 'pending', attempts = attempts + 1, last_error = %s, lease_until = NULL,
+                                next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                            WHERE id = ANY(%s)
+                        """, (str(error), delay, ids))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def cleanup(self):
+        """Delete delivered notifications older than OUTBOX_KEEP_DAYS"""
+        conn = self.connect()
+        try:
+            with conn.cursor() as c:
+                c.execute("""
+                    DELETE FROM notification_outbox
+                    WHERE status = 'sent' AND sent_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+                """, (OUTBOX_KEEP_DAYS,))
+                deleted = c.rowcount
+            conn.commit()
+            if deleted:
+                logger.info(f"Deleted {deleted} delivered notification(s) from the outbox")
+        finally:
+            conn.close()
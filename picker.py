@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Player picker keyboards for PokerBot
+Paginated, searchable inline keyboards for choosing a player, shared by the
+admin flows; pages are fetched lazily by keyset on (name, id)
+"""
+
+import os
+import telebot
+
+PICKER_PAGE_SIZE = int(os.getenv("PICKER_PAGE_SIZE", "8"))
+# Telegram rejects callback_data longer than 64 bytes; the search term gets what
+# is left after the prefix, flow, scope, direction and anchor
+CALLBACK_PREFIX = "pk"
+SEARCH_MAX_BYTES = 24
+
+# Keyset condition and sort order for each page direction; the anchor is a player id
+KEYSET = {
+    'f': ("TRUE", "ASC"),
+    'n': ("(name, id) > (SELECT name, id FROM players WHERE id = %(anchor)s)", "ASC"),
+    'p': ("(name, id) < (SELECT name, id FROM players WHERE id = %(anchor)s)", "DESC"),
+}
+
+SEARCH_SQL = """
+    SELECT id, name FROM players
+    WHERE {keyset} AND {match}
+    ORDER BY name {order}, id {order}
+    LIMIT %(limit)s
+"""
+
+
+def normalize_search(text):
+    """Trim a search term so it always fits into callback_data"""
+    data = (text or "").strip().encode("utf-8")[:SEARCH_MAX_BYTES]
+    return data.decode("utf-8", errors="ignore")
+
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_players(cursor, search, direction, anchor_id, limit):
+    """Registered players matching `search`, one keyset page in query order.
+
+    Short terms match name prefixes through idx_players_lower_name; longer ones
+    match anywhere in the name through the trigram index idx_players_name_trgm.
+    """
+    keyset, order = KEYSET[direction]
+    if not search:
+        match = "TRUE"
+    elif len(search) < 3:
+        match = "lower(name) LIKE %(pattern)s"
+    else:
+        match = "name ILIKE %(pattern)s"
+    pattern = _escape_like(search.lower())
+    pattern = pattern + "%" if len(search) < 3 else "%" + pattern + "%"
+    cursor.execute(SEARCH_SQL.format(keyset=keyset, match=match, order=order),
+                   {'anchor': anchor_id, 'pattern': pattern, 'limit': limit})
+    return cursor.fetchall()
+
+
+def page_players(players, search, direction, anchor_id, limit):
+    """The same paging as search_players over an in-memory list of (id, name)"""
+    search = search.lower()
+    if len(search) < 3:
+        # Same rule as search_players: short terms match name prefixes only
+        rows = [(player_id, name) for player_id, name in players if name.lower().startswith(search)]
+    else:
+        rows = [(player_id, name) for player_id, name in players if search in name.lower()]
+    rows.sort(key=lambda row: (row[1], row[0]))
+    if direction == 'f':
+        return rows[:limit]
+    anchor = next(((name, player_id) for player_id, name in rows if player_id == anchor_id), None)
+    if anchor is None:
+        return []
+    if direction == 'n':
+        return [row for row in rows if (row[1], row[0]) > anchor][:limit]
+    return [row for row in reversed(rows) if (row[1], row[0]) < anchor][:limit]
+
+
+class PlayerPicker:
+    """Registry of picker flows and the keyboards they render.
+
+    A flow has a short code used in callback_data, a title, a function building
+    the callback_data of a selected player and a page source with the
+    signature of search_players minus the cursor, plus the flow scope first.
+    """
+
+    def __init__(self, page_size=PICKER_PAGE_SIZE):
+        self.page_size = page_size
+        self.flows = {}
+
+    def register(self, code, title, select_data, source):
+        self.flows[code] = (title, select_data, source)
+
+    def handles(self, data):
+        return data.startswith(CALLBACK_PREFIX + ":")
+
+    def render(self, code, scope=0, search="", direction='f', anchor_id=None):
+        """Return (text, reply_markup) for one page of flow `code`"""
+        title, select_data, source = self.flows[code]
+        rows = source(scope, search, direction, anchor_id, self.page_size + 1)
+        if not rows and direction != 'f':
+            # The anchor player is gone; start over
+            return self.render(code, scope, search)
+
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if direction == 'p':
+            rows.reverse()
+            has_prev, has_next = more, True
+        else:
+            has_prev, has_next = direction == 'n', more
+
+        heading = title.format(scope=scope)
+        if search:
+            heading += f" (search: {search})"
+        if not rows:
+            return f"❌ No players found{' matching ' + search if search else ''}.", None
+
+        keyboard = telebot.types.InlineKeyboardMarkup()
+        for player_id, name in rows:
+            keyboard.add(telebot.types.InlineKeyboardButton(text=name, callback_data=select_data(scope, player_id)))
+        buttons = []
+        if has_prev:
+            buttons.append(telebot.types.InlineKeyboardButton(
+                text="◀️", callback_data=self._page_data(code, scope, 'p', rows[0][0], search)))
+        if has_next:
+            buttons.append(telebot.types.InlineKeyboardButton(
+                text="▶️", callback_data=self._page_data(code, scope, 'n', rows[-1][0], search)))
+        if buttons:
+            keyboard.row(*buttons)
+        return heading, keyboard
+
+    def render_callback(self, data):
+        """Render the page a ◀️/▶️ button points at"""
+        _, code, scope, direction, anchor_id, search = data.split(":", 5)
+        return self.render(code, int(scope), search, direction, int(anchor_id))
+
+    def _page_data(self, code, scope, direction, anchor_id, search):
+        return f"{CALLBACK_PREFIX}:{code}:{scope}:{direction}:{anchor_id}:{search}"
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Long-polling runner for PokerBot
+Fetches updates with getUpdates, processes them on a fixed pool of workers
+that keeps every chat's updates in order, and acknowledges (and checkpoints)
+an update only once it and every update before it has been handled
+"""
+
+import os
+import queue
+import signal
+import logging
+import threading
+from telebot import apihelper, types
+from prefilter import ALLOWED_UPDATES
+
+logger = logging.getLogger(__name__)
+
+POLL_LIMIT = min(max(int(os.getenv("POLL_LIMIT", "100")), 1), 100)
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", "25"))
+POLL_WORKERS = int(os.getenv("POLL_WORKERS", os.getenv("BOT_THREADS", "2")))
+POLL_CHECKPOINT_SECONDS = float(os.getenv("POLL_CHECKPOINT_SECONDS", "1"))
+POLL_SHUTDOWN_SECONDS = float(os.getenv("POLL_SHUTDOWN_SECONDS", "30"))
+POLL_MAX_BACKOFF_SECONDS = 30
+
+# maintenance_checkpoints row holding the last update_id handled together with everything before it
+POLL_CHECKPOINT = 'polling_offset'
+# Telegram picks update ids at random again after a week without updates, so older checkpoints are void
+POLL_CHECKPOINT_MAX_AGE_DAYS = 6
+
+
+def chat_key(update):
+    """Key whose updates must be handled in order: the chat, or the user for chatless updates"""
+    for kind in ALLOWED_UPDATES:
+        body = update.get(kind)
+        if body is None:
+            continue
+        chat = body.get('chat') or (body.get('message') or {}).get('chat')
+        if chat:
+            return chat.get('id')
+        return (body.get('from') or {}).get('id')
+    return None
+
+
+class PollingRunner:
+    """getUpdates loop feeding one queue per worker.
+
+    Updates are routed to workers by chat, so one chat's updates run one
+    after another while different chats run in parallel. The offset sent to
+    Telegram (which acknowledges everything before it) and the checkpoint in
+    maintenance_checkpoints only move past an update once it and all earlier
+    ones are done: a crash redelivers unfinished updates instead of losing
+    them, and the checkpoint skips the ones that were already handled.
+    """
+
+    def __init__(self, bot, connect, update_filter=None, limit=POLL_LIMIT, timeout=POLL_TIMEOUT,
+                 workers=POLL_WORKERS):
+        self.bot = bot
+        self.connect = connect
+        self.update_filter = update_filter
+        self.limit = limit
+        self.timeout = timeout
+        self.queues = [queue.Queue() for _ in range(max(workers, 1))]
+        self.lock = threading.Condition()  # reentrant, so acknowledged() also works under it
+        self.in_flight = set()  # update ids handed to a worker and not finished yet
+        self.last_seen = None  # highest update id handed to a worker
+        self.saved = None  # acknowledged update id last written to the checkpoint
+        self.stopping = threading.Event()
+
+    def acknowledged(self):
+        """Highest update id that has been handled together with every update before it"""
+        with self.lock:
+            if self.in_flight:
+                return min(self.in_flight) - 1
+            return self.last_seen
+
+    def backlog(self):
+        """Updates waiting for a worker"""
+        return sum(q.qsize() for q in self.queues)
+
+    def load_checkpoint(self):
+        conn = self.connect()
+        try:
+            c = conn.cursor()
+            c.execute("""
+                SELECT last_id FROM maintenance_checkpoints
+                WHERE job_name = %s AND updated_at > CURRENT_TIMESTAMP - make_interval(days => %s)
+            """, (POLL_CHECKPOINT, POLL_CHECKPOINT_MAX_AGE_DAYS))
+            row = c.fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def save_checkpoint(self):
+        update_id = self.acknowledged()
+        if update_id is None or update_id == self.saved:
+            return
+        conn = self.connect()
+        try:
+            c = conn.cursor()
+            # Overwritten rather than GREATEST: ids may restart lower after a week of silence
+            c.execute("""
+                INSERT INTO maintenance_checkpoints (job_name, last_id, updated_at)
+                VALUES (%s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (job_name) DO UPDATE
+                SET last_id = EXCLUDED.last_id, updated_at = EXCLUDED.updated_at
+            """, (POLL_CHECKPOINT, update_id))
+            conn.commit()
+            self.saved = update_id
+        finally:
+            conn.close()
+
+    def run(self):
+        """Poll until SIGINT or SIGTERM, then finish the updates already taken and exit"""
+        try:
+            self.last_seen = self.saved = self.load_checkpoint()
+        except Exception as e:
+            logger.error(f"Could not read the polling checkpoint, starting from Telegram's offset: {e}")
+        # Handlers run on our workers, not on telebot's thread pool
+        self.bot.threaded = False
+        workers = [threading.Thread(target=self._work, args=(q,), name=f"poll-worker-{i}", daemon=True)
+                   for i, q in enumerate(self.queues)]
+        for worker in workers:
+            worker.start()
+        threading.Thread(target=self._checkpoint_loop, name="poll-checkpoint", daemon=True).start()
+        # The fetch loop may sit in a long poll; it is abandoned on shutdown, and
+        # whatever it still brings back was never acknowledged
+        threading.Thread(target=self._fetch_loop, name="poll-fetch", daemon=True).start()
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.stopping.set())
+        logger.info(f"Polling with {len(self.queues)} worker(s), up to {self.limit} update(s) "
+                    f"per request, {self.timeout}s long poll, resuming after update {self.saved}")
+        while not self.stopping.wait(1):
+            pass
+        self.shutdown(workers)
+
+    def shutdown(self, workers):
+        logger.info(f"Stopping: finishing {self.backlog()} queued update(s)...")
+        for q in self.queues:
+            q.put(None)
+        for worker in workers:
+            worker.join(POLL_SHUTDOWN_SECONDS)
+        with self.lock:
+            unfinished = len(self.in_flight)
+        if unfinished:
+            logger.warning(f"{unfinished} update(s) did not finish and will be delivered again")
+        try:
+            self.save_checkpoint()
+        except Exception as e:
+            logger.error(f"Could not save the polling checkpoint: {e}")
+        acknowledged = self.acknowledged()
+        if acknowledged is not None:
+            try:
+                # Tell Telegram too, so another runner or a webhook does not get them again
+                apihelper.get_updates(self.bot.token, offset=acknowledged + 1, limit=1, long_polling_timeout=1)
+            except Exception as e:
+                logger.warning(f"Could not acknowledge updates up to {acknowledged}: {e}")
+        logger.info(f"Polling stopped after update {acknowledged}")
+
+    def _fetch_loop(self):
+        failures = 0
+        while not self.stopping.is_set():
+            acknowledged = self.acknowledged()
+            try:
+                updates = apihelper.get_updates(
+                    self.bot.token, offset=acknowledged + 1 if acknowledged is not None else None,
+                    limit=self.limit, allowed_updates=ALLOWED_UPDATES, long_polling_timeout=self.timeout)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = min(2 ** failures, POLL_MAX_BACKOFF_SECONDS)
+                logger.error(f"getUpdates failed, retrying in {delay}s: {e}")
+                self.stopping.wait(delay)
+                continue
+            if self.stopping.is_set():
+                return
+            if not self._dispatch(updates) and updates:
+                # Everything returned is still being handled: an update before them is
+                # slow, and asking again would bring back the same batch
+                with self.lock:
+                    self.lock.wait_for(lambda: self.acknowledged() != acknowledged, timeout=self.timeout)
+
+    def _dispatch(self, updates):
+        """Hand new updates to their chat's worker; returns how many were new"""
+        new = []
+        with self.lock:
+            if self.stopping.is_set():
+                return 0
+            for update in updates:
+                update_id = update['update_id']
+                if self.last_seen is not None and update_id <= self.last_seen:
+                    continue
+                self.last_seen = update_id
+                self.in_flight.add(update_id)
+                new.append(update)
+        for update in new:
+            self.queues[hash(chat_key(update)) % len(self.queues)].put(update)
+        return len(new)
+
+    def _work(self, updates):
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            try:
+                if self.update_filter is None or self.update_filter.reject(update) is None:
+                    self.bot.process_new_updates([types.Update.de_json(update)])
+            except Exception as e:
+                logger.error(f"Error processing update {update.get('update_id')}: {e}")
+            finally:
+                with self.lock:
+                    self.in_flight.discard(update['update_id'])
+                    self.lock.notify_all()
+
+    def _checkpoint_loop(self):
+        while not self.stopping.wait(POLL_CHECKPOINT_SECONDS):
+            try:
+                self.save_checkpoint()
+            except Exception as e:
+                logger.error(f"Could not save the polling checkpoint: {e}")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Early update filtering for PokerBot
+Parses webhook payloads with a fast JSON parser and drops updates no handler
+would act on before telebot builds Update objects for them
+"""
+
+import logging
+import threading
+
+try:
+    import orjson
+
+    def loads(payload):
+        return orjson.loads(payload)
+except ImportError:
+    import json
+
+    def loads(payload):
+        return json.loads(payload)
+
+logger = logging.getLogger(__name__)
+
+# The only update types PokerBot has handlers for; Telegram is told not to send the rest
+ALLOWED_UPDATES = ["message", "callback_query", "inline_query"]
+
+
+def registered_commands(bot):
+    """Commands of every message handler registered on `bot`"""
+    commands = set()
+    for handler in bot.message_handlers:
+        commands.update(handler['filters'].get('commands') or [])
+    return commands
+
+
+class UpdateFilter:
+    """Cheap checks on a raw update dict; reject() returns why an update can be dropped, or None.
+
+    Plain messages are kept only for chats waiting in a next-step flow
+    (amounts, passwords, names); everything else must be one of our commands.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.commands = registered_commands(bot)
+        self.username = None
+        self.lock = threading.Lock()
+        self.dropped = {}  # reason -> count
+
+    def _bot_username(self):
+        if self.username is None:
+            try:
+                self.username = (self.bot.user.username or "").lower()
+            except Exception as e:
+                logger.warning(f"Could not look up the bot username: {e}")
+                return None
+        return self.username
+
+    def _awaits_reply(self, chat_id):
+        handlers = getattr(self.bot.next_step_backend, 'handlers', None)
+        # Backends that cannot be inspected cheaply keep every message
+        return handlers is None or chat_id in handlers
+
+    def reject(self, update):
+        reason = self._reason(update)
+        if reason is not None:
+            with self.lock:
+                self.dropped[reason] = self.dropped.get(reason, 0) + 1
+        return reason
+
+    def _reason(self, update):
+        kind = next((key for key in update if key != 'update_id'), None)
+        if kind not in ALLOWED_UPDATES:
+            return f"type:{kind}"
+        if (update[kind].get('from') or {}).get('is_bot'):
+            return "from_bot"
+        if kind != 'message':
+            return None
+
+        message = update['message']
+        chat_id = (message.get('chat') or {}).get('id')
+        text = message.get('text')
+        if not text or not text.startswith('/'):
+            return None if self._awaits_reply(chat_id) else "not_command"
+        command, _, addressee = text.split(maxsplit=1)[0][1:].partition('@')
+        if addressee:
+            username = self._bot_username()
+            if username and addressee.lower() != username:
+                return "other_bot"
+        if command not in self.commands and not self._awaits_reply(chat_id):
+            return "unknown_command"
+        return None
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+On-demand sampling profiler for PokerBot
+While a session runs, every task the bot dispatches (handlers with their
+middlewares, next-step replies) marks the thread running it and a sampler
+thread records their stacks; the result is a collapsed stack file for flame
+graph tools. Nothing is installed while no session runs
+"""
+
+import os
+import sys
+import time
+import types
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+PROFILE_MAX_DEPTH = 128
+PROFILE_TOP_HANDLERS = 5
+
+# Root frame of samples taken outside any known handler (middlewares, filters)
+DISPATCH = "(dispatch)"
+
+
+def handler_code(function):
+    """Code object of the function a handler calls in the end, looking through decorators and lambdas"""
+    while True:
+        inner = getattr(function, '__wrapped__', None)
+        if inner is None:
+            inner = next((cell.cell_contents for cell in function.__closure__ or ()
+                          if isinstance(cell.cell_contents, types.FunctionType)), None)
+        if inner is None and function.__code__.co_name == '<lambda>':
+            # Next-step handlers are registered as lambda m: process_buyin(m, ...)
+            inner = next((function.__globals__[name] for name in function.__code__.co_names
+                          if isinstance(function.__globals__.get(name), types.FunctionType)), None)
+        if inner is None:
+            return function.__code__
+        function = inner
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """One profiling run of `seconds` seconds or `updates` updates, whichever ends first.
+
+    While it runs, the session shadows the bot's _exec_task, through which
+    telebot runs every handler task: the middleware chain with its handler,
+    and next-step replies, which skip middlewares. Wrapping the task rather
+    than process_new_updates marks the thread that actually runs it, also
+    when the bot hands tasks to its worker pool.
+    """
+
+    def __init__(self, bot, on_done, seconds, updates=None, interval=PROFILE_INTERVAL_MS / 1000):
+        self.bot = bot
+        self.on_done = on_done
+        self.seconds = seconds
+        self.updates = updates
+        self.interval = interval
+        self.handlers = {}  # code object -> handler name
+        for handler in bot.message_handlers + bot.callback_query_handlers + bot.inline_handlers:
+            code = handler_code(handler['function'])
+            self.handlers[code] = code.co_name
+        self.lock = threading.Lock()
+        self.threads = set()  # idents of threads processing an update
+        self.stacks = {}  # (handler, frames...) -> samples
+        self.processed = 0
+        self.samples = 0
+        self.started = None
+        self.elapsed = 0
+        self.finished = threading.Event()
+        self.closed = threading.Event()  # set once _exec_task is restored
+
+    def start(self):
+        self.started = time.monotonic()
+        exec_task = self.bot._exec_task
+        self.bot._exec_task = lambda task, *args, **kwargs: exec_task(self._traced(task), *args, **kwargs)
+        threading.Thread(target=self._sample_loop, name="profiler", daemon=True).start()
+
+    def stop(self):
+        self.finished.set()
+
+    def _traced(self, task):
+        if isinstance(task, types.FunctionType):
+            # A next-step handler, registered while the bot runs
+            code = handler_code(task)
+            with self.lock:
+                self.handlers.setdefault(code, code.co_name)
+
+        def traced(*args, **kwargs):
+            ident = threading.get_ident()
+            with self.lock:
+                self.threads.add(ident)
+            try:
+                return task(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.threads.discard(ident)
+                    self.processed += 1
+                    if self.updates and self.processed >= self.updates:
+                        self.finished.set()
+        return traced
+
+    def _sample_loop(self):
+        deadline = self.started + self.seconds
+        try:
+            while not self.finished.wait(self.interval) and time.monotonic() < deadline:
+                self._sample()
+        finally:
+            self.finished.set()
+            # Back to the class method; tasks already queued still finish traced
+            del self.bot._exec_task
+            self.closed.set()
+            self.elapsed = time.monotonic() - self.started
+            logger.info(f"Profiling finished: {self.samples} sample(s) over {self.processed} update(s) "
+                        f"in {self.elapsed:.1f}s")
+            try:
+                self.on_done(self)
+            except Exception as e:
+                logger.error(f"Failed to deliver the profile: {e}")
+
+    def _sample(self):
+        with self.lock:
+            threads = list(self.threads)
+            handlers = dict(self.handlers)
+        if not threads:
+            return
+        frames = sys._current_frames()
+        for ident in threads:
+            frame = frames.get(ident)
+            codes = []
+            while frame is not None and len(codes) < PROFILE_MAX_DEPTH:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            # Everything above the handler is telebot's dispatch, identical in every sample
+            root = next((i for i, code in enumerate(codes) if code in handlers), None)
+            if root is None:
+                key = (DISPATCH,) + tuple(codes)
+            else:
+                key = (handlers[codes[root]],) + tuple(codes[root:])
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Samples in the collapsed stack format of flamegraph.pl and speedscope"""
+        lines = []
+        for (handler, *codes), count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+            frames = [handler] + [frame_label(code) for code in codes]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def by_handler(self):
+        """(handler, samples) pairs, busiest first"""
+        totals = {}
+        for (handler, *_), count in self.stacks.items():
+            totals[handler] = totals.get(handler, 0) + count
+        return sorted(totals.items(), key=lambda item: -item[1])
+
+
+class Profiler:
+    """Runs at most one ProfileSession at a time"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.lock = threading.Lock()
+        self.session = None
+
+    def start(self, on_done, seconds=PROFILE_DEFAULT_SECONDS, updates=None):
+        """Start a session; returns it, or None when one is already running"""
+        with self.lock:
+            # A stopped session still counts until it has unhooked itself
+            if self.session is not None and not self.session.closed.is_set():
+                return None
+            self.session = ProfileSession(self.bot, on_done, min(seconds, PROFILE_MAX_SECONDS), updates)
+            self.session.start()
+            return self.session
+
+    def stop(self):
+        """End the running session early; returns False when none is running"""
+        with self.lock:
+            if self.session is None or self.session.finished.is_set():
+                return False
+            self.session.stop()
+            return True
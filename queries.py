@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Prepared statement registry for PokerBot
+The hot queries are prepared once per pooled connection and executed by name
+"""
+
+import re
+import logging
+import psycopg2
+from psycopg2 import errors
+
+logger = logging.getLogger(__name__)
+
+# name -> SQL with %s placeholders, in the order the parameters are passed
+QUERIES = {
+    "active_game": "SELECT id FROM games WHERE chat_id = %s AND is_active = TRUE ORDER BY id DESC LIMIT 1",
+    "game_is_active": "SELECT id FROM games WHERE id = %s AND is_active = TRUE",
+    "game_window": "SELECT date - INTERVAL '1 day' FROM games WHERE id = %s",
+    "player_by_telegram_id": "SELECT id, name FROM players WHERE telegram_id = %s",
+    "game_membership": "SELECT id FROM game_players WHERE player_id = %s AND game_id = %s",
+    "game_player_telegram_ids": """
+        SELECT p.telegram_id
+        FROM players p
+        JOIN game_players gp ON p.id = gp.player_id
+        WHERE gp.game_id = %s
+    """,
+    "add_game_player": "INSERT INTO game_players (player_id, game_id) VALUES (%s, %s) "
+                       "ON CONFLICT (player_id, game_id) DO NOTHING RETURNING id",
+    "insert_transaction": "INSERT INTO transactions (player_id, game_id, amount, type) VALUES (%s, %s, %s, %s) "
+                          "ON CONFLICT DO NOTHING",
+    "add_games_played": "UPDATE players SET games_played = games_played + %s WHERE id = %s",
+    "add_total_buyin": "UPDATE players SET total_buyin = total_buyin + %s WHERE id = %s",
+    "add_total_rebuys": "UPDATE players SET total_rebuys = total_rebuys + %s WHERE id = %s",
+    "add_total_cashout": "UPDATE players SET total_cashout = total_cashout + %s WHERE id = %s",
+    "setting_value": "SELECT setting_value FROM settings WHERE setting_name = %s",
+}
+
+# Counter column updated by each transaction type
+TOTALS_QUERY = {
+    "buyin": "add_total_buyin",
+    "rebuy": "add_total_rebuys",
+    "cashout": "add_total_cashout",
+}
+
+
+def _to_server_placeholders(sql):
+    """Turn %s placeholders into PostgreSQL's $1, $2, ... for PREPARE"""
+    counter = iter(range(1, 1000))
+    return re.sub(r"%s", lambda _: f"${next(counter)}", sql)
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """Connection that remembers which registry statements it has prepared.
+
+    A recycled connection is a new object with an empty set, so statements are
+    prepared again on first use.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def _prepare(cursor, name):
+    cursor.execute(f"PREPARE {name} AS {_to_server_placeholders(QUERIES[name])}")
+    cursor.connection.prepared.add(name)
+
+
+def execute(cursor, name, params=()):
+    """Execute registry statement `name` on `cursor`, preparing it first if needed.
+
+    Connections that are not PreparedConnection (e.g. one-off maintenance
+    connections) simply run the plain SQL.
+    """
+    connection = cursor.connection
+    prepared = getattr(connection, "prepared", None)
+    if prepared is None:
+        cursor.execute(QUERIES[name], params)
+        return cursor
+
+    if name not in prepared:
+        _prepare(cursor, name)
+
+    statement = f"EXECUTE {name}({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {name}"
+    try:
+        cursor.execute(statement, params)
+    except (errors.InvalidSqlStatementName, errors.FeatureNotSupported) as e:
+        # The server forgot the statement (DISCARD ALL, reset session) or the
+        # table shape changed under it; inside a transaction the caller must retry
+        if not connection.autocommit:
+            prepared.discard(name)
+            raise
+        logger.warning(f"Re-preparing statement {name}: {e}")
+        if isinstance(e, errors.FeatureNotSupported):
+            cursor.execute(f"DEALLOCATE {name}")
+        prepared.discard(name)
+        _prepare(cursor, name)
+        cursor.execute(statement, params)
+    return cursor
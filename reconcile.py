@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Drift reconciler for PokerBot
+Recomputes the denormalized player totals from transactions and game_players
+in small resumable chunks and reports every discrepancy it finds
+"""
+
+import os
+import sys
+import argparse
+import logging
+from psycopg2.extras import execute_values
+from bot import get_db_connection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "reconcile_player_totals"
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "500"))
+RECONCILE_LOCK_TIMEOUT = os.getenv("RECONCILE_LOCK_TIMEOUT", "2s")
+
+COUNTERS = ("total_buyin", "total_cashout", "total_rebuys", "games_played")
+
+# The next chunk of players; the rows stay locked only for this chunk's transaction
+LOCK_CHUNK_SQL = """
+    SELECT id FROM players
+    WHERE id > %s
+    ORDER BY id
+    LIMIT %s
+    FOR UPDATE
+"""
+
+# Current and expected counters of a locked chunk. A separate statement from the
+# lock: under READ COMMITTED it takes a fresh snapshot, so a ledger write that
+# committed while we waited for the lock shows up in both the counters and the sums
+CHUNK_SQL = """
+    WITH chunk AS (
+        SELECT id, name, total_buyin, total_cashout, total_rebuys, games_played
+        FROM players
+        WHERE id = ANY(%s)
+    ), ledger AS (
+        SELECT player_id,
+               SUM(CASE WHEN type = 'buyin' THEN -amount ELSE 0 END) AS total_buyin,
+               SUM(CASE WHEN type = 'cashout' THEN amount ELSE 0 END) AS total_cashout,
+               SUM(CASE WHEN type = 'rebuy' THEN -amount ELSE 0 END) AS total_rebuys
+        FROM transactions
+        WHERE player_id IN (SELECT id FROM chunk)
+        GROUP BY player_id
+    ), played AS (
+        SELECT player_id, COUNT(*) AS games_played
+        FROM game_players
+        WHERE player_id IN (SELECT id FROM chunk)
+        GROUP BY player_id
+    )
+    SELECT ch.id, ch.name,
+           ch.total_buyin, ch.total_cashout, ch.total_rebuys, ch.games_played,
+           COALESCE(l.total_buyin, 0), COALESCE(l.total_cashout, 0),
+           COALESCE(l.total_rebuys, 0), COALESCE(pl.games_played, 0)
+    FROM chunk ch
+    LEFT JOIN ledger l ON l.player_id = ch.id
+    LEFT JOIN played pl ON pl.player_id = ch.id
+    ORDER BY ch.id
+"""
+
+
+def load_checkpoint(cursor):
+    cursor.execute("SELECT last_id FROM maintenance_checkpoints WHERE job_name = %s", (JOB_NAME,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def save_checkpoint(cursor, last_id):
+    cursor.execute("""
+        INSERT INTO maintenance_checkpoints (job_name, last_id, updated_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (job_name) DO UPDATE SET last_id = EXCLUDED.last_id, updated_at = EXCLUDED.updated_at
+    """, (JOB_NAME, last_id))
+
+
+def reconcile_chunk(cursor, after_id, chunk_size, apply=True):
+    """Reconcile players with id > after_id; returns (last id seen, discrepancies)"""
+    cursor.execute(LOCK_CHUNK_SQL, (after_id, chunk_size))
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return None, []
+    cursor.execute(CHUNK_SQL, (ids,))
+    rows = cursor.fetchall()
+
+    discrepancies = []
+    for row in rows:
+        player_id, name = row[0], row[1]
+        current = row[2:6]
+        expected = row[6:10]
+        if tuple(current) != tuple(expected):
+            discrepancies.append((player_id, name, current, expected))
+
+    if apply and discrepancies:
+        execute_values(cursor, """
+            UPDATE players p
+            SET total_buyin = v.total_buyin,
+                total_cashout = v.total_cashout,
+                total_rebuys = v.total_rebuys,
+                games_played = v.games_played
+            FROM (VALUES %s) AS v(id, total_buyin, total_cashout, total_rebuys, games_played)
+            WHERE p.id = v.id
+        """, [(player_id,) + tuple(expected) for player_id, _, _, expected in discrepancies])
+
+    return ids[-1], discrepancies
+
+
+def run_reconciler(chunk_size=RECONCILE_CHUNK_SIZE, apply=True, restart=False):
+    """Walk all players chunk by chunk, resuming from the last checkpoint.
+
+    Returns the number of players whose counters had drifted.
+    """
+    connection = get_db_connection()
+    found = 0
+    try:
+        connection.autocommit = False
+        with connection.cursor() as c:
+            # Dry runs never save progress, so they always check every player
+            after_id = 0 if restart or not apply else load_checkpoint(c)
+            if after_id:
+                logger.info(f"Resuming reconciliation after player id {after_id}")
+
+            while True:
+                # Give up on a chunk rather than queue behind a long-running writer
+                c.execute("SET LOCAL lock_timeout = %s", (RECONCILE_LOCK_TIMEOUT,))
+                last_id, discrepancies = reconcile_chunk(c, after_id, chunk_size, apply)
+                if last_id is None:
+                    save_checkpoint(c, 0)
+                    connection.commit()
+                    break
+
+                for player_id, name, current, expected in discrepancies:
+                    changes = ", ".join(
+                        f"{column} {old} -> {new}"
+                        for column, old, new in zip(COUNTERS, current, expected) if old != new
+                    )
+                    logger.warning(f"Player {name} (ID: {player_id}) drifted: {changes}")
+                found += len(discrepancies)
+
+                if apply:
+                    save_checkpoint(c, last_id)
+                    connection.commit()
+                else:
+                    connection.rollback()
+                after_id = last_id
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    action = "fixed" if apply else "found"
+    logger.info(f"Reconciliation finished: {action} drift for {found} player(s)")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute denormalized player totals from the ledger")
+    parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE, help="players per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="report discrepancies without fixing them")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint and start over")
+    args = parser.parse_args()
+
+    drifted = run_reconciler(args.chunk_size, apply=not args.dry_run, restart=args.restart)
+    # A non-zero exit lets schedulers alert on drift found by --dry-run
+    sys.exit(1 if drifted and args.dry_run else 0)
@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 """
-Local development script for PokerBot
-Runs the bot in polling mode instead of webhook mode
+Polling runner for PokerBot
+Runs the bot with long polling instead of a webhook, for local development
+or as a production deployment without a public HTTPS endpoint
 """
 
 import os
 import logging
 from dotenv import load_dotenv
-from bot import bot, init_db
 
 # Load environment variables
 load_dotenv()
@@ -21,10 +21,19 @@ logger = logging.getLogger(__name__)
 
 def main():
     """Main function to run the bot locally"""
+    # Imported here, not at the top: spawned chart workers import this module again
+    from bot import bot, init_db, outbox_dispatcher, live_scoreboard, get_db_connection, ingress_control
+    from migrations import schedule_partition_maintenance
+    from poller import PollingRunner
+    from prefilter import UpdateFilter
+
     try:
         # Initialize database
         logger.info("Initializing database...")
         init_db()
+        schedule_partition_maintenance()
+        outbox_dispatcher.start()
+        live_scoreboard.start()
         logger.info("Database initialized successfully")
         
         # Remove any existing webhook
@@ -33,10 +42,13 @@ def main():
         
         # Start polling
         logger.info("Starting bot in polling mode...")
+        runner = PollingRunner(bot, get_db_connection, update_filter=UpdateFilter(bot))
+        # Load shedding watches the runner's queues instead of telebot's thread pool
+        ingress_control.queue_depth = runner.backlog
         logger.info("Bot is ready! Send /start to begin.")
         
-        # Start polling (this will block until interrupted)
-        bot.polling(none_stop=True, interval=0)
+        # Blocks until SIGINT/SIGTERM, then drains the queued updates
+        runner.run()
         
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Live scoreboard for PokerBot
+Keeps one message per chat showing the state of a game and edits it in place,
+coalescing bursts of buy-ins, rebuys and cashouts into a single edit per game
+"""
+
+import os
+import time
+import logging
+import threading
+from telebot.apihelper import ApiTelegramException
+
+logger = logging.getLogger(__name__)
+
+SCOREBOARD_DEBOUNCE_SECONDS = float(os.getenv("SCOREBOARD_DEBOUNCE_SECONDS", "3"))
+SCOREBOARD_EVENTS = 5
+
+
+class Scoreboard:
+    """Scoreboard messages of live games, refreshed by one background thread.
+
+    `render(game_id, events)` returns the message text, `recipients(game_id)`
+    the chats that should see it. touch() only marks a game as changed; the
+    first change opens a debounce window and everything arriving before it
+    closes is shown by the same edit.
+    """
+
+    def __init__(self, bot, render, recipients, debounce=SCOREBOARD_DEBOUNCE_SECONDS):
+        self.bot = bot
+        self.render = render
+        self.recipients = recipients
+        self.debounce = debounce
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.messages = {}  # game_id -> {chat_id: message_id}
+        self.pinned = {}  # game_id -> chat_ids where the scoreboard is pinned
+        self.due = {}  # game_id -> monotonic time of the next edit
+        self.events = {}  # game_id -> latest actions, newest last
+        self.closed = set()  # ended games; game ids are never reused
+        self.worker = None
+
+    def start(self):
+        """Start refreshing; only the processes serving updates do, not the maintenance CLIs"""
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._refresh_loop, name="scoreboard", daemon=True)
+            self.worker.start()
+
+    def touch(self, game_id, event=None):
+        """Record an action in a game; its scoreboards are edited once the debounce window closes"""
+        with self.lock:
+            if game_id in self.closed:
+                return
+            if event:
+                events = self.events.setdefault(game_id, [])
+                events.append(event)
+                del events[:-SCOREBOARD_EVENTS]
+            if game_id not in self.due:
+                self.due[game_id] = time.monotonic() + self.debounce
+                self.changed.notify()
+
+    def close(self, game_id):
+        """Show the final state of an ended game right away, unpin it and stop tracking it"""
+        with self.lock:
+            self.closed.add(game_id)
+            self.due.pop(game_id, None)
+            events = self.events.pop(game_id, [])
+            messages = self.messages.pop(game_id, {})
+            pinned = self.pinned.pop(game_id, set())
+        if not messages:
+            return
+        text = self.render(game_id, events)
+        for chat_id, message_id in messages.items():
+            self._edit(chat_id, message_id, text)
+            if chat_id in pinned:
+                try:
+                    self.bot.unpin_chat_message(chat_id, message_id)
+                except Exception as e:
+                    logger.warning(f"Could not unpin scoreboard of game #{game_id} in chat {chat_id}: {e}")
+
+    def _refresh_loop(self):
+        while True:
+            with self.lock:
+                while not self.due:
+                    self.changed.wait()
+                game_id, due = min(self.due.items(), key=lambda item: item[1])
+                delay = due - time.monotonic()
+                if delay > 0:
+                    # A touch() with an earlier deadline wakes us up early
+                    self.changed.wait(delay)
+                    continue
+                del self.due[game_id]
+                events = list(self.events.get(game_id, []))
+            try:
+                self._refresh(game_id, events)
+            except Exception as e:
+                logger.error(f"Error refreshing scoreboard of game #{game_id}: {e}")
+
+    def _refresh(self, game_id, events):
+        text = self.render(game_id, events)
+        if text is None:
+            return
+        with self.lock:
+            messages = dict(self.messages.get(game_id, {}))
+        for chat_id in self.recipients(game_id):
+            message_id = messages.get(chat_id)
+            if message_id is not None and self._edit(chat_id, message_id, text):
+                continue
+            self._post(game_id, chat_id, text)
+        logger.info(f"Scoreboard of game #{game_id} refreshed")
+
+    def _edit(self, chat_id, message_id, text):
+        """Edit a scoreboard message; False when it is gone and a new one should be sent"""
+        try:
+            self.bot.edit_message_text(text, chat_id, message_id)
+            return True
+        except ApiTelegramException as e:
+            if "message is not modified" in e.description:
+                return True
+            logger.warning(f"Scoreboard message {message_id} in chat {chat_id} not editable: {e.description}")
+            return False
+        except Exception as e:
+            # Network trouble: keep the message and try again on the next change
+            logger.error(f"Failed to edit scoreboard message {message_id} in chat {chat_id}: {e}")
+            return True
+
+    def _post(self, game_id, chat_id, text):
+        try:
+            sent = self.bot.send_message(chat_id, text, disable_notification=True)
+        except Exception as e:
+            logger.error(f"Failed to send scoreboard of game #{game_id} to chat {chat_id}: {e}")
+            return
+        with self.lock:
+            if game_id in self.closed:
+                # The game ended while the message was on its way
+                return
+            self.messages.setdefault(game_id, {})[chat_id] = sent.message_id
+        if chat_id < 0:
+            # Groups get a pinned scoreboard
+            try:
+                self.bot.pin_chat_message(chat_id, sent.message_id, disable_notification=True)
+                with self.lock:
+                    self.pinned.setdefault(game_id, set()).add(chat_id)
+            except Exception as e:
+                logger.warning(f"Could not pin scoreboard of game #{game_id} in chat {chat_id}: {e}")
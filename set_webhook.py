@@ -1,6 +1,8 @@
 #set_webhook.py
 import requests
 import os
+import json
+from prefilter import ALLOWED_UPDATES
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -8,5 +10,7 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 RAILWAY_URL = os.getenv("WEBHOOK_URL")
 WEBHOOK_SECRET_PATH = os.getenv("WEBHOOK_SECRET_PATH", "supersecret")
 
-url = f"https://api.telegram.org/bot{TOKEN}/setWebhook?url={RAILWAY_URL}/{WEBHOOK_SECRET_PATH}"
-print(requests.get(url).json())
\ No newline at end of file
+# Telegram only sends the update types the bot handles
+url = f"https://api.telegram.org/bot{TOKEN}/setWebhook"
+params = {"url": f"{RAILWAY_URL}/{WEBHOOK_SECRET_PATH}", "allowed_updates": json.dumps(ALLOWED_UPDATES)}
+print(requests.get(url, params=params).json())
\ No newline at end of file
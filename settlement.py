@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Settlement engine for PokerBot
+Turns the net results of an ended game into a short who-pays-whom plan and
+caches it per game in game_settlements, keyed by player id and tagged with
+the state of the game's transactions it was computed from
+"""
+
+import json
+import heapq
+from decimal import Decimal
+
+
+def to_tenths(amount):
+    """NUMERIC(10,1) amount -> integer tenths, so rounding never drifts"""
+    return int((Decimal(str(amount)) * 10).to_integral_value())
+
+
+def from_tenths(tenths):
+    return (Decimal(tenths) / 10).quantize(Decimal("0.1"))
+
+
+def _shrink(amounts, excess):
+    """Reduce positive integer `amounts` by `excess` in total, proportionally.
+
+    Uses the largest remainder method so the result stays in whole tenths.
+    """
+    total = sum(amounts)
+    cuts = []
+    remainders = []
+    for i, amount in enumerate(amounts):
+        cut, remainder = divmod(amount * excess, total)
+        cuts.append(cut)
+        remainders.append((-remainder, i))
+    for _, i in sorted(remainders)[:excess - sum(cuts)]:
+        cuts[i] += 1
+    return [amount - cut for amount, cut in zip(amounts, cuts)]
+
+
+def settle(balances):
+    """Plan transfers for [(player_id, net)] results of one game.
+
+    Returns ([(payer, payee, amount)], imbalance). When cashouts and buy-ins do
+    not add up, the larger side is scaled down by the imbalance first. Equal
+    debts and credits are paired directly; the rest is matched greedily
+    largest-to-largest with heaps, giving at most n - 1 transfers in O(n log n).
+    """
+    creditors = [(name, to_tenths(net)) for name, net in balances if to_tenths(net) > 0]
+    debtors = [(name, -to_tenths(net)) for name, net in balances if to_tenths(net) < 0]
+    imbalance = sum(amount for _, amount in creditors) - sum(amount for _, amount in debtors)
+
+    if imbalance > 0 and debtors:
+        creditors = list(zip([name for name, _ in creditors], _shrink([a for _, a in creditors], imbalance)))
+    elif imbalance < 0 and creditors:
+        debtors = list(zip([name for name, _ in debtors], _shrink([a for _, a in debtors], -imbalance)))
+    elif not debtors or not creditors:
+        # Nobody to pay or nobody to be paid
+        return [], from_tenths(imbalance)
+
+    transfers = []
+
+    # Exact matches settle two players with one transfer
+    waiting = {}
+    for name, amount in debtors:
+        waiting.setdefault(amount, []).append(name)
+    unmatched_creditors = []
+    for name, amount in creditors:
+        if waiting.get(amount):
+            transfers.append((waiting[amount].pop(), name, amount))
+        else:
+            unmatched_creditors.append((name, amount))
+
+    debt_heap = [(-amount, name) for amount, names in waiting.items() for name in names if amount > 0]
+    credit_heap = [(-amount, name) for name, amount in unmatched_creditors if amount > 0]
+    heapq.heapify(debt_heap)
+    heapq.heapify(credit_heap)
+    while debt_heap and credit_heap:
+        debt, payer = heapq.heappop(debt_heap)
+        credit, payee = heapq.heappop(credit_heap)
+        amount = min(-debt, -credit)
+        transfers.append((payer, payee, amount))
+        if -debt > amount:
+            heapq.heappush(debt_heap, (debt + amount, payer))
+        if -credit > amount:
+            heapq.heappush(credit_heap, (credit + amount, payee))
+
+    return [(payer, payee, from_tenths(amount)) for payer, payee, amount in transfers], from_tenths(imbalance)
+
+
+def load_plan(cursor, game_id, watermark):
+    """Cached (transfers, imbalance) of a game, or None when missing or computed from other transactions"""
+    cursor.execute("SELECT transfers, imbalance, watermark FROM game_settlements WHERE game_id = %s", (game_id,))
+    row = cursor.fetchone()
+    if not row or row[2] != watermark:
+        return None
+    transfers = [(payer, payee, Decimal(amount)) for payer, payee, amount in row[0]]
+    return transfers, row[1]
+
+
+def save_plan(cursor, game_id, watermark, transfers, imbalance):
+    cursor.execute("""
+        INSERT INTO game_settlements (game_id, transfers, imbalance, watermark) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (game_id) DO UPDATE
+        SET transfers = EXCLUDED.transfers, imbalance = EXCLUDED.imbalance,
+            watermark = EXCLUDED.watermark, created_at = CURRENT_TIMESTAMP
+    """, (game_id, json.dumps([(payer, payee, str(amount)) for payer, payee, amount in transfers]),
+          imbalance, watermark))
+
+
+def format_plan(transfers, imbalance, names):
+    """Settlement section of the results message; `names` maps player ids to display names"""
+    if not transfers:
+        text = "\n\n🤝 Settlement: nobody owes anything."
+    else:
+        text = "\n\n🤝 Settlement:\n" + "\n".join(
+            f"  {names.get(payer, payer)} → {names.get(payee, payee)}: {amount:.1f}"
+            for payer, payee, amount in transfers)
+    if imbalance:
+        side = "winnings" if imbalance > 0 else "losses"
+        text += f"\n  ⚠️ Unbalanced by {abs(imbalance):.1f}; {side} were scaled down proportionally."
+    return text
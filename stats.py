@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Player performance statistics for PokerBot
+Loads every player's net result per ended game once into NumPy arrays and
+computes streaks, spread, percentiles, drawdown, ROI and head-to-head tables
+for all players at the same time
+"""
+
+import threading
+import numpy as np
+
+# One row per player and ended game, grouped by player and in game order. A game's
+# transactions start at games.date - 1 day, like in the per-game queries; the
+# constant bound from the oldest ended game lets the executor skip older partitions
+RESULTS_SQL = """
+    SELECT t.player_id, t.game_id,
+           SUM(t.amount) AS net,
+           SUM(CASE WHEN t.type IN ('buyin', 'rebuy') THEN -t.amount ELSE 0 END) AS invested
+    FROM transactions t
+    JOIN games g ON g.id = t.game_id
+    WHERE g.is_active = FALSE
+      AND t.created_at >= g.date - INTERVAL '1 day'
+      AND t.created_at >= (SELECT MIN(date) - INTERVAL '1 day' FROM games WHERE is_active = FALSE)
+    GROUP BY t.player_id, t.game_id
+    ORDER BY t.player_id, t.game_id
+"""
+
+# Changes whenever a game ends (or an ended game is deleted)
+WATERMARK_SQL = "SELECT COUNT(*), MAX(id) FROM games WHERE is_active = FALSE"
+
+PERCENTILES = (10, 50, 90)
+HEAD_TO_HEAD_CHUNK = 64
+
+
+class PerformanceStats:
+    """Per-player statistics as arrays aligned with `player_ids`"""
+
+    def __init__(self, player_idx, game_ids, net, invested, player_ids, names):
+        self.player_ids = player_ids
+        self.names = names
+        self.index = {player_id: i for i, player_id in enumerate(player_ids)}
+        self.watermark = None
+        self.player_idx = player_idx
+        self.net = net
+        # Ended games numbered 1..N in id order, the common x axis of all players
+        self.game_numbers = np.unique(game_ids, return_inverse=True)[1].reshape(-1) + 1
+        n = len(player_ids)
+
+        self.games = np.bincount(player_idx, minlength=n)
+        self.total = np.bincount(player_idx, weights=net, minlength=n)
+        self.invested = np.bincount(player_idx, weights=invested, minlength=n)
+        self.wins = np.bincount(player_idx, weights=net > 0, minlength=n).astype(int)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = self.total / self.games
+            squares = np.bincount(player_idx, weights=net * net, minlength=n)
+            variance = (squares - self.games * self.mean ** 2) / (self.games - 1)
+            self.std = np.where(self.games > 1, np.sqrt(np.maximum(variance, 0)), 0.0)
+            self.roi = np.where(self.invested > 0, self.total / self.invested * 100, 0.0)
+            self.win_rate = self.wins / self.games * 100
+
+        # Rows are grouped by player, so each player owns one contiguous slice
+        starts = np.concatenate(([0], np.cumsum(self.games)[:-1]))
+        self.percentiles = self._percentiles(player_idx, net, starts)
+        self.max_drawdown = self._max_drawdown(player_idx, net, starts)
+        self.longest_win, self.longest_loss, self.current_streak = self._streaks(player_idx, net)
+        self.shared_games, self.ahead, self.head_to_head = self._head_to_head(player_idx, game_ids, net)
+
+    def _percentiles(self, player_idx, net, starts):
+        """Linear-interpolated percentiles of each player's results, shape (players, len(PERCENTILES))"""
+        ordered = net[np.lexsort((net, player_idx))]
+        counts = np.maximum(self.games, 1)
+        result = np.zeros((len(self.player_ids), len(PERCENTILES)))
+        if not len(ordered):
+            return result
+        for column, q in enumerate(PERCENTILES):
+            position = (counts - 1) * q / 100
+            lower = np.floor(position).astype(int)
+            upper = np.minimum(lower + 1, counts - 1)
+            fraction = position - lower
+            low_values = ordered[np.minimum(starts + lower, len(ordered) - 1)]
+            high_values = ordered[np.minimum(starts + upper, len(ordered) - 1)]
+            result[:, column] = np.where(self.games > 0, low_values + (high_values - low_values) * fraction, 0.0)
+        return result
+
+    def _max_drawdown(self, player_idx, net, starts):
+        """Largest fall of each player's running balance from its previous peak"""
+        if not len(net):
+            return np.zeros(len(self.player_ids))
+        played = self.games > 0
+        balance = np.cumsum(net)
+        # Restart the running balance at every player's first game
+        first = starts[played]
+        balance -= np.repeat(balance[first] - net[first], self.games[played])
+        # Lift each player above everyone before them so one accumulate gives per-player peaks
+        span = balance.max() - balance.min() + 1
+        lifted = balance + player_idx * span
+        peaks = np.maximum.accumulate(lifted) - player_idx * span
+        drawdown = np.maximum(peaks, 0) - balance
+        result = np.zeros(len(self.player_ids))
+        result[played] = np.maximum.reduceat(drawdown, first)
+        return result
+
+    def _streaks(self, player_idx, net):
+        """Longest winning and losing streaks, and the current streak (+wins / -losses)"""
+        n = len(self.player_ids)
+        longest_win = np.zeros(n, dtype=int)
+        longest_loss = np.zeros(n, dtype=int)
+        current = np.zeros(n, dtype=int)
+        if not len(net):
+            return longest_win, longest_loss, current
+        won = net > 0
+        # A run ends where the player or the outcome changes
+        breaks = np.flatnonzero((np.diff(player_idx) != 0) | (np.diff(won) != 0)) + 1
+        run_starts = np.concatenate(([0], breaks))
+        run_lengths = np.diff(np.concatenate((run_starts, [len(net)])))
+        run_players = player_idx[run_starts]
+        run_won = won[run_starts]
+        np.maximum.at(longest_win, run_players[run_won], run_lengths[run_won])
+        np.maximum.at(longest_loss, run_players[~run_won], run_lengths[~run_won])
+        # Runs are in order, so the last write per player is their latest run
+        current[run_players] = np.where(run_won, run_lengths, -run_lengths)
+        return longest_win, longest_loss, current
+
+    def _head_to_head(self, player_idx, game_ids, net):
+        """Games shared, games finished ahead and summed result difference for every pair"""
+        n = len(self.player_ids)
+        games, game_idx = np.unique(game_ids, return_inverse=True)
+        present = np.zeros((len(games), n))
+        results = np.zeros((len(games), n))
+        present[game_idx, player_idx] = 1
+        results[game_idx, player_idx] = net
+
+        shared = (present.T @ present).astype(int)
+        difference = results.T @ present - present.T @ results
+        ahead = np.zeros((n, n), dtype=int)
+        # Chunked so the (games, players, players) comparison stays small
+        for start in range(0, len(games), HEAD_TO_HEAD_CHUNK):
+            chunk = slice(start, start + HEAD_TO_HEAD_CHUNK)
+            both = present[chunk, :, None] * present[chunk, None, :]
+            better = results[chunk, :, None] > results[chunk, None, :]
+            ahead += (both * better).sum(axis=0).astype(int)
+        np.fill_diagonal(shared, 0)
+        return shared, ahead, difference
+
+    def cumulative(self, i):
+        """(game numbers, running balance) of the player at index `i`"""
+        mine = self.player_idx == i
+        return self.game_numbers[mine].tolist(), np.cumsum(self.net[mine]).tolist()
+
+    def rivals(self, player_id, limit=5):
+        """(name, shared games, games ahead, result difference) against the most frequent opponents"""
+        i = self.index[player_id]
+        order = np.argsort(-self.shared_games[i], kind="stable")[:limit]
+        return [(self.names[j], int(self.shared_games[i, j]), int(self.ahead[i, j]), float(self.head_to_head[i, j]))
+                for j in order if self.shared_games[i, j] > 0]
+
+
+def load_stats(cursor):
+    """Load the results of all ended games in columnar form and compute the statistics"""
+    cursor.execute(RESULTS_SQL)
+    rows = cursor.fetchall()
+    cursor.execute("SELECT id, name FROM players ORDER BY id")
+    players = cursor.fetchall()
+
+    player_ids = [player_id for player_id, _ in players]
+    names = [name for _, name in players]
+    if rows:
+        data = np.array(rows, dtype=float)
+        index = {player_id: i for i, player_id in enumerate(player_ids)}
+        player_idx = np.array([index[int(player_id)] for player_id in data[:, 0]], dtype=int)
+        game_ids, net, invested = data[:, 1].astype(int), data[:, 2], data[:, 3]
+    else:
+        player_idx = np.zeros(0, dtype=int)
+        game_ids = np.zeros(0, dtype=int)
+        net = invested = np.zeros(0)
+    return PerformanceStats(player_idx, game_ids, net, invested, player_ids, names)
+
+
+class StatsCache:
+    """Keeps the last computed statistics until another game ends"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.watermark = None
+        self.stats = None
+
+    def get(self, cursor):
+        cursor.execute(WATERMARK_SQL)
+        watermark = cursor.fetchone()
+        with self.lock:
+            if self.stats is not None and watermark == self.watermark:
+                return self.stats
+            # Computed under the lock so concurrent callers share one load
+            self.stats = load_stats(cursor)
+            self.stats.watermark = self.watermark = watermark
+            return self.stats
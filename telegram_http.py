@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Outbound HTTP layer for Bot API calls
+One shared keep-alive session sized to the number of threads that call the
+Bot API, explicit connect/read timeouts and per-method latency and
+connection reuse counters
+"""
+
+import os
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from telebot import apihelper
+
+logger = logging.getLogger(__name__)
+
+BOT_HTTP_CONNECT_TIMEOUT = float(os.getenv("BOT_HTTP_CONNECT_TIMEOUT", "5"))
+BOT_HTTP_READ_TIMEOUT = float(os.getenv("BOT_HTTP_READ_TIMEOUT", "30"))
+BOT_HTTP_CONNECT_RETRIES = int(os.getenv("BOT_HTTP_CONNECT_RETRIES", "2"))
+
+# Set by the pools below whenever a request has to open a new connection
+_connections = threading.local()
+
+
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _connections.opened = True
+        return super()._new_conn()
+
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _connections.opened = True
+        return super()._new_conn()
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools report when a request could not reuse a connection"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool,
+        }
+
+
+class EndpointStats:
+    """Calls, errors, new connections and latency per Bot API method"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}  # method -> [calls, errors, new connections, total seconds, max seconds]
+
+    def record(self, method, seconds, opened, failed):
+        with self.lock:
+            entry = self.endpoints.setdefault(method, [0, 0, 0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += failed
+            entry[2] += opened
+            entry[3] += seconds
+            entry[4] = max(entry[4], seconds)
+
+    def snapshot(self):
+        """(method, calls, errors, reuse %, average ms, max ms), busiest first"""
+        with self.lock:
+            rows = [(method, calls, errors, (calls - opened) / calls * 100, total / calls * 1000, longest * 1000)
+                    for method, (calls, errors, opened, total, longest) in self.endpoints.items()]
+        return sorted(rows, key=lambda row: -row[1])
+
+
+class BotApiSession:
+    """Request sender for telebot's CUSTOM_REQUEST_SENDER hook"""
+
+    def __init__(self, pool_size, connect_retries=BOT_HTTP_CONNECT_RETRIES):
+        self.pool_size = pool_size
+        self.stats = EndpointStats()
+        self.session = requests.Session()
+        # Only failures to connect are retried: the request never reached Telegram
+        adapter = KeepAliveAdapter(pool_connections=2, pool_maxsize=pool_size, pool_block=True,
+                                   max_retries=Retry(total=None, connect=connect_retries, read=0, status=0,
+                                                     other=0, backoff_factor=0.3))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        # The URL ends in the Bot API method; everything before it holds the token
+        endpoint = url.rsplit("/", 1)[-1]
+        _connections.opened = False
+        started = time.monotonic()
+        failed = True
+        try:
+            response = self.session.request(method, url, params=params, files=files, timeout=timeout, proxies=proxies)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self.stats.record(endpoint, time.monotonic() - started, _connections.opened, failed)
+
+
+def install(pool_size, connect_timeout=BOT_HTTP_CONNECT_TIMEOUT, read_timeout=BOT_HTTP_READ_TIMEOUT):
+    """Route every telebot request through one shared keep-alive session; returns it"""
+    sender = BotApiSession(pool_size)
+    apihelper.CONNECT_TIMEOUT = connect_timeout
+    apihelper.READ_TIMEOUT = read_timeout
+    apihelper.CUSTOM_REQUEST_SENDER = sender.request
+    logger.info(f"Bot API session: {pool_size} keep-alive connection(s), "
+                f"timeouts {connect_timeout}s connect / {read_timeout}s read")
+    return sender
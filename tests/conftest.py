@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# bot.py builds a TeleBot at import time; no request is made with this token
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:test")
@@ -0,0 +1,14 @@
+import os
+
+import charts
+
+
+def test_cache_dir_does_not_depend_on_the_working_directory():
+    assert os.path.isabs(charts.CHART_CACHE_DIR)
+    if "CHART_CACHE_DIR" not in os.environ:
+        assert charts.CHART_CACHE_DIR == os.path.join(os.path.dirname(os.path.abspath(charts.__file__)), "charts")
+
+
+def test_chart_paths_are_keyed_by_watermark():
+    cache = charts.ChartCache(directory="/tmp/charts")
+    assert cache.path("player_7", (12, 340)) == "/tmp/charts/player_7_12_340.png"
@@ -0,0 +1,32 @@
+import digest
+
+
+def test_pack_groups_consecutive_texts_up_to_the_limit():
+    texts = ["a" * 10, "b" * 10, "c" * 10]
+    # 10 + 2 + 10 fits, a third text does not
+    assert digest.pack(texts, max_length=25) == [[0, 1], [2]]
+
+
+def test_pack_gives_an_oversized_text_its_own_digest():
+    assert digest.pack(["short", "x" * 50, "tail"], max_length=20) == [[0], [1], [2]]
+
+
+def test_join_uses_blank_lines():
+    assert digest.join(["a", "b"]) == "a\n\nb"
+
+
+def test_split_keeps_short_text_whole():
+    assert digest.split("hello", max_length=10) == ["hello"]
+    assert digest.split("", max_length=10) == [""]
+
+
+def test_split_cuts_at_line_breaks():
+    text = "line one\nline two\nline three"
+    parts = digest.split(text, max_length=18)
+    assert parts == ["line one\nline two", "line three"]
+    assert all(len(part) <= 18 for part in parts)
+
+
+def test_split_hard_cuts_a_line_longer_than_the_limit():
+    parts = digest.split("x" * 25, max_length=10)
+    assert parts == ["x" * 10, "x" * 10, "x" * 5]
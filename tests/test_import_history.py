@@ -0,0 +1,49 @@
+import import_history
+
+HEADER = "game_ref,game_date,player_name,type,amount,telegram_id\n"
+
+
+def write(tmp_path, *lines):
+    path = tmp_path / "games.csv"
+    path.write_text(HEADER + "".join(line + "\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def test_valid_rows_may_carry_whitespace(tmp_path):
+    path = write(tmp_path, "g1, 2024-01-05 20:00 , Ann , buyin , 20.5 , 42")
+    assert import_history.validate_csv(path)[1:] == (1, [])
+
+
+def test_rejects_amounts_the_database_cannot_store(tmp_path):
+    path = write(tmp_path,
+                 "g1,2024-01-05,Ann,buyin,Infinity,",
+                 "g1,2024-01-05,Ann,buyin,NaN,",
+                 "g1,2024-01-05,Ann,buyin,1000000000,",
+                 "g1,2024-01-05,Ann,buyin,999999999.95,",
+                 "g1,2024-01-05,Ann,buyin,-5,",
+                 "g1,2024-01-05,Ann,buyin,999999999.9,",
+                 "g1,2024-01-05,Ann,buyin,20,99999999999999999999")
+    _, rows, errors = import_history.validate_csv(path)
+    assert rows == 7
+    assert [error.split(":")[0] for error in errors] == ["line 2", "line 3", "line 4", "line 5", "line 6", "line 8"]
+    assert "bad amount 'Infinity'" in errors[0]
+    assert "at most 999999999.9" in errors[2]
+    assert "bad telegram_id" in errors[5]
+
+
+class Cursor:
+    def execute(self, sql, args=None):
+        pass
+
+    def copy_expert(self, sql, f):
+        self.copy_sql = sql
+        self.copied = f.read()
+
+
+def test_staging_loads_the_stripped_rows(tmp_path):
+    path = write(tmp_path, "g1, 2024-01-05 , Ann , buyin , 20.5 ,")
+    header, _, _ = import_history.validate_csv(path)
+    cursor = Cursor()
+    import_history.load_staging(cursor, path, header)
+    assert "HEADER" not in cursor.copy_sql
+    assert cursor.copied == "g1,2024-01-05,Ann,buyin,20.5,\r\n"
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+from telebot.handler_backends import CancelUpdate
+
+import ingress
+
+
+def message(text, user_id=5):
+    return SimpleNamespace(text=text, from_user=SimpleNamespace(id=user_id))
+
+
+def call(data, user_id=5):
+    return SimpleNamespace(id="c1", data=data, from_user=SimpleNamespace(id=user_id))
+
+
+def test_classify():
+    assert ingress.classify('message', message("/cashout")) == (ingress.LEDGER, 'cashout')
+    assert ingress.classify('message', message("/stats@PokerBot 2024")) == (ingress.EXPENSIVE, 'stats')
+    assert ingress.classify('message', message("/help")) == (ingress.NORMAL, 'help')
+    assert ingress.classify('message', message("20")) == (ingress.NORMAL, None)
+    assert ingress.classify('callback_query', call("report_overall")) == (ingress.EXPENSIVE, 'report')
+    assert ingress.classify('callback_query', call("rebuy_3_7")) == (ingress.LEDGER, 'rebuy')
+    assert ingress.classify('callback_query', call("pk:rm:1:n:2:")) == (ingress.NORMAL, 'callback')
+    assert ingress.classify('inline_query', SimpleNamespace()) == (ingress.NORMAL, 'inline')
+
+
+def test_rate_limiter_allows_a_burst_then_refuses():
+    limiter = ingress.RateLimiter(rate=0, capacity=2)
+    assert [limiter.allow('u') for _ in range(3)] == [True, True, False]
+    assert limiter.allow('other')
+
+
+def test_rate_limiter_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ingress.time, 'monotonic', lambda: now[0])
+    limiter = ingress.RateLimiter(rate=1, capacity=1)
+    assert limiter.allow('u')
+    assert not limiter.allow('u')
+    now[0] += 1
+    assert limiter.allow('u')
+
+
+def test_rate_limiter_prunes_refilled_buckets(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(ingress.time, 'monotonic', lambda: now[0])
+    limiter = ingress.RateLimiter(rate=1, capacity=1, max_buckets=2)
+    limiter.allow('a')
+    limiter.allow('b')
+    now[0] += 5
+    limiter.allow('c')
+    assert set(limiter.buckets) == {'c'}
+
+
+def make_control(queue_depth=0, latency=0.0, admins=()):
+    gauge = ingress.LatencyGauge()
+    gauge.value = latency
+    bot = SimpleNamespace(replies=[], answers=[])
+    bot.reply_to = lambda update, text: bot.replies.append(text)
+    bot.answer_callback_query = lambda call_id, text: bot.answers.append(text)
+    return ingress.IngressControl(bot, admins, lambda: queue_depth, gauge)
+
+
+def test_verdict_sheds_expensive_then_normal_but_never_ledger():
+    busy = make_control(queue_depth=ingress.INGRESS_QUEUE_HIGH)
+    assert busy.verdict('message', message("/stats")) == (ingress.EXPENSIVE, 'shed')
+    assert busy.verdict('message', message("/help")) == (ingress.NORMAL, None)
+    overloaded = make_control(latency=2 * ingress.INGRESS_DB_LATENCY_MS / 1000)
+    assert overloaded.verdict('message', message("/help")) == (ingress.NORMAL, 'shed')
+    assert overloaded.verdict('message', message("/cashout")) == (ingress.LEDGER, None)
+    assert overloaded.verdict('message', message("35")) == (ingress.NORMAL, None)
+
+
+def test_verdict_limits_users_but_not_admins():
+    control = make_control(admins=[1])
+    control.users = ingress.RateLimiter(rate=0, capacity=1)
+    control.expensive = ingress.RateLimiter(rate=0, capacity=1)
+    assert control.verdict('message', message("/help", user_id=5)) == (ingress.NORMAL, None)
+    assert control.verdict('message', message("/help", user_id=5)) == (ingress.NORMAL, 'limited')
+    assert control.verdict('message', message("/help", user_id=1)) == (ingress.NORMAL, None)
+    assert control.verdict('message', message("/help", user_id=1)) == (ingress.NORMAL, None)
+
+
+def test_expensive_commands_have_their_own_bucket():
+    control = make_control()
+    control.expensive = ingress.RateLimiter(rate=0, capacity=1)
+    assert control.verdict('message', message("/stats")) == (ingress.EXPENSIVE, None)
+    assert control.verdict('message', message("/stats")) == (ingress.EXPENSIVE, 'limited')
+    assert control.verdict('message', message("/chart")) == (ingress.EXPENSIVE, None)
+
+
+def test_rejection_cancels_the_update_and_warns_once():
+    control = make_control()
+    control.users = ingress.RateLimiter(rate=0, capacity=0)
+    assert isinstance(control.pre_process_message(message("/help"), {}), CancelUpdate)
+    assert isinstance(control.pre_process_message(message("/help"), {}), CancelUpdate)
+    assert control.bot.replies == ["⏳ Too many requests, slow down a bit."]
+    assert isinstance(control.pre_process_callback_query(call("leave"), {}), CancelUpdate)
+    assert control.bot.answers == ["⏳ Too many requests, slow down a bit."]
+    counters, _, _ = control.snapshot()
+    assert dict(counters) == {(ingress.NORMAL, 'limited'): 3}
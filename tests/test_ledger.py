@@ -0,0 +1,198 @@
+from decimal import Decimal
+
+from journal import Journal, CircuitBreaker
+from ledger import GameLedger, JOURNAL_CHECKPOINT
+
+
+class Cursor:
+    """Answers the queries of GameLedger.load() from fixed rows"""
+
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, args=None):
+        if "FROM maintenance_checkpoints" in sql:
+            self.rows = [(self.db['applied_seq'],)] if args == (JOURNAL_CHECKPOINT,) else []
+        elif "FROM games WHERE is_active" in sql:
+            self.rows = self.db['games']
+        elif "FROM game_players" in sql:
+            self.rows = self.db['players']
+        elif "FROM transactions" in sql:
+            self.rows = self.db['totals']
+        elif "FROM ledger_dead_letters" in sql:
+            self.rows = [(op,) for op in self.db['dead']]
+        else:
+            raise AssertionError(f"unexpected query: {sql}")
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class Connection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return Cursor(self.db)
+
+    def close(self):
+        pass
+
+
+def make_db(applied_seq=0, dead=()):
+    return {
+        'applied_seq': applied_seq,
+        'games': [(7, "1234", 100, -5)],
+        'players': [(7, 1, 100, "Ann")],
+        'totals': [(7, 1, Decimal("20.0"), Decimal("0.0"), Decimal("0.0"))],
+        'dead': list(dead),
+    }
+
+
+def buyin(game_id, player_id, amount, telegram_id=200, name="Bob", kind='buyin'):
+    return {'op': 'transaction', 'game_id': game_id, 'player_id': player_id, 'telegram_id': telegram_id,
+            'name': name, 'type': kind, 'amount': amount}
+
+
+def test_journal_numbers_entries_and_survives_reopening(tmp_path):
+    path = str(tmp_path / "ledger.journal")
+    journal = Journal(path)
+    assert journal.append(buyin(7, 2, 10)) == 1
+    assert journal.append(buyin(7, 2, 5, kind='rebuy')) == 2
+    assert [entry['seq'] for entry in journal.entries(1)] == [2]
+    assert Journal(path).last_seq == 2
+
+
+def test_journal_skips_a_torn_last_line(tmp_path):
+    path = tmp_path / "ledger.journal"
+    journal = Journal(str(path))
+    journal.append(buyin(7, 2, 10))
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "transaction", "seq"')
+    assert [entry['seq'] for entry in Journal(str(path)).entries()] == [1]
+
+
+def test_journal_never_reuses_an_applied_seq(tmp_path):
+    journal = Journal(str(tmp_path / "ledger.journal"))
+    journal.append(buyin(7, 2, 10))
+    journal.truncate()
+    journal.advance(5)
+    assert journal.entries() == []
+    assert journal.append(buyin(7, 2, 10)) == 6
+
+
+def test_load_replays_only_what_the_database_has_not_applied(tmp_path):
+    journal = Journal(str(tmp_path / "ledger.journal"))
+    journal.append(buyin(7, 1, 20, telegram_id=100, name="Ann"))
+    journal.append(buyin(7, 2, 10))
+    journal.append(buyin(7, 2, 5, kind='rebuy'))
+    journal.append(buyin(8, 3, 50))
+    ledger = GameLedger(lambda: Connection(make_db(applied_seq=1)), journal=journal)
+
+    ledger.load()
+
+    game = ledger.get_game(7)
+    # Seq 1 is already in the totals from the database and is not counted twice
+    assert game.players[1].buyin == Decimal("20.0")
+    assert (game.players[2].buyin, game.players[2].rebuys) == (Decimal("10.0"), Decimal("5.0"))
+    assert game.players[2].telegram_id == 200
+    # A change of a game that ended still goes to the database
+    assert ledger.get_game(8) is None
+    assert [op['seq'] for op in ledger.pending] == [2, 3, 4]
+    assert ledger.journal.append(buyin(7, 2, 1)) == 5
+
+
+def test_load_counts_parked_changes_in_memory():
+    dead = [buyin(7, 2, 10), buyin(7, 2, 5, kind='cashout')]
+    ledger = GameLedger(lambda: Connection(make_db(dead=dead)))
+
+    ledger.load()
+
+    assert ledger.parked_games() == {7: 2}
+    assert ledger.get_game(7).players[2].total == Decimal("-5.0")
+    assert not ledger.pending
+    assert not ledger.saved(7, timeout=0)
+
+
+def test_circuit_breaker_opens_and_lets_one_probe_through(monkeypatch):
+    import journal
+    now = [0.0]
+    monkeypatch.setattr(journal.time, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+    now[0] += 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_saved_waits_only_for_the_games_own_changes():
+    ledger = GameLedger(connect=None)
+    ledger.open_game(7, "1234", 100, -5)
+    ledger.open_game(8, "4321", 101, -6)
+    ledger.record(8, 2, 200, "Bob", 'buyin', 10)
+    # Game 8's write is stuck in the queue; game 7 has nothing to wait for
+    assert ledger.saved(7, timeout=0)
+    assert not ledger.saved(8, timeout=0.05)
+    ledger.pending.clear()
+    assert ledger.saved(8, timeout=0)
+
+
+class RecordingConnection:
+    """Accepts every write and logs commits"""
+
+    def __init__(self, log):
+        self.log = log
+        self.autocommit = True
+
+    def cursor(self):
+        connection = self
+
+        class WriteCursor:
+            def __init__(self):
+                self.connection = connection
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, args=None):
+                pass
+
+            def fetchone(self):
+                return None
+
+        return WriteCursor()
+
+    def commit(self):
+        self.log.append('commit')
+
+    def close(self):
+        pass
+
+
+def test_outbox_is_woken_once_notifications_commit():
+    log = []
+    ledger = GameLedger(lambda: RecordingConnection(log), notified=lambda: log.append('wake'))
+    ledger.open_game(7, "1234", 100, -5)
+    ledger.start()
+    ledger.record(7, 2, 200, "Bob", 'buyin', 10)
+    ledger.record(7, 2, 200, "Bob", 'rebuy', 5, notify=[(100, "Bob rebought")])
+    assert ledger.flush(5)
+    assert log == ['commit', 'commit', 'wake']
@@ -0,0 +1,15 @@
+import pytest
+
+import migrations
+
+
+@pytest.mark.parametrize("name", ["transactions_y2024m01", "transactions_y2031m12"])
+def test_monthly_partition_names(name):
+    assert migrations.MONTHLY_PARTITION_NAME.fullmatch(name)
+
+
+@pytest.mark.parametrize("name", ["transactions_default", "transactions_y2024m13", "players",
+                                  'transactions_y2024m01"; DROP TABLE players; --'])
+def test_detach_refuses_anything_but_a_monthly_partition(name):
+    with pytest.raises(ValueError):
+        migrations.detach_transaction_partition(name)
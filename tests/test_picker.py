@@ -0,0 +1,98 @@
+import pytest
+
+import picker
+
+
+PLAYERS = [(1, "Anna"), (2, "andrew"), (3, "Bob"), (4, "Ann"), (5, "Dan"), (6, "Brianna")]
+
+
+def test_normalize_search_fits_callback_data():
+    assert picker.normalize_search("  ann  ") == "ann"
+    assert picker.normalize_search(None) == ""
+    # Cut on a byte boundary without leaving half a character behind
+    term = picker.normalize_search("ж" * 20)
+    assert term == "ж" * (picker.SEARCH_MAX_BYTES // 2)
+    assert len(term.encode("utf-8")) <= picker.SEARCH_MAX_BYTES
+
+
+def test_page_callback_round_trip():
+    pages = []
+    flows = picker.PlayerPicker(page_size=2)
+    flows.register("rm", "Remove from game #{scope}", lambda scope, player_id: f"remove_{scope}_{player_id}",
+                   lambda *args: pages.append(args) or [])
+    data = flows._page_data("rm", 42, 'n', 7, "a:b")
+    assert flows.handles(data)
+    assert not flows.handles("remove_42_7")
+    flows.render_callback(data)
+    # A colon in the search term survives the round trip
+    assert pages[0] == (42, "a:b", 'n', 7, 3)
+
+
+def test_page_callback_data_fits_telegram_limit():
+    flows = picker.PlayerPicker()
+    search = picker.normalize_search("x" * 100)
+    data = flows._page_data("rename", 2 ** 31, 'p', 2 ** 31, search)
+    assert len(data.encode("utf-8")) <= 64
+
+
+def test_page_players_pages_by_name_then_id():
+    first = picker.page_players(PLAYERS, "", 'f', None, 3)
+    assert first == [(4, "Ann"), (1, "Anna"), (3, "Bob")]
+    assert picker.page_players(PLAYERS, "", 'n', 3, 3) == [(6, "Brianna"), (5, "Dan"), (2, "andrew")]
+    assert picker.page_players(PLAYERS, "", 'p', 6, 3) == [(3, "Bob"), (1, "Anna"), (4, "Ann")]
+    assert picker.page_players(PLAYERS, "", 'n', 99, 3) == []
+
+
+def test_render_pages_forward_and_back():
+    flows = picker.PlayerPicker(page_size=2)
+    flows.register("rm", "Remove from game #{scope}", lambda scope, player_id: f"remove_{scope}_{player_id}",
+                   lambda scope, *args: picker.page_players(PLAYERS, *args))
+    text, keyboard = flows.render("rm", 9)
+    assert text == "Remove from game #9"
+    rows = keyboard.to_dict()['inline_keyboard']
+    assert [row[0]['callback_data'] for row in rows[:2]] == ["remove_9_4", "remove_9_1"]
+    assert [button['text'] for button in rows[2]] == ["▶️"]
+
+    text, keyboard = flows.render_callback(rows[2][0]['callback_data'])
+    rows = keyboard.to_dict()['inline_keyboard']
+    assert [row[0]['text'] for row in rows[:2]] == ["Bob", "Brianna"]
+    assert [button['text'] for button in rows[2]] == ["◀️", "▶️"]
+
+    text, keyboard = flows.render_callback(rows[2][0]['callback_data'])
+    rows = keyboard.to_dict()['inline_keyboard']
+    assert [row[0]['text'] for row in rows[:2]] == ["Ann", "Anna"]
+    assert [button['text'] for button in rows[2]] == ["▶️"]
+
+
+def test_render_without_matches():
+    flows = picker.PlayerPicker()
+    flows.register("rm", "Remove", lambda scope, player_id: "", lambda *args: [])
+    assert flows.render("rm", 1, "zz") == ("❌ No players found matching zz.", None)
+
+
+class Cursor:
+    def __init__(self, players):
+        self.players = players
+
+    def execute(self, sql, params):
+        # Enough of the SQL match rules to compare with page_players
+        pattern = params['pattern'].replace("\\", "")
+        if pattern.startswith("%"):
+            self.rows = [row for row in self.players if pattern.strip("%") in row[1].lower()]
+        else:
+            self.rows = [row for row in self.players if row[1].lower().startswith(pattern.rstrip("%"))]
+        self.rows.sort(key=lambda row: (row[1], row[0]))
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.mark.parametrize("search", ["an", "AN", "b", "ann", "ria", "x"])
+def test_game_scope_matches_like_the_database(search):
+    in_memory = picker.page_players(PLAYERS, search, 'f', None, 10)
+    assert in_memory == picker.search_players(Cursor(PLAYERS), search, 'f', None, 10)
+
+
+def test_short_terms_match_prefixes_longer_ones_anywhere():
+    assert picker.page_players(PLAYERS, "an", 'f', None, 10) == [(4, "Ann"), (1, "Anna"), (2, "andrew")]
+    assert picker.page_players(PLAYERS, "ann", 'f', None, 10) == [(4, "Ann"), (1, "Anna"), (6, "Brianna")]
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import poller
+
+
+def message_update(update_id, chat_id):
+    return {'update_id': update_id,
+            'message': {'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'},
+                        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'P'}, 'text': '/help'}}
+
+
+def make_runner(workers=2):
+    bot = SimpleNamespace(processed=[])
+    bot.process_new_updates = lambda updates: bot.processed.extend(update.update_id for update in updates)
+    return poller.PollingRunner(bot, connect=None, workers=workers)
+
+
+def finish(runner, update_id):
+    with runner.lock:
+        runner.in_flight.discard(update_id)
+
+
+def test_chat_key():
+    assert poller.chat_key(message_update(1, 42)) == 42
+    assert poller.chat_key({'update_id': 2, 'callback_query': {'from': {'id': 7}, 'message': {'chat': {'id': 9}}}}) == 9
+    assert poller.chat_key({'update_id': 3, 'inline_query': {'from': {'id': 7}}}) == 7
+    assert poller.chat_key({'update_id': 4}) is None
+
+
+def test_acknowledges_only_up_to_the_oldest_unfinished_update():
+    runner = make_runner()
+    assert runner.acknowledged() is None
+    assert runner._dispatch([message_update(10, 1), message_update(11, 2), message_update(12, 1)]) == 3
+    assert runner.acknowledged() == 9
+    finish(runner, 11)
+    assert runner.acknowledged() == 9
+    finish(runner, 10)
+    assert runner.acknowledged() == 11
+    finish(runner, 12)
+    assert runner.acknowledged() == 12
+
+
+def test_redelivered_updates_are_not_dispatched_twice():
+    runner = make_runner()
+    runner._dispatch([message_update(10, 1), message_update(11, 1)])
+    assert runner._dispatch([message_update(10, 1), message_update(11, 1)]) == 0
+    assert runner._dispatch([message_update(11, 1), message_update(12, 1)]) == 1
+    assert runner.backlog() == 3
+
+
+def test_a_checkpoint_skips_updates_already_handled():
+    runner = make_runner()
+    runner.last_seen = runner.saved = 20
+    assert runner._dispatch([message_update(19, 1), message_update(21, 1)]) == 1
+    assert runner.acknowledged() == 20
+
+
+def test_one_chat_goes_to_one_worker_in_order():
+    runner = make_runner(workers=3)
+    runner._dispatch([message_update(i, 5) for i in range(1, 6)])
+    busy = [q for q in runner.queues if q.qsize()]
+    assert len(busy) == 1
+    assert [busy[0].get_nowait()['update_id'] for _ in range(5)] == [1, 2, 3, 4, 5]
+
+
+def test_worker_acknowledges_after_handling():
+    runner = make_runner(workers=1)
+    runner._dispatch([message_update(1, 5), message_update(2, 5)])
+    runner.queues[0].put(None)
+    runner._work(runner.queues[0])
+    assert runner.bot.processed == [1, 2]
+    assert runner.acknowledged() == 2
+
+
+def test_worker_acknowledges_filtered_and_failing_updates():
+    runner = make_runner(workers=1)
+    runner.update_filter = SimpleNamespace(reject=lambda update: "not_command" if update['update_id'] == 1 else None)
+
+    def fail(updates):
+        raise RuntimeError("handler bug")
+    runner.bot.process_new_updates = fail
+    runner._dispatch([message_update(1, 5), message_update(2, 5)])
+    runner.queues[0].put(None)
+    runner._work(runner.queues[0])
+    assert runner.acknowledged() == 2
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import prefilter
+
+
+def make_bot(waiting=(), username="PokerBot"):
+    return SimpleNamespace(
+        message_handlers=[{'filters': {'commands': ['start', 'join']}}, {'filters': {'func': None}}],
+        next_step_backend=SimpleNamespace(handlers={chat_id: [] for chat_id in waiting}),
+        user=SimpleNamespace(username=username))
+
+
+def message(text, chat_id=10, is_bot=False):
+    return {'update_id': 1, 'message': {'chat': {'id': chat_id}, 'from': {'id': 5, 'is_bot': is_bot}, 'text': text}}
+
+
+def test_registered_commands():
+    assert prefilter.registered_commands(make_bot()) == {'start', 'join'}
+
+
+def test_keeps_known_commands_and_callbacks():
+    update_filter = prefilter.UpdateFilter(make_bot())
+    assert update_filter.reject(message("/join 12")) is None
+    assert update_filter.reject(message("/start@pokerbot")) is None
+    assert update_filter.reject({'update_id': 2, 'callback_query': {'from': {'id': 5}, 'data': 'x'}}) is None
+
+
+def test_drops_updates_no_handler_acts_on():
+    update_filter = prefilter.UpdateFilter(make_bot())
+    assert update_filter.reject({'update_id': 3, 'edited_message': {}}) == "type:edited_message"
+    assert update_filter.reject(message("/start", is_bot=True)) == "from_bot"
+    assert update_filter.reject(message("hello")) == "not_command"
+    assert update_filter.reject(message("/start@OtherBot")) == "other_bot"
+    assert update_filter.reject(message("/nope")) == "unknown_command"
+    assert update_filter.dropped == {"type:edited_message": 1, "from_bot": 1, "not_command": 1,
+                                     "other_bot": 1, "unknown_command": 1}
+
+
+def test_keeps_replies_to_a_waiting_next_step():
+    update_filter = prefilter.UpdateFilter(make_bot(waiting=[10]))
+    assert update_filter.reject(message("20", chat_id=10)) is None
+    assert update_filter.reject(message("/20", chat_id=10)) is None
+    assert update_filter.reject(message("20", chat_id=11)) == "not_command"
+
+
+def test_keeps_every_message_when_the_next_step_backend_is_opaque():
+    bot = make_bot()
+    bot.next_step_backend = SimpleNamespace()
+    assert prefilter.UpdateFilter(bot).reject(message("hello")) is None
+
+
+def test_loads_parses_bytes():
+    assert prefilter.loads(b'{"update_id": 7}') == {'update_id': 7}
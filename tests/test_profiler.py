@@ -0,0 +1,54 @@
+import time
+import threading
+from types import SimpleNamespace
+
+from telebot import types
+
+import bot
+import profiler
+
+
+def message(text, chat_id=5):
+    return types.Message.de_json({'message_id': 1, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'},
+                                  'from': {'id': chat_id, 'is_bot': False, 'first_name': 'P'}, 'text': text})
+
+
+def registered_next_step(monkeypatch, chat_id=5):
+    """Let process_join_password register its buy-in step, as it does for a correct password"""
+    game = bot.ledger.games[99] = SimpleNamespace(players={})
+    monkeypatch.setattr(bot.bot, 'reply_to', lambda *args, **kwargs: None)
+    try:
+        bot.process_join_password(message("1234", chat_id), 99, "1234", 7, "Ann")
+    finally:
+        bot.ledger.games.pop(99, None)
+    assert not game.players
+    # Peek without taking it: get_handlers() would consume the step
+    return bot.bot.next_step_backend.handlers[chat_id][-1]['callback']
+
+
+def test_handler_code_looks_through_decorators():
+    assert profiler.handler_code(bot.end_game).co_name == 'end_game'
+
+
+def test_next_step_lambda_is_labelled_by_its_callee(monkeypatch):
+    callback = registered_next_step(monkeypatch)
+    bot.bot.next_step_backend.get_handlers(5)
+    assert callback.__code__.co_name == '<lambda>'
+    assert profiler.handler_code(callback) is bot.process_buyin.__code__
+
+
+def test_session_samples_a_next_step_reply_under_its_name(monkeypatch):
+    def process_buyin(*args):
+        # Stands in for the database work of a buy-in
+        time.sleep(0.3)
+
+    monkeypatch.setattr(bot.bot, 'threaded', False)
+    registered_next_step(monkeypatch, chat_id=6)
+    monkeypatch.setattr(bot, 'process_buyin', process_buyin)
+    session = profiler.ProfileSession(bot.bot, lambda session: None, seconds=5, updates=1, interval=0.01)
+    session.start()
+    bot.bot.process_new_updates([types.Update.de_json({'update_id': 1, 'message': message("20", 6).json})])
+    assert session.closed.wait(5)
+    assert '_exec_task' not in vars(bot.bot)
+    assert session.processed == 1
+    assert [handler for handler, _ in session.by_handler()] == ['process_buyin']
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import bot
+import jobs
+
+
+def test_fit_page_retries_with_fewer_rows_until_the_page_fits(monkeypatch):
+    monkeypatch.setattr(bot, 'REPORT_PAGE_ROWS', 30)
+    calls = []
+
+    def build_page(direction, anchor_id, page_rows):
+        calls.append(page_rows)
+        return "x" * (200 * page_rows), f"keyboard for {page_rows}"
+
+    text, keyboard = bot.fit_page(build_page, 'next', 7)
+    assert len(text) <= bot.TELEGRAM_MESSAGE_LIMIT
+    assert keyboard == f"keyboard for {calls[-1]}"
+    assert calls[0] == 30 and calls[-1] == 20
+    assert calls == sorted(calls, reverse=True)
+
+
+def test_fit_page_builds_once_when_the_page_fits():
+    calls = []
+    bot.fit_page(lambda *args: calls.append(args) or ("short", None))
+    assert calls == [('first', None, bot.REPORT_PAGE_ROWS)]
+
+
+def test_scoreboard_drops_the_oldest_actions_first(monkeypatch):
+    monkeypatch.setattr(bot, 'format_game_results', lambda game_id: "r" * 4050)
+    board = bot.render_scoreboard(1, ["old " * 10, "new"])
+    assert board.endswith("🕒 Latest:\nnew")
+    assert len(board) <= bot.TELEGRAM_MESSAGE_LIMIT
+
+
+def test_scoreboard_says_when_the_results_were_cut(monkeypatch):
+    monkeypatch.setattr(bot, 'format_game_results', lambda game_id: "\n".join(["row " * 10] * 200))
+    board = bot.render_scoreboard(1, ["new"])
+    assert len(board) <= bot.TELEGRAM_MESSAGE_LIMIT
+    assert board.endswith("… cut to fit, /game_results shows it all")
+
+
+def test_report_jobs_continue_long_text_in_follow_up_messages():
+    sent = []
+    fake_bot = SimpleNamespace(
+        edit_message_text=lambda text, chat_id, message_id, reply_markup=None: sent.append(('edit', text)),
+        send_message=lambda chat_id, text: sent.append(('send', text)))
+    report_jobs = jobs.ReportJobs(fake_bot, max_workers=1, max_length=10)
+    report_jobs._schedule('k', lambda: "line one\nline two\nline three",
+                          SimpleNamespace(chat=SimpleNamespace(id=1), message_id=2))
+    report_jobs.executor.shutdown(wait=True)
+    assert sent == [('edit', "line one"), ('send', "line two"), ('send', "line three")]
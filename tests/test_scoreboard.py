@@ -0,0 +1,23 @@
+import scoreboard
+
+
+def make_board():
+    return scoreboard.Scoreboard(bot=None, render=lambda game_id, events: None, recipients=lambda game_id: [])
+
+
+def test_no_thread_until_started():
+    board = make_board()
+    board.touch(1, "event")
+    assert board.worker is None
+    board.start()
+    worker = board.worker
+    assert worker.is_alive()
+    board.start()
+    assert board.worker is worker
+
+
+def test_import_of_bot_starts_no_background_worker():
+    import bot
+    assert bot.live_scoreboard.worker is None
+    assert bot.outbox_dispatcher.worker is None
+    assert bot.ledger.writer is None
@@ -0,0 +1,86 @@
+from decimal import Decimal
+
+import settlement
+
+
+def paid(transfers):
+    """Net effect of a plan per player id"""
+    net = {}
+    for payer, payee, amount in transfers:
+        net[payer] = net.get(payer, Decimal("0")) - amount
+        net[payee] = net.get(payee, Decimal("0")) + amount
+    return net
+
+
+def test_balanced_game_settles_every_net_result():
+    balances = [(1, Decimal("35.5")), (2, Decimal("-20.0")), (3, Decimal("-15.5")), (4, 0)]
+    transfers, imbalance = settlement.settle(balances)
+    assert imbalance == 0
+    assert paid(transfers) == {1: Decimal("35.5"), 2: Decimal("-20.0"), 3: Decimal("-15.5")}
+    assert len(transfers) <= 2
+
+
+def test_equal_debt_and_credit_are_paired_directly():
+    transfers, _ = settlement.settle([(1, 10), (2, 25), (3, -25), (4, -10)])
+    assert sorted(transfers) == [(3, 2, Decimal("25.0")), (4, 1, Decimal("10.0"))]
+
+
+def test_at_most_n_minus_one_transfers():
+    balances = [(i, 7 * i) for i in range(1, 6)] + [(10 + i, -5 * i) for i in range(1, 8)]
+    balances.append((99, -(sum(b for _, b in balances))))
+    transfers, imbalance = settlement.settle(balances)
+    assert imbalance == 0
+    assert len(transfers) <= len(balances) - 1
+    assert all(amount > 0 for _, _, amount in transfers)
+
+
+def test_excess_winnings_are_scaled_down():
+    transfers, imbalance = settlement.settle([(1, 30), (2, 10), (3, -20)])
+    assert imbalance == Decimal("20.0")
+    net = paid(transfers)
+    assert net[3] == Decimal("-20.0")
+    # 30:10 keeps its proportion after the 20 cut
+    assert net == {1: Decimal("15.0"), 2: Decimal("5.0"), 3: Decimal("-20.0")}
+
+
+def test_scaling_stays_in_whole_tenths():
+    transfers, imbalance = settlement.settle([(1, 10), (2, 10), (3, 10), (4, -10)])
+    assert imbalance == Decimal("20.0")
+    assert sum(amount for _, _, amount in transfers) == Decimal("10.0")
+    assert all(amount == amount.quantize(Decimal("0.1")) for _, _, amount in transfers)
+
+
+def test_nobody_to_pay():
+    assert settlement.settle([(1, 5), (2, 0)]) == ([], Decimal("5.0"))
+    assert settlement.settle([]) == ([], Decimal("0.0"))
+
+
+def test_format_plan_uses_names_by_player_id():
+    text = settlement.format_plan([(2, 1, Decimal("12.5"))], Decimal("0.0"), {1: "Ann", 2: "Bob"})
+    assert "Bob → Ann: 12.5" in text
+    assert "Unbalanced" not in text
+
+
+def test_format_plan_reports_imbalance():
+    text = settlement.format_plan([], Decimal("-3.0"), {})
+    assert "nobody owes anything" in text
+    assert "Unbalanced by 3.0; losses were scaled down" in text
+
+
+class Cursor:
+    def __init__(self, row=None):
+        self.row = row
+        self.executed = []
+
+    def execute(self, sql, args=None):
+        self.executed.append((sql, args))
+
+    def fetchone(self):
+        return self.row
+
+
+def test_load_plan_ignores_a_plan_from_other_transactions():
+    row = ([[2, 1, "12.5"]], Decimal("0.0"), "4:17")
+    assert settlement.load_plan(Cursor(row), 5, "4:17") == ([(2, 1, Decimal("12.5"))], Decimal("0.0"))
+    assert settlement.load_plan(Cursor(row), 5, "5:18") is None
+    assert settlement.load_plan(Cursor(None), 5, "4:17") is None